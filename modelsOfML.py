@@ -4,42 +4,65 @@
 
 # %%
 # importing the Libraries
+from functools import partial
+import os
+import time
 import pandas as pd
 import numpy as np
 import seaborn as sns
 import matplotlib.pyplot as plt
-from imblearn.over_sampling import SMOTE
-from sklearn.preprocessing import MinMaxScaler
-from sklearn.decomposition import PCA
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
+from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import classification_report, confusion_matrix
-from sklearn.svm import SVC
 from sklearn.neighbors import KNeighborsClassifier
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Dense
 from tensorflow.keras.callbacks import EarlyStopping
-from sklearn.model_selection import GridSearchCV
-from keras_tuner import Hyperband
 import tensorflow as tf
 import lime
 import lime.lime_tabular
-
-# %%
-# load the predictive maintenance dataset
-Pred_main_data = pd.read_csv('archive\\ai4i2020.csv')
+from predictive_maintenance.data import load_ai4i2020
+from predictive_maintenance.outliers import remove_outliers
+from predictive_maintenance.preprocessing import StreamingScalerPCA, iter_array_chunks
+from predictive_maintenance.resampling import smote_resample, smote_neighbours, benchmark_smote
+from predictive_maintenance.streaming import SMOTEBatchGenerator
+from predictive_maintenance.stacking import fit_base_models, build_stacked_inputs, hybrid_summary
+from predictive_maintenance.heads import fit_heads_jointly, build_ann_model, throughput_callbacks
+from predictive_maintenance.serving import HybridPipeline
+from predictive_maintenance.forest import compile_forest, check_compiled_forest
+from predictive_maintenance.bundle import save_bundle, load_bundle
+from predictive_maintenance.dense import DenseNetwork, quantization_report, benchmark_dense
+from predictive_maintenance.boosting import FeatureBinner, binned_matrix, BinnedGradientBoostingClassifier, benchmark_binned_gbc
+from predictive_maintenance.tuning import SuccessiveHalvingSearchCV, KNeighborsGraphSearchCV, fit_search_shared
+from predictive_maintenance.trials import TrialStore
+from predictive_maintenance.kernel_svm import ApproxKernelSVC, benchmark_approx_svc
+from predictive_maintenance.hyperband import parallel_hyperband_search
+from predictive_maintenance.explain import explain_instances
+from predictive_maintenance.treeshap import tree_attributions, global_importance
+from predictive_maintenance.evaluation import evaluate_models
+from predictive_maintenance.benchmark import run_benchmarks
+from predictive_maintenance.tracing import enable_tracing, stage, summarize_trace
+
+# %%
+# Stage tracing is off unless PM_TRACE names a trace file. When on, every pipeline stage
+# (ingest, outlier removal, resampling, scaling/PCA, fits, predictions, tuning, explanation)
+# appends its wall/CPU time, peak memory and rows/sec to that file, and the Keras fits
+# log samples/sec and step time per epoch. PM_TRACE_FORMAT=otlp writes OTLP/JSON spans instead.
+TRACE_PATH = os.environ.get('PM_TRACE')
+if TRACE_PATH:
+    enable_tracing(TRACE_PATH, format=os.environ.get('PM_TRACE_FORMAT', 'jsonl'))
+
+# %%
+# load the predictive maintenance dataset in typed chunks; the 'UDI' and 'Product ID' columns are
+# dropped and the 'Type' column is encoded (low=0, medium=1, high=2 quality) while parsing.
+# The parsed columns are cached next to the CSV and memory-mapped on later runs.
+Pred_main_data = load_ai4i2020('archive\\ai4i2020.csv', cache_dir='archive\\ai4i2020_cache')
 Pred_main_data
 
 # %% [markdown]
 # # Initial Findings
 
 # %%
-# Remove the 'UDI' and 'Product ID' columns
-Pred_main_data = Pred_main_data.drop(columns=['UDI', 'Product ID'])
-
-# Encode the 'type' column categorical variables(low, mediam, high quality)
-Pred_main_data['Type'] = Pred_main_data['Type'].map({'L': 0, 'M': 1, 'H': 2})
-
 # statistics of the dataset
 Pred_main_data.describe()
 
@@ -81,19 +104,10 @@ for feature in numerical_features:
     plt.show()
 
 # %%
-# Define a function to remove outliers based on IQR
-def remove_outliers(df, column):
-    Q1 = df[column].quantile(0.25)
-    Q3 = df[column].quantile(0.75)
-    IQR = Q3 - Q1
-    lower_bound = Q1 - 1.5 * IQR
-    upper_bound = Q3 + 1.5 * IQR
-    df = df[(df[column] >= lower_bound) & (df[column] <= upper_bound)]
-    return df
-
-# Remove outliers from 'Rotational speed [rpm]' and 'Torque [Nm]'
-df = remove_outliers(Pred_main_data, 'Rotational speed [rpm]')
-df = remove_outliers(Pred_main_data, 'Torque [Nm]')
+# Remove outliers from 'Rotational speed [rpm]' and 'Torque [Nm]' based on IQR
+# (both bounds are computed in one pass and applied with a single combined mask;
+# use streaming_iqr_bounds for data that does not fit in memory)
+df = remove_outliers(Pred_main_data, ['Rotational speed [rpm]', 'Torque [Nm]'])
 
 # Verify the result
 print("Dataset shape after removing outliers:", df.shape)
@@ -124,12 +138,16 @@ plt.show()
 X = Pred_main_data.drop(columns=['Machine failure'])
 y = Pred_main_data['Machine failure']
 
-# Apply SMOTE
-smote = SMOTE(random_state=42)
-X_res, y_res = smote.fit_resample(X, y)
+# Apply SMOTE (neighbour index built once, queries spread over all cores)
+X_res, y_res = smote_resample(X, y, random_state=42, n_jobs=-1)
 
 # Combine the resampled features and target into a new DataFrame
-df_resampled = pd.concat([pd.DataFrame(X_res, columns=X.columns), pd.DataFrame(y_res, columns=['Machine failure'])], axis=1)
+df_resampled = pd.DataFrame(X_res, columns=X.columns)
+df_resampled['Machine failure'] = y_res
+
+# %%
+# Compare against imblearn's SMOTE on the same data
+benchmark_smote(X, y, random_state=42)
 
 # %%
 df_resampled['Machine failure'].value_counts()
@@ -141,11 +159,12 @@ df_resampled.shape
 # Select numerical columns to normalize (excluding 'Machine failure' if it's your target variable)
 numerical_cols = df_resampled.drop(columns=['Machine failure']).columns
 
-# Initialize the StandardScaler
-scaler = MinMaxScaler()
+# Fit the MinMax scaler and the PCA in a single pass over row chunks
+# (the same fitted state scales the columns here and projects them further below)
+preprocessor = StreamingScalerPCA(n_components=2).fit(iter_array_chunks(df_resampled[numerical_cols].to_numpy()))
 
-# Fit and transform the numerical columns
-df_resampled[numerical_cols] = scaler.fit_transform(df_resampled[numerical_cols])
+# Transform the numerical columns
+df_resampled[numerical_cols] = preprocessor.scale(df_resampled[numerical_cols])
 
 # Display the first few rows to check the normalized data
 df_resampled.head()
@@ -185,9 +204,8 @@ plt.show()
 X = df_resampled.drop(columns=['Machine failure'])
 y = df_resampled['Machine failure']
 
-# Apply PCA to reduce dimensionality
-pca = PCA(n_components=2)
-X_pca = pca.fit_transform(X)
+# Apply PCA to reduce dimensionality (components were fitted together with the scaler)
+X_pca = preprocessor.project(X)
 
 # Split the data into training and testing sets
 X_train, X_test, y_train, y_test = train_test_split(X_pca, y, test_size=0.2, random_state=42)
@@ -201,39 +219,41 @@ print("y_test shape:", y_test.shape)
 # %% [markdown]
 # # MODEL IMPLEMENTATION
 
-# %% [markdown]
-# ## Random Forest
-
 # %%
-# Initialize the Random Forest model
-Prmain_rf = RandomForestClassifier(random_state=42)
+# Fit the base models of the four hybrid models concurrently; the train/test
+# matrices are placed in shared memory once instead of being copied to every worker.
+# The training rows get 5-fold out-of-fold failure probabilities, so the networks are not
+# trained on in-sample base predictions. Results are cached in 'stacking_cache' and reused
+# as long as the data, the estimator parameters and the fold seed are unchanged.
+base_results = fit_base_models({
+    'rf': RandomForestClassifier(random_state=42),
+    'gbc': BinnedGradientBoostingClassifier(random_state=42),
+    'svm': ApproxKernelSVC(probability=True, random_state=42),
+    'knn': KNeighborsClassifier(n_neighbors=5),
+}, X_train, y_train, X_test, n_jobs=-1, n_splits=5, fold_seed=42, cache_dir='stacking_cache')
 
-# Fit the model on the training data
-Prmain_rf.fit(X_train, y_train)
+Prmain_rf, gbc, svm, knn = (base_results[name]['estimator'] for name in ('rf', 'gbc', 'svm', 'knn'))
 
-# Get predictions from the Random Forest model
-y_pred_rf_train = Prmain_rf.predict(X_train)
-y_pred_rf_test = Prmain_rf.predict(X_test)
+# Prepare the input for every neural network by combining the original features and the
+# base model probabilities (all hybrids share one preallocated array)
+X_train_stack = build_stacked_inputs(X_train, {name: result['train_pred'] for name, result in base_results.items()})
+X_test_stack = build_stacked_inputs(X_test, {name: result['test_pred'] for name, result in base_results.items()})
 
 # %%
-# Prepare the input for the neural network by combining original features and RF predictions
-X_train_nn = np.column_stack((X_train, y_pred_rf_train))
-X_test_nn = np.column_stack((X_test, y_pred_rf_test))
+# Train the four 64-32-1 networks together: one model with a separate branch, loss and
+# early stopping (patience 3, best weights restored) per head, fed by a prefetched tf.data pipeline
+hybrid_heads, hybrid_histories = fit_heads_jointly({name: X_train_stack[name] for name in ('rf', 'gbc', 'svm', 'knn')},
+                                                   y_train, epochs=50, batch_size=256, validation_split=0.2, patience=3,
+                                                   callbacks=throughput_callbacks('hybrid_heads', batch_size=256))
 
-# Define the neural network architecture
-model_rf = Sequential()
-model_rf.add(Dense(64, input_dim=X_train_nn.shape[1], activation='relu'))
-model_rf.add(Dense(32, activation='relu'))
-model_rf.add(Dense(1, activation='sigmoid'))  # Use 'sigmoid' for binary classification
+# %% [markdown]
+# ## Random Forest
 
-# Compile the model
-model_rf.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
+# %%
+X_train_nn, X_test_nn = X_train_stack['rf'], X_test_stack['rf']
 
-early_stopping = EarlyStopping(monitor='val_loss',
-    patience=3,
-    restore_best_weights=True)
-# Train the neural network
-rf_hystory = model_rf.fit(X_train_nn, y_train, epochs=50, batch_size=32, validation_split=0.2, callbacks=[early_stopping])
+# Neural network trained on top of the Random Forest
+model_rf, rf_hystory = hybrid_heads['rf'], hybrid_histories['rf']
 
 # %%
 def plot_training_history(history, title='Model Training History'):
@@ -316,30 +336,10 @@ evaluate_predictive_maintenance_model(y_test, y_pred_rf_test)
 # ## Gradient Boosting
 
 # %%
-# Initialize the Gradient Boosting model
-gbc = GradientBoostingClassifier(random_state=42)
+X_train_nn_gbc, X_test_nn_gbc = X_train_stack['gbc'], X_test_stack['gbc']
 
-# Fit the model on the training data
-gbc.fit(X_train, y_train)
-
-# Get predictions from the Gradient Boosting model
-y_pred_gbc_train = gbc.predict(X_train)
-y_pred_gbc_test = gbc.predict(X_test)
-
-X_train_nn_gbc = np.column_stack((X_train, y_pred_gbc_train))
-X_test_nn_gbc = np.column_stack((X_test, y_pred_gbc_test))
-
-# Define the neural network architecture
-model_gbc = Sequential()
-model_gbc.add(Dense(64, input_dim=X_train_nn_gbc.shape[1], activation='relu'))
-model_gbc.add(Dense(32, activation='relu'))
-model_gbc.add(Dense(1, activation='sigmoid'))
-
-# Compile the model
-model_gbc.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
-
-# Train the neural network
-gbc_history = model_gbc.fit(X_train_nn_gbc, y_train, epochs=50, batch_size=32, validation_split=0.2, callbacks=[early_stopping])
+# Neural network trained on top of the GBC
+model_gbc, gbc_history = hybrid_heads['gbc'], hybrid_histories['gbc']
 
 # Predict on the test set using the neural network
 y_pred_nn_gbc_test = model_gbc.predict(X_test_nn_gbc)
@@ -356,31 +356,10 @@ evaluate_predictive_maintenance_model(y_test, y_pred_nn_gbc_test)
 # ## SVM
 
 # %%
-# Initialize the SVM model
-svm = SVC(probability=True, random_state=42)
-
-# Fit the model on the training data
-svm.fit(X_train, y_train)
-
-# Get predictions from the SVM model
-y_pred_svm_train = svm.predict(X_train)
-y_pred_svm_test = svm.predict(X_test)
-
-# Prepare the input for the neural network by combining original features and SVM predictions
-X_train_nn_svm = np.column_stack((X_train, y_pred_svm_train))
-X_test_nn_svm = np.column_stack((X_test, y_pred_svm_test))
+X_train_nn_svm, X_test_nn_svm = X_train_stack['svm'], X_test_stack['svm']
 
-# Define the neural network architecture
-model_svm = Sequential()
-model_svm.add(Dense(64, input_dim=X_train_nn_svm.shape[1], activation='relu'))
-model_svm.add(Dense(32, activation='relu'))
-model_svm.add(Dense(1, activation='sigmoid'))  # Use 'sigmoid' for binary classification
-
-# Compile the model
-model_svm.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
-
-# Train the neural network
-svm_history = model_svm.fit(X_train_nn_svm, y_train, epochs=50, batch_size=32, validation_split=0.2, callbacks=[early_stopping])
+# Neural network trained on top of the SVM
+model_svm, svm_history = hybrid_heads['svm'], hybrid_histories['svm']
 
 # Predict on the test set using the neural network
 y_pred_nn_svm_test = model_svm.predict(X_test_nn_svm)
@@ -397,31 +376,10 @@ evaluate_predictive_maintenance_model(y_test, y_pred_nn_svm_test)
 # ## KNN
 
 # %%
-# Initialize the KNN model
-knn = KNeighborsClassifier(n_neighbors=5)
-
-# Fit the model on the training data
-knn.fit(X_train, y_train)
+X_train_nn_knn, X_test_nn_knn = X_train_stack['knn'], X_test_stack['knn']
 
-# Get predictions from the KNN model
-y_pred_knn_train = knn.predict(X_train)
-y_pred_knn_test = knn.predict(X_test)
-
-# Prepare the input for the neural network by combining original features and KNN predictions
-X_train_nn_knn = np.column_stack((X_train, y_pred_knn_train))
-X_test_nn_knn = np.column_stack((X_test, y_pred_knn_test))
-
-# Define the neural network architecture
-model_knn = Sequential()
-model_knn.add(Dense(64, input_dim=X_train_nn_knn.shape[1], activation='relu'))
-model_knn.add(Dense(32, activation='relu'))
-model_knn.add(Dense(1, activation='sigmoid'))  # Use 'sigmoid' for binary classification
-
-# Compile the model
-model_knn.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
-
-# Train the neural network
-knn_history = model_knn.fit(X_train_nn_knn, y_train, epochs=50, batch_size=32, validation_split=0.2, callbacks=[early_stopping])
+# Neural network trained on top of the KNN
+model_knn, knn_history = hybrid_heads['knn'], hybrid_histories['knn']
 
 # Predict on the test set using the neural network
 y_pred_nn_knn_test = model_knn.predict(X_test_nn_knn)
@@ -433,6 +391,36 @@ plot_training_history(knn_history, title='Hybrid NN and KNN Training History')
 # %%
 evaluate_predictive_maintenance_model(y_test, y_pred_nn_knn_test)
 
+# %%
+# Compare the base models and their hybrid networks on the test set
+hybrid_models = {'rf': model_rf, 'gbc': model_gbc, 'svm': model_svm, 'knn': model_knn}
+hybrid_summary(base_results, {name: model.predict(X_test_stack[name]) for name, model in hybrid_models.items()}, y_test)
+
+# %%
+# Save the scaler/PCA, the compiled Random Forest and its network head for the inference service:
+#   python -m predictive_maintenance.serving serving/hybrid_rf --port 8080 --max-batch-size 256 --max-wait-ms 2
+compiled_rf = compile_forest(Prmain_rf)
+print("Compiled forest matches predict_proba:", check_compiled_forest(Prmain_rf, compiled_rf, X_test))
+HybridPipeline(preprocessor, compiled_rf, model_rf).save('serving/hybrid_rf')
+
+# %%
+# Save all four hybrids into one memory-mappable bundle: the scaler/PCA, the base models (the forest
+# and the boosting model as node arrays) and the network heads as plain weight matrices, so workers start without TensorFlow:
+#   python -m predictive_maintenance.serving serving/pipeline.bundle --pipeline rf --port 8080
+save_bundle('serving/pipeline.bundle', preprocessor,
+            models={'rf': compiled_rf, 'gbc': gbc, 'svm': svm, 'knn': knn,
+                    **{f'head_{name}': model for name, model in hybrid_models.items()}},
+            pipelines={name: {'base': name, 'head': f'head_{name}'} for name in hybrid_models})
+
+start = time.perf_counter()
+bundle = load_bundle('serving/pipeline.bundle')
+bundle_rf = bundle.pipeline('rf')
+print(f"Bundle opened in {(time.perf_counter() - start) * 1000:.1f} ms:", bundle)
+sample_rows = Pred_main_data[numerical_cols].to_numpy()[:1000]
+print("Bundle matches the Keras head:",
+      np.allclose(bundle_rf.predict_proba(sample_rows),
+                  HybridPipeline(preprocessor, compiled_rf, model_rf).predict_proba(sample_rows), atol=1e-5))
+
 # %% [markdown]
 # ## ANN
 
@@ -451,7 +439,9 @@ early_stopping = EarlyStopping(monitor='val_loss',
     restore_best_weights=True)
 
 # Fit the model on the training data
-history = Prmain_ann.fit(X_train, y_train, epochs=100, batch_size=32, validation_split=0.2, callbacks=[early_stopping])
+with stage('fit', rows=len(X_train), model='Prmain_ann'):
+    history = Prmain_ann.fit(X_train, y_train, epochs=100, batch_size=32, validation_split=0.2,
+                             callbacks=[early_stopping, *throughput_callbacks('Prmain_ann', batch_size=32)])
 
 # %%
 # Plot training & validation loss values
@@ -504,6 +494,49 @@ plt.ylabel('True Labels')
 plt.title('Confusion Matrix for ANN')
 plt.show()
 
+# %%
+# TensorFlow-free NumPy versions of the Dense heads for scoring: float32, and per-layer int8 with
+# scales calibrated on training rows. The report gives the accuracy change of int8 on the test set,
+# the benchmark the latency per call against Keras' predict and predict_on_batch
+for name, keras_model, X_fit, X_eval in [('Prmain_ann', Prmain_ann, X_train, X_test),
+                                         ('model_rf', model_rf, X_train_stack['rf'], X_test_stack['rf'])]:
+    int8_model = DenseNetwork.from_keras(keras_model).quantize(X_fit[:10_000])
+    print(name, "int8:", quantization_report(keras_model, int8_model, X_eval, y_test))
+    print(benchmark_dense(keras_model, X_eval, quantized=int8_model))
+
+# %% [markdown]
+# ## ANN trained from streaming SMOTE batches
+
+# %%
+# Split the original (not oversampled) data; the validation set only holds real rows
+X_orig = Pred_main_data.drop(columns=['Machine failure'])
+y_orig = Pred_main_data['Machine failure'].to_numpy()
+X_orig_train, X_orig_val, y_orig_train, y_orig_val = train_test_split(
+    X_orig.to_numpy(), y_orig, test_size=0.2, random_state=42, stratify=y_orig)
+
+# Neighbour table on the raw minority rows (as SMOTE does), batches are drawn in PCA space
+minority_neighbours = smote_neighbours(X_orig_train[y_orig_train == 1], k_neighbors=5, n_jobs=-1)
+smote_batches = SMOTEBatchGenerator(preprocessor.transform(X_orig_train), y_orig_train,
+                                    neighbours=minority_neighbours, batch_size=256, seed=42)
+
+# Same architecture as Prmain_ann, trained without ever storing synthetic rows
+Prmain_ann_stream = Sequential()
+Prmain_ann_stream.add(Dense(64, activation='relu', input_shape=(X_train.shape[1],)))
+Prmain_ann_stream.add(Dense(32, activation='relu'))
+Prmain_ann_stream.add(Dense(1, activation='sigmoid'))
+Prmain_ann_stream.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
+
+stream_history = Prmain_ann_stream.fit(smote_batches, epochs=100,
+                                       validation_data=(preprocessor.transform(X_orig_val), y_orig_val),
+                                       callbacks=[early_stopping])
+
+# %%
+plot_training_history(stream_history, title='ANN Trained on Streaming SMOTE Batches')
+
+# %%
+y_pred_ann_stream = (Prmain_ann_stream.predict(preprocessor.transform(X_orig_val)) > 0.5).astype(int)
+evaluate_predictive_maintenance_model(y_orig_val, y_pred_ann_stream)
+
 # %% [markdown]
 # # Model implementation with hyperparametertuining
 
@@ -511,6 +544,10 @@ plt.show()
 # ## Random Forest
 
 # %%
+# Every finished (estimator, params, fold, data) trial of the searches below is recorded here;
+# rerunning a search after a crash or with an extended grid only fits the missing trials
+trial_store = TrialStore('tuning_trials.sqlite')
+
 # Define the parameter grid
 rf_param_grid = {
     'min_samples_split': [2, 5],
@@ -523,11 +560,15 @@ rf_param_grid = {
 
 Prmain_rf = RandomForestClassifier(random_state=42)
 
-grid_search = GridSearchCV(estimator=Prmain_rf, param_grid=rf_param_grid,
-                           cv=3, n_jobs=-1, verbose=2, scoring='accuracy')
+# Successive halving: candidates are scored on a growing number of rows and the weakest are
+# dropped early; forests differing only in n_estimators reuse the trees already fitted
+grid_search = SuccessiveHalvingSearchCV(estimator=Prmain_rf, param_grid=rf_param_grid,
+                                        cv=3, factor=3, n_jobs=-1, verbose=2, scoring='accuracy',
+                                        store=trial_store)
 
-# Fit the grid search to the data
-grid_search.fit(X_train, y_train)
+# Fit the search; the training matrix and fold indices are shared with every worker
+# through read-only memory-mapped files instead of being copied to each of them
+fit_search_shared(grid_search, X_train, y_train)
 
 # Best hyperparameters from the grid search
 best_params = grid_search.best_params_
@@ -555,15 +596,22 @@ gb_param_grid = {
     'max_depth': [3, 4]                  # Maximum depth of the individual estimators
 }
 
-# Initialize a GradientBoostingClassifier
-Prmain_gb = GradientBoostingClassifier(random_state=42)
+# Quantize the features into at most 255 bins once; every candidate and fold reuses the
+# cached uint8 matrix instead of sorting the raw features again
+gb_binner = FeatureBinner(max_bins=255).fit(X_train)
+X_train_binned = binned_matrix(X_train, gb_binner, cache_dir='bin_cache')
+X_test_binned = gb_binner.transform(X_test)
+
+# Initialize a histogram-binned gradient boosting model (drop-in for GradientBoostingClassifier)
+Prmain_gb = BinnedGradientBoostingClassifier(random_state=42)
 
-# Initialize GridSearchCV
-grid_search_gb = GridSearchCV(estimator=Prmain_gb, param_grid=gb_param_grid,
-                              cv=3, n_jobs=-1, verbose=2, scoring='accuracy')
+# Initialize the successive-halving search
+grid_search_gb = SuccessiveHalvingSearchCV(estimator=Prmain_gb, param_grid=gb_param_grid,
+                                           cv=3, factor=3, n_jobs=-1, verbose=2, scoring='accuracy',
+                                           store=trial_store)
 
 # Fit the grid search to the data
-grid_search_gb.fit(X_train, y_train)
+fit_search_shared(grid_search_gb, X_train_binned, y_train)
 
 # Best hyperparameters from the grid search
 best_params_gb = grid_search_gb.best_params_
@@ -573,11 +621,15 @@ print(f"Best hyperparameters: {best_params_gb}")
 Prmain_best_gb = grid_search_gb.best_estimator_
 
 # Make predictions
-y_pred_Prmain_gb_hy = Prmain_best_gb.predict(X_test)
+y_pred_Prmain_gb_hy = Prmain_best_gb.predict(X_test_binned)
 
 # %%
 evaluate_predictive_maintenance_model(y_test, y_pred_Prmain_gb_hy)
 
+# %%
+# Fit time and accuracy of exact vs binned gradient boosting on ai4i2020 and a 10M-row synthetic set
+benchmark_binned_gbc(X_train, y_train, synthetic_rows=10_000_000)
+
 # %% [markdown]
 # ## SVM
 
@@ -589,15 +641,16 @@ svm_param_grid = {
     'kernel': ['rbf', 'linear', 'sigmoid']
 }
 
-# Initialize an SVC (Support Vector Classifier)
-Prmain_svc = SVC()
+# Initialize an approximate-kernel SVC (linear-time in rows, takes the same C/gamma/kernel grid)
+Prmain_svc = ApproxKernelSVC(random_state=42)
 
-# Initialize GridSearchCV
-grid_search_svc = GridSearchCV(estimator=Prmain_svc, param_grid=svm_param_grid,
-                               cv=3, n_jobs=-1, verbose=2, scoring='accuracy')
+# Initialize the successive-halving search
+grid_search_svc = SuccessiveHalvingSearchCV(estimator=Prmain_svc, param_grid=svm_param_grid,
+                                            cv=3, factor=3, n_jobs=-1, verbose=2, scoring='accuracy',
+                                            store=trial_store)
 
 # Fit the grid search to the data
-grid_search_svc.fit(X_train, y_train)
+fit_search_shared(grid_search_svc, X_train, y_train)
 
 # Best hyperparameters from the grid search
 best_params_svc = grid_search_svc.best_params_
@@ -612,6 +665,10 @@ y_pred_Prmain_svc_hy = Prmain_best_svc.predict(X_test)
 # %%
 evaluate_predictive_maintenance_model(y_test, y_pred_Prmain_svc_hy)
 
+# %%
+# Fit time and accuracy gap of the approximation against the exact SVC as the data grows
+benchmark_approx_svc(X_train, y_train, sizes=(100_000, 1_000_000), params=best_params_svc)
+
 # %% [markdown]
 # ## KNN
 
@@ -623,15 +680,11 @@ knn_param_grid = {
     'metric': ['euclidean', 'manhattan']  # Distance metric
 }
 
-# Initialize a KNeighborsClassifier
-Prmain_knn = KNeighborsClassifier()
-
-# Initialize GridSearchCV
-grid_search_knn = GridSearchCV(estimator=Prmain_knn, param_grid=knn_param_grid,
-                               cv=3, n_jobs=-1, verbose=2, scoring='accuracy')
+# Initialize the grid search (one neighbour search per fold and metric, resumable from the trial store)
+grid_search_knn = KNeighborsGraphSearchCV(param_grid=knn_param_grid, cv=3, n_jobs=-1, verbose=2, store=trial_store)
 
 # Fit the grid search to the data
-grid_search_knn.fit(X_train, y_train)
+fit_search_shared(grid_search_knn, X_train, y_train)
 
 # Best hyperparameters from the grid search
 best_params_knn = grid_search_knn.best_params_
@@ -650,33 +703,27 @@ evaluate_predictive_maintenance_model(y_test, y_pred_knn_Prmain_hy)
 # ## ANN
 
 # %%
-def build_model(hp):
-    model = Sequential()
-    model.add(Dense(units=hp.Int('units1', min_value=32, max_value=128, step=32), activation='relu', input_shape=(X_train.shape[1],)))
-    model.add(Dense(units=hp.Int('units2', min_value=16, max_value=64, step=16), activation='relu'))
-    model.add(Dense(1, activation='sigmoid'))
-
-    model.compile(
-        optimizer=tf.keras.optimizers.Adam(hp.Float('learning_rate', min_value=1e-4, max_value=1e-2, sampling='LOG')),
-        loss='binary_crossentropy',
-        metrics=['accuracy']
-    )
-    return model
+# Tunable 2-layer ANN (units1, units2, learning_rate); bound to the input width so that
+# the parallel tuner processes can rebuild it
+build_model = partial(build_ann_model, input_dim=X_train.shape[1])
 
 # %%
-tuner = Hyperband(
+stop_early = EarlyStopping(monitor='val_loss', patience=5, restore_best_weights=True)
+
+# Hyperband with several trials training at once: a local chief process holds the bracket
+# state and each worker process trains one network on a single TensorFlow thread
+tuner = parallel_hyperband_search(
     build_model,
+    X_train, y_train,
     objective='val_accuracy',
     max_epochs=20,
     hyperband_iterations=1,
     directory='project_dir',
-    project_name='ann_hyperparameter_tuning'
+    project_name='ann_hyperparameter_tuning',
+    intra_op_threads=1,
+    epochs=50, validation_split=0.2, callbacks=[stop_early, *throughput_callbacks('tuner_trial')]
 )
 
-stop_early = EarlyStopping(monitor='val_loss', patience=5, restore_best_weights=True)
-
-tuner.search(X_train, y_train, epochs=50, validation_split=0.2, callbacks=[stop_early])
-
 # %%
 # Get the best hyperparameters
 best_hyperparameters = tuner.get_best_hyperparameters()[0]
@@ -689,7 +736,9 @@ print(f"Learning rate: {best_hyperparameters.get('learning_rate')}")
 
 # %%
 best_model = tuner.get_best_models(num_models=1)[0]
-history = best_model.fit(X_train, y_train, epochs=50, validation_split=0.2, callbacks=[stop_early])
+with stage('fit', rows=len(X_train), model='best_ann'):
+    history = best_model.fit(X_train, y_train, epochs=50, validation_split=0.2,
+                             callbacks=[stop_early, *throughput_callbacks('best_ann')])
 
 # %%
 # Plot training history
@@ -732,6 +781,26 @@ plt.ylabel('True Labels')
 plt.title('Confusion Matrix for ANN')
 plt.show()
 
+# %% [markdown]
+# # Model Comparison
+
+# %%
+# Failure scores of every model on the shared test split
+model_scores = {f'hybrid_{name}': model.predict(X_test_stack[name]) for name, model in hybrid_models.items()}
+model_scores.update({
+    'random_forest': Prmain_best_rf.predict_proba(X_test)[:, 1],
+    'gradient_boosting': Prmain_best_gb.predict_proba(X_test_binned)[:, 1],
+    'svm': Prmain_best_svc.predict_proba(X_test)[:, 1],
+    'knn': best_knn.predict_proba(X_test)[:, 1],
+    'ann': y_pred_prob_Prmain_ann,
+})
+
+# One sorted threshold sweep per model: metrics at 0.5, ROC-AUC, PR-AUC, the best-F1
+# threshold and the threshold minimizing the expected maintenance cost
+comparison, sweeps = evaluate_models(y_test, model_scores, cutoff=0.5,
+                                     cost_false_positive=1, cost_false_negative=10, plot=True)
+comparison.sort_values('average_precision', ascending=False)
+
 # %% [markdown]
 # # Future Importance Analysis with LIME
 
@@ -771,7 +840,16 @@ Best_rf_model = RandomForestClassifier(
 )
 
 # Fit the model to your training data
-Best_rf_model.fit(X_train, y_train)
+with stage('fit', rows=len(X_train), model='Best_rf_model'):
+    Best_rf_model.fit(X_train, y_train)
+
+# %%
+# Flatten the forest into contiguous arrays for fast batched scoring and check it bit for bit
+compiled_best_rf = compile_forest(Best_rf_model)
+print("Compiled forest matches predict_proba:", check_compiled_forest(Best_rf_model, compiled_best_rf, X_test))
+
+# Save the arrays; serving processes memory-map them with CompiledForest.load
+compiled_best_rf.save('serving/best_rf_forest')
 
 # %%
 # Initialize the LIME explainer
@@ -793,18 +871,56 @@ lime_exp = explainer.explain_instance(
 # Visualize the LIME explanation
 lime_exp.show_in_notebook(show_table=True)
 
-# Extract feature importances from the LIME explanation
-importance_df = pd.DataFrame(lime_exp.as_list(), columns=['Feature', 'Importance'])
+# %%
+# Exact TreeSHAP contributions of every feature for every test row, computed from the trees
+# themselves (deterministic, no sampling); each row's contributions sum to its predicted
+# failure probability minus the expected value
+rf_contributions, rf_expected_value = tree_attributions(Best_rf_model, X_test, n_jobs=-1)
 
-# Sort the DataFrame by importance in descending order
-importance_df = importance_df.sort_values(by='Importance', ascending=False)
+# Global importance: mean absolute contribution over the test set
+importance_df = global_importance(rf_contributions).rename_axis('Feature').reset_index(name='Importance')
 
-# Plot feature importance using LIME values
+# Plot the global feature importance
 plt.figure(figsize=(12, 8))
 sns.barplot(x='Importance', y='Feature', data=importance_df)
-plt.title('Feature Importance from LIME (Random Forest Model)')
-plt.xlabel('Importance')
+plt.title('Feature Importance from TreeSHAP (Random Forest Model)')
+plt.xlabel('Mean |contribution| to failure probability')
 plt.ylabel('Feature')
 plt.show()
 
+# %%
+# Explain the whole test set: one shared perturbation set scored in a single predict_proba call,
+# with the per-row weighted ridge fits solved in batches across worker processes
+lime_matrix = explain_instances(explainer, Best_rf_model.predict_proba, X_test, num_samples=5000, n_jobs=-1)
+
+# Feature x instance matrix of local LIME coefficients for the 'Failed' class
+lime_matrix.iloc[:, :5]
 
+# %%
+# Mean absolute LIME coefficient of every feature over the test set
+lime_matrix.drop(index='intercept').abs().mean(axis=1).sort_values(ascending=False)
+
+# %%
+# Time, memory and throughput per traced stage of this run
+if TRACE_PATH:
+    trace_summary = summarize_trace(TRACE_PATH)
+    print(trace_summary.to_string())
+
+# %% [markdown]
+# # Benchmarks
+
+# %%
+# Wall time, peak memory and throughput of every pipeline stage on seeded synthetic ai4i2020 data
+# (10k rows here; 'python -m predictive_maintenance.benchmark --rows 1m' runs the 1M / 10M sizes from a shell).
+# The first run is saved as the baseline that later runs are compared against.
+bench_baseline = 'archive\\bench\\baseline_10k.json'
+bench_results = run_benchmarks(rows=10_000, data_dir='archive\\bench',
+                               results_path='archive\\bench\\results_10k.json' if os.path.exists(bench_baseline) else bench_baseline,
+                               baseline_path=bench_baseline if os.path.exists(bench_baseline) else None)
+
+# Per-stage results, or their slowdown and memory ratios against the baseline
+if 'comparison' in bench_results:
+    bench_table = pd.DataFrame(bench_results['comparison']).set_index('stage')
+else:
+    bench_table = pd.DataFrame(bench_results['stages']).T
+bench_table
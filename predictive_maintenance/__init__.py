@@ -0,0 +1,3 @@
+"""
+Reusable building blocks for the predictive maintenance models in modelsOfML.py.
+"""
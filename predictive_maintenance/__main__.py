@@ -0,0 +1,3 @@
+from predictive_maintenance.cli import main
+
+main()
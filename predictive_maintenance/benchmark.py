@@ -0,0 +1,468 @@
+"""
+Per-stage benchmarks of the modelsOfML.py pipeline on synthetic ai4i2020 data.
+
+generate_ai4i2020 reproduces the published generation rules of the ai4i2020
+dataset (same columns, L/M/H type mix, temperature random walks, torque and
+speed distributions, tool wear per variant and the five failure modes), so
+the data can be produced at any size from a seed. write_ai4i2020_shards
+writes it as CSV shards that load_ai4i2020 reads like the real export.
+
+run_benchmarks then times every stage of the notebook (loading, outlier
+removal, SMOTE, MinMax+PCA, fit/predict of every base model, the network
+heads, the hyperparameter search and LIME), records wall time, peak resident
+memory of the benchmark process and throughput per stage to a JSON file and
+compares them against a saved baseline:
+
+    python -m predictive_maintenance.benchmark --rows 1m --data-dir bench_data \\
+        --output bench_1m.json --baseline bench_baseline_1m.json
+
+The exit status is 1 when a stage regressed beyond the tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import train_test_split
+
+from predictive_maintenance.data import TARGET_COLUMN, load_ai4i2020
+from predictive_maintenance.outliers import remove_outliers
+from predictive_maintenance.preprocessing import StreamingScalerPCA, iter_array_chunks
+from predictive_maintenance.resampling import smote_resample
+from predictive_maintenance.stacking import build_stacked_inputs
+from predictive_maintenance.tracing import PeakMemory
+from predictive_maintenance.tuning import SuccessiveHalvingSearchCV
+from predictive_maintenance.workflow import base_estimators
+
+# Named dataset sizes accepted by the command line
+SIZES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+
+# Share of the low, medium and high quality variants
+TYPE_MIX = {'L': 0.6, 'M': 0.3, 'H': 0.1}
+
+# Correlation of the normal variables behind torque and speed (gives r = -0.875 after the transforms)
+SPEED_TORQUE_LATENT_CORRELATION = 0.915
+
+# Tool wear added by one process, per quality variant [min]
+TOOL_WEAR_STEP = {'L': 2, 'M': 3, 'H': 5}
+
+# Tool wear x torque above which the tool fails by overstrain, per quality variant [min Nm]
+OVERSTRAIN_LIMIT = {'L': 11_000, 'M': 12_000, 'H': 13_000}
+
+# Share of tool replacements (at 200 - 240 min of wear) that are tool wear failures
+TOOL_FAILURE_SHARE = 0.4
+
+# Probability of a random failure per process
+RANDOM_FAILURE_RATE = 0.001
+
+# Benchmarked stages in pipeline order; the data stages always run
+STAGES = ('load', 'remove_outliers', 'smote', 'scale_pca', 'base_models', 'nn_heads', 'grid_search', 'lime')
+
+# Rows used by the expensive model stages unless overridden (None = all rows)
+DEFAULT_MAX_ROWS = {
+    'base_models': None,
+    'gbc': 200_000,
+    'nn_heads': None,
+    'grid_search': 20_000,
+    'lime_fit': 20_000,
+    'lime': 100,
+}
+
+# Candidates of the benchmarked search (a slice of the notebook's rf_param_grid)
+SEARCH_PARAM_GRID = {
+    'n_estimators': [50, 100],
+    'max_depth': [None, 10],
+    'min_samples_leaf': [1, 2],
+}
+
+RESULTS_VERSION = 1
+
+
+def _random_walk(n_rows, scale, rng):
+    # Random walk normalized to the given standard deviation around zero
+    walk = np.cumsum(rng.standard_normal(n_rows))
+    spread = walk.std()
+    return (walk - walk.mean()) * (scale / spread if spread > 0 else 0.0)
+
+
+def _tool_wear(steps, rng):
+    """
+    Returns the wear of the current tool per process and whether that process is the tool's last one.
+
+    Tools are replaced at a random wear between 200 and 240 minutes.
+    """
+    total = np.cumsum(steps)
+    lifetimes = rng.integers(200, 241, size=int(total[-1]) // 200 + 2)
+    replaced_at = np.cumsum(lifetimes)
+    tool = np.searchsorted(replaced_at, total, side='left')
+    started_at = np.r_[0, replaced_at][tool]
+    last_process = np.r_[tool[1:] != tool[:-1], False]
+    return total - started_at, last_process
+
+
+def generate_ai4i2020(n_rows, seed=42, first_udi=1):
+    """
+    Generates rows with the columns, dtypes and distributions of the ai4i2020 CSV.
+
+    Follows the dataset's published generation rules:
+
+    - Type: L, M and H products in a 60/30/10 mix.
+    - Air temperature: random walk normalized to 2 K around 300 K.
+    - Process temperature: air temperature + 10 K + a random walk normalized to 1 K.
+    - Torque: normal around 40 Nm (sd 10 Nm, no negative values); rotational
+      speed right-skewed around 1500 rpm with the real quartiles, anti-correlated
+      with torque as in the real data (r = -0.875), so the power stays near a
+      constant level.
+    - Tool wear: 5/3/2 minutes per process for H/M/L, tools replaced at 200 - 240 minutes.
+    - Failure modes: TWF at part of the tool replacements, HDF when the temperature
+      difference is below 8.6 K and the speed below 1380 rpm, PWF when the
+      power is below 3500 W or above 9000 W, OSF when tool wear x torque exceeds
+      the variant's limit, RNF with probability 0.1 %. Machine failure is set
+      when any mode occurs: about 4.2 % of the rows against 3.4 % in the real
+      export, mostly because the power failures come out somewhat more often.
+
+    Parameters:
+    - n_rows: Number of rows.
+    - seed: Seed of all random draws (the same seed gives the same rows).
+    - first_udi: UDI of the first row (consecutive shards continue the numbering).
+
+    Returns:
+    - DataFrame with the 14 columns of the ai4i2020 CSV in file order.
+    """
+    rng = np.random.default_rng(seed)
+    types = np.array(list(TYPE_MIX))[rng.choice(len(TYPE_MIX), size=n_rows, p=list(TYPE_MIX.values()))]
+
+    air = 300.0 + _random_walk(n_rows, 2.0, rng)
+    process = air + 10.0 + _random_walk(n_rows, 1.0, rng)
+
+    latent = rng.standard_normal(n_rows)
+    torque = np.clip(40.0 + 10.0 * latent, 0.0, None)
+    # Shifted log-normal speed with the real quartiles (1423 / 1503 / 1612 rpm), correlated with torque
+    speed_latent = -SPEED_TORQUE_LATENT_CORRELATION * latent + np.sqrt(
+        1 - SPEED_TORQUE_LATENT_CORRELATION ** 2) * rng.standard_normal(n_rows)
+    speed = 1168.0 + np.exp(5.814 + 0.41 * speed_latent)
+    air, process, torque, speed = np.round(air, 1), np.round(process, 1), np.round(torque, 1), np.round(speed)
+
+    steps = pd.Series(types).map(TOOL_WEAR_STEP).to_numpy()
+    wear, last_process = _tool_wear(steps, rng)
+    power = torque * speed * 2 * np.pi / 60
+
+    twf = last_process & (rng.random(n_rows) < TOOL_FAILURE_SHARE)
+    hdf = (process - air < 8.6) & (speed < 1380)
+    pwf = (power < 3500) | (power > 9000)
+    osf = wear * torque > pd.Series(types).map(OVERSTRAIN_LIMIT).to_numpy()
+    rnf = rng.random(n_rows) < RANDOM_FAILURE_RATE
+    failure = twf | hdf | pwf | osf | rnf
+
+    udi = np.arange(first_udi, first_udi + n_rows)
+    return pd.DataFrame({
+        'UDI': udi,
+        'Product ID': pd.Series(types) + pd.Series(udi + 10_000).astype(str),
+        'Type': types,
+        'Air temperature [K]': air,
+        'Process temperature [K]': process,
+        'Rotational speed [rpm]': speed.astype(np.int64),
+        'Torque [Nm]': torque,
+        'Tool wear [min]': wear.astype(np.int64),
+        TARGET_COLUMN: failure.astype(np.int8),
+        'TWF': twf.astype(np.int8),
+        'HDF': hdf.astype(np.int8),
+        'PWF': pwf.astype(np.int8),
+        'OSF': osf.astype(np.int8),
+        'RNF': rnf.astype(np.int8),
+    })
+
+
+def write_ai4i2020_shards(n_rows, data_dir, shard_rows=1_000_000, seed=42):
+    """
+    Writes n_rows synthetic ai4i2020 rows as CSV shards, reusing shards written before.
+
+    Shard i is generated from the seed (seed, i), so the shards can be
+    produced independently and a finished set is only rewritten when the
+    size, shard size or seed change.
+
+    Parameters:
+    - n_rows: Total number of rows.
+    - data_dir: Directory receiving the shards and their manifest.
+    - shard_rows: Rows per shard file.
+    - seed: Base seed.
+
+    Returns:
+    - List of shard paths in row order.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    manifest_path = os.path.join(data_dir, 'shards.json')
+    spec = {'n_rows': n_rows, 'shard_rows': shard_rows, 'seed': seed}
+    paths = [os.path.join(data_dir, f'ai4i2020-{shard:05d}.csv') for shard in range(-(-n_rows // shard_rows))]
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            if json.load(f) == spec and all(os.path.exists(path) for path in paths):
+                return paths
+        os.remove(manifest_path)
+
+    for shard, path in enumerate(paths):
+        start = shard * shard_rows
+        rows = generate_ai4i2020(min(shard_rows, n_rows - start), seed=[seed, shard], first_udi=start + 1)
+        rows.to_csv(path, index=False)
+    # The manifest is written last, so an interrupted run regenerates every shard
+    with open(manifest_path, 'w') as f:
+        json.dump(spec, f, indent=2)
+    return paths
+
+
+class _StageRecorder:
+    def __init__(self, verbose=True):
+        self.stages = {}
+        self.verbose = verbose
+
+    def measure(self, name, rows, fn, *args, **kwargs):
+        """
+        Runs fn(*args, **kwargs) as stage name over the given number of rows and returns its result.
+        """
+        with PeakMemory() as memory:
+            start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            seconds = time.perf_counter() - start
+        self.stages[name] = {
+            'rows': int(rows),
+            'seconds': seconds,
+            'peak_rss_mb': memory.peak / 2 ** 20,
+            'rows_per_second': rows / seconds if seconds > 0 else float('inf'),
+        }
+        if self.verbose:
+            print(f'{name:>20}: {rows:>11,} rows {seconds:10.3f} s {memory.peak / 2 ** 20:10.1f} MB', flush=True)
+        return result
+
+
+def _load_shards(paths):
+    frames = []
+    for path in paths:
+        # Drop the cache so every run measures the full parse of the shard
+        shutil.rmtree(f'{path}.cache', ignore_errors=True)
+        frames.append(load_ai4i2020(path))
+    return pd.concat(frames, ignore_index=True)
+
+
+def _scale_and_project(X):
+    preprocessor = StreamingScalerPCA(n_components=2).fit(iter_array_chunks(X))
+    scaled = preprocessor.scale(X)
+    return scaled, preprocessor.project(scaled)
+
+
+def _cap(X, y, max_rows, rng):
+    if max_rows is None or len(X) <= max_rows:
+        return X, y
+    rows = np.sort(rng.choice(len(X), max_rows, replace=False))
+    return X[rows], y[rows]
+
+
+def _explain(forest, X_train, X_explain, n_jobs, seed):
+    import lime.lime_tabular
+    from predictive_maintenance.explain import explain_instances
+
+    explainer = lime.lime_tabular.LimeTabularExplainer(training_data=X_train, mode='classification',
+                                                       feature_names=[f'x{i}' for i in range(X_train.shape[1])],
+                                                       random_state=seed)
+    return explain_instances(explainer, forest.predict_proba, X_explain, n_jobs=n_jobs, random_state=seed)
+
+
+def _environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+    }
+
+
+def run_benchmarks(rows=10_000, data_dir='bench_data', stages=None, max_rows=None, seed=42, n_jobs=-1,
+                   shard_rows=1_000_000, nn_epochs=5, results_path=None, baseline_path=None, tolerance=0.25,
+                   verbose=True):
+    """
+    Times every stage of the pipeline on synthetic ai4i2020 data of the given size.
+
+    Parameters:
+    - rows: Number of generated rows.
+    - data_dir: Directory of the generated shards (reused across runs).
+    - stages: Stages to run (subset of STAGES, default all); the data stages and
+      the prerequisites of the selected stages always run.
+    - max_rows: Dictionary overriding DEFAULT_MAX_ROWS (training rows of the
+      model stages, per-model keys such as 'gbc', the training rows of the
+      forest explained by LIME ('lime_fit') and the rows it explains ('lime')).
+    - seed: Seed of the data, the splits and the models.
+    - n_jobs: Worker processes of the parallel stages.
+    - shard_rows: Rows per generated shard.
+    - nn_epochs: Epochs of the network heads.
+    - results_path: Optional JSON file receiving the results.
+    - baseline_path: Optional JSON results of an earlier run to compare against.
+    - tolerance: Allowed relative slowdown / memory growth before a stage counts as a regression.
+    - verbose: Print one line per stage.
+
+    Returns:
+    - Results dictionary ({'version', 'environment', 'config', 'stages'}), with a
+      'comparison' list added when a baseline was given.
+    """
+    stages = set(STAGES if stages is None else stages)
+    unknown = stages - set(STAGES)
+    if unknown:
+        raise ValueError(f'Unknown stages: {sorted(unknown)}')
+    if stages & {'nn_heads', 'lime'}:
+        stages.add('base_models')
+    caps = {**DEFAULT_MAX_ROWS, **(max_rows or {})}
+    rng = np.random.default_rng(seed)
+    recorder = _StageRecorder(verbose=verbose)
+
+    paths = write_ai4i2020_shards(rows, data_dir, shard_rows=shard_rows, seed=seed)
+    data = recorder.measure('load', rows, _load_shards, paths)
+    recorder.measure('remove_outliers', len(data), remove_outliers, data, ['Rotational speed [rpm]', 'Torque [Nm]'])
+
+    X = data.drop(columns=[TARGET_COLUMN])
+    y = data[TARGET_COLUMN]
+    X_res, y_res = recorder.measure('smote', len(X), smote_resample, X, y, random_state=seed, n_jobs=n_jobs)
+    scaled, X_pca = recorder.measure('scale_pca', len(X_res), _scale_and_project, X_res)
+    X_train, X_test, y_train, y_test = train_test_split(X_pca, y_res, test_size=0.2, random_state=seed)
+
+    if 'base_models' in stages:
+        X_fit, y_fit = _cap(X_train, y_train, caps['base_models'], rng)
+        train_pred, test_pred = {}, {}
+        for name, estimator in base_estimators(seed).items():
+            X_model, y_model = _cap(X_fit, y_fit, caps.get(name), rng)
+            recorder.measure(f'fit_{name}', len(X_model), estimator.fit, X_model, y_model)
+            test_pred[name] = recorder.measure(f'predict_{name}', len(X_test), estimator.predict_proba, X_test)[:, 1]
+            train_pred[name] = estimator.predict_proba(X_fit)[:, 1]
+
+    if 'nn_heads' in stages:
+        # Imported up front so that the TensorFlow import is not part of the stage
+        from predictive_maintenance.heads import fit_heads_jointly
+
+        train_inputs = build_stacked_inputs(X_fit, train_pred)
+        X_heads, y_heads = _cap(np.arange(len(X_fit)), y_fit, caps['nn_heads'], rng)
+        recorder.measure('nn_heads', len(X_heads), fit_heads_jointly,
+                         {name: inputs[X_heads] for name, inputs in train_inputs.items()}, y_heads,
+                         epochs=nn_epochs, verbose=0)
+
+    if 'grid_search' in stages:
+        X_search, y_search = _cap(X_train, y_train, caps['grid_search'], rng)
+        search = SuccessiveHalvingSearchCV(estimator=RandomForestClassifier(random_state=seed),
+                                           param_grid=SEARCH_PARAM_GRID, cv=3, factor=3, n_jobs=n_jobs)
+        recorder.measure('grid_search', len(X_search), search.fit, X_search, y_search)
+
+    if 'lime' in stages:
+        # LIME explains the scaled features, as in the notebook's importance analysis
+        X_scaled_train, _, y_scaled_train, _ = train_test_split(scaled, y_res, test_size=0.2, random_state=seed)
+        X_lime, y_lime = _cap(X_scaled_train, y_scaled_train, caps['lime_fit'], rng)
+        X_explain = X_scaled_train[:caps['lime']]
+        # Imported up front and fitted outside the stage, so only the explanations are timed
+        import lime.lime_tabular
+
+        forest = RandomForestClassifier(n_estimators=100, n_jobs=n_jobs, random_state=seed).fit(X_lime, y_lime)
+        recorder.measure('lime', len(X_explain), _explain, forest, X_lime, X_explain, n_jobs, seed)
+
+    results = {
+        'version': RESULTS_VERSION,
+        'environment': _environment(),
+        'config': {'rows': rows, 'seed': seed, 'n_jobs': n_jobs, 'shard_rows': shard_rows, 'nn_epochs': nn_epochs,
+                   'max_rows': caps},
+        'stages': recorder.stages,
+    }
+    if baseline_path is not None:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        results['comparison'] = compare_to_baseline(results, baseline, tolerance=tolerance).reset_index().to_dict(
+            orient='records')
+    if results_path is not None:
+        save_results(results, results_path)
+    return results
+
+
+def save_results(results, path):
+    """
+    Writes benchmark results as JSON.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def _seconds_per_row(stage):
+    # Zero-duration stages (rows_per_second = inf) are clamped to the timer resolution,
+    # so slowdowns stay finite and non-zero
+    return max(stage['seconds'], time.get_clock_info('perf_counter').resolution) / max(stage['rows'], 1)
+
+
+def compare_to_baseline(results, baseline, tolerance=0.25, min_seconds=0.5):
+    """
+    Compares the stages of two benchmark runs.
+
+    Time is compared through throughput (rows per second), so stages whose
+    row count changed are still comparable; memory is compared directly.
+    Stages shorter than min_seconds in both runs are too noisy to flag as
+    slower.
+
+    Parameters:
+    - results, baseline: Results dictionaries of run_benchmarks (or loaded JSON files).
+    - tolerance: Allowed relative slowdown / memory growth.
+    - min_seconds: Duration below which a stage's timing is not checked.
+
+    Returns:
+    - DataFrame with one row per stage present in both runs, holding the
+      slowdown and memory ratios (current / baseline) and a regression flag.
+    """
+    rows = []
+    for name, current in results['stages'].items():
+        previous = baseline['stages'].get(name)
+        if previous is None:
+            continue
+        slowdown = _seconds_per_row(current) / _seconds_per_row(previous)
+        memory = current['peak_rss_mb'] / previous['peak_rss_mb']
+        timed = max(current['seconds'], previous['seconds']) >= min_seconds
+        rows.append({'stage': name, 'seconds': current['seconds'], 'baseline_seconds': previous['seconds'],
+                     'slowdown': slowdown, 'peak_rss_mb': current['peak_rss_mb'],
+                     'baseline_peak_rss_mb': previous['peak_rss_mb'], 'memory_ratio': memory,
+                     'regression': bool((timed and slowdown > 1 + tolerance) or memory > 1 + tolerance)})
+    columns = ['stage', 'seconds', 'baseline_seconds', 'slowdown', 'peak_rss_mb', 'baseline_peak_rss_mb',
+               'memory_ratio', 'regression']
+    return pd.DataFrame(rows, columns=columns).set_index('stage')
+
+
+def _parse_rows(value):
+    return SIZES[value.lower()] if value.lower() in SIZES else int(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline stages on synthetic ai4i2020 data.')
+    parser.add_argument('--rows', type=_parse_rows, default=SIZES['10k'], help='Row count or one of 10k, 1m, 10m')
+    parser.add_argument('--data-dir', default='bench_data')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=None)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    parser.add_argument('--shard-rows', type=int, default=1_000_000)
+    parser.add_argument('--nn-epochs', type=int, default=5)
+    parser.add_argument('--output', default=None, help='JSON file receiving the results')
+    parser.add_argument('--baseline', default=None, help='JSON results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(rows=args.rows, data_dir=args.data_dir, stages=args.stages, seed=args.seed,
+                             n_jobs=args.n_jobs, shard_rows=args.shard_rows, nn_epochs=args.nn_epochs,
+                             results_path=args.output, baseline_path=args.baseline, tolerance=args.tolerance)
+    if 'comparison' in results:
+        comparison = pd.DataFrame(results['comparison']).set_index('stage')
+        print(comparison.to_string())
+        if comparison['regression'].any():
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
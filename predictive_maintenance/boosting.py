@@ -0,0 +1,413 @@
+"""
+Histogram-binned gradient boosting for the GBC path.
+
+Exact split finding sorts every feature at every node of every boosting stage.
+Here each feature is quantized once into at most 255 quantile bins and stored
+as a uint8 matrix. The trees are grown directly on those codes: the split
+search of a node only scans per-bin gradient/hessian histograms built with
+np.bincount. A uint8 matrix passed to fit is used as it is, so the binned
+matrix can be cached on disk and handed to every grid-search candidate, and
+the quantile pass and the binning run once per dataset instead of once per fit.
+"""
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.ensemble import GradientBoostingClassifier
+from sklearn.model_selection import train_test_split
+
+from predictive_maintenance.forest import CompiledBoosting
+from predictive_maintenance.stacking import data_fingerprint
+from predictive_maintenance.tracing import traced
+
+
+class FeatureBinner:
+    """
+    Quantizes every feature into at most max_bins quantile bins (uint8 codes).
+
+    Parameters:
+    - max_bins: Maximum number of bins per feature (at most 255).
+    - subsample: Number of rows used to estimate the quantiles.
+    - random_state: Seed of the quantile subsample.
+    """
+
+    def __init__(self, max_bins=255, subsample=200_000, random_state=0):
+        if not 2 <= max_bins <= 255:
+            raise ValueError('max_bins must be between 2 and 255')
+        self.max_bins = max_bins
+        self.subsample = subsample
+        self.random_state = random_state
+
+    def fit(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if len(X) > self.subsample:
+            rows = np.random.default_rng(self.random_state).choice(len(X), self.subsample, replace=False)
+            X = X[rows]
+        self.thresholds_ = []
+        for column in X.T:
+            distinct = np.unique(column[~np.isnan(column)])
+            if len(distinct) <= self.max_bins:
+                # Few distinct values: one bin per value, split halfway between them
+                thresholds = (distinct[:-1] + distinct[1:]) / 2
+            else:
+                quantiles = np.linspace(0, 100, self.max_bins + 1)[1:-1]
+                thresholds = np.unique(np.percentile(column, quantiles, method='midpoint'))
+            self.thresholds_.append(thresholds)
+        return self
+
+    def transform(self, X):
+        # Rows are compared in float32 like sklearn's trees, so compiled models reproduce the bins exactly
+        X = np.asarray(X, dtype=np.float32)
+        binned = np.empty(X.shape, dtype=np.uint8)
+        for j, thresholds in enumerate(self.thresholds_):
+            binned[:, j] = np.searchsorted(thresholds, X[:, j], side='left')
+        return binned
+
+    def fit_transform(self, X):
+        return self.fit(X).transform(X)
+
+
+def binned_matrix(X, binner, cache_dir=None):
+    """
+    Returns binner.transform(X), reusing an on-disk copy when one exists.
+
+    The cache file is keyed by a hash of X and of the bin thresholds and is
+    reopened memory-mapped, so parallel search workers share it.
+
+    Parameters:
+    - X: Feature matrix.
+    - binner: Fitted FeatureBinner.
+    - cache_dir: Optional cache directory; without one the matrix is just computed.
+
+    Returns:
+    - uint8 matrix of bin codes.
+    """
+    if cache_dir is None:
+        return binner.transform(X)
+    key = data_fingerprint(np.asarray(X), *binner.thresholds_)
+    path = os.path.join(cache_dir, f'{key}.npy')
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        np.save(path + '.tmp.npy', binner.transform(X))
+        os.replace(path + '.tmp.npy', path)
+    return np.load(path, mmap_mode='r')
+
+
+def _grow_tree(X, gradient, hessian, max_depth, min_samples_split, min_samples_leaf):
+    """
+    Grows one regression tree on bin codes, level by level, with Newton split gains.
+
+    Split candidates come from per-node bin histograms of the gradient and
+    hessian. Only the smaller child of every split is histogrammed; its
+    sibling's histogram is the parent's minus its own.
+
+    Parameters:
+    - X: Column-major (Fortran ordered) uint8 matrix of bin codes.
+    - gradient, hessian: Log-loss gradient and hessian of every row.
+    - max_depth: Maximum depth (None for no limit).
+    - min_samples_split: Minimum number of rows of a node to be split.
+    - min_samples_leaf: Minimum number of rows of every leaf.
+
+    Returns:
+    - (feature, threshold, children, value, depth): node arrays in the layout
+      of CompiledForest (a row goes to children[i, 1] when its code is
+      <= threshold[i]) and the depth of the tree.
+    - The leaf reached by every row.
+    """
+    n_rows, n_features = X.shape
+    n_bins = 256
+    tiny = np.finfo(np.float64).tiny
+    flat_codes = X.ravel(order='F')
+    # Leaves point to themselves
+    feature, threshold, children, value = [0], [0.0], [[0, 0]], [0.0]
+    leaf = np.zeros(n_rows, dtype=np.intp)
+    # Rows still in an open node, the position of that node in the current level and the
+    # node totals of the level
+    members = np.arange(n_rows)
+    position = np.zeros(n_rows, dtype=np.intp)
+    level = np.array([0])
+    G, H, count = np.array([gradient.sum()]), np.array([hessian.sum()]), np.array([float(n_rows)])
+    parent_histograms = None
+    depth = 0
+    while True:
+        width = len(level)
+        for node, node_g, node_h in zip(level, G, H):
+            value[node] = -node_g / node_h if node_h > tiny else 0.0
+        splittable = (count >= min_samples_split) & (count >= 2 * min_samples_leaf)
+        if (max_depth is not None and depth >= max_depth) or not splittable.any():
+            break
+
+        # (statistic, feature, node, bin) histograms of the gradient, hessian and row count; counts
+        # rather than hessians tell empty children apart, since subtracted hessians keep rounding noise
+        if parent_histograms is None:
+            keys = [X[:, j] for j in range(n_features)]
+            weights, n_slots = (gradient, hessian), 1
+        else:
+            # Sibling pairs share a parent; histogram the child with fewer rows
+            pair_counts = count.reshape(-1, 2)
+            small_side = (pair_counts[:, 1] < pair_counts[:, 0]).astype(np.intp)
+            rows = np.flatnonzero((position & 1) == small_side[position >> 1])
+            small_members, offsets = members[rows], (position[rows] >> 1) * n_bins
+            keys = [X[:, j][small_members] + offsets for j in range(n_features)]
+            weights, n_slots = (gradient[small_members], hessian[small_members]), width // 2
+        histograms = np.empty((3, n_features, n_slots, n_bins))
+        for j, key in enumerate(keys):
+            for statistic, weight in enumerate(weights):
+                histograms[statistic, j] = np.bincount(key, weights=weight,
+                                                       minlength=n_slots * n_bins).reshape(n_slots, n_bins)
+            histograms[2, j] = np.bincount(key, minlength=n_slots * n_bins).reshape(n_slots, n_bins)
+        if parent_histograms is not None:
+            both = np.empty((3, n_features, width, n_bins))
+            pairs = np.arange(n_slots)
+            both[:, :, 2 * pairs + small_side] = histograms
+            both[:, :, 2 * pairs + 1 - small_side] = parent_histograms - histograms
+            histograms = both
+
+        left = histograms.cumsum(axis=3)
+        G_left, H_left, count_left = left
+        G_right, H_right = G[:, None] - G_left, H[:, None] - H_left
+        valid = ((count_left >= min_samples_leaf) & (count[:, None] - count_left >= min_samples_leaf)
+                 & (H_left > tiny) & (H_right > tiny))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            gain = np.where(valid, G_left ** 2 / H_left + G_right ** 2 / H_right, -np.inf)
+        gain -= np.where(H > tiny, G ** 2 / np.maximum(H, tiny), 0.0)[:, None]
+        # Best (feature, bin) of every node
+        flat = gain.transpose(1, 0, 2).reshape(width, -1)
+        best = flat.argmax(axis=1)
+        best_gain = flat[np.arange(width), best]
+        best_feature, best_bin = np.divmod(best, n_bins)
+
+        split = splittable & (best_gain > 0)
+        if not split.any():
+            break
+        next_level = []
+        for node in np.flatnonzero(split):
+            left_child, right_child = len(feature), len(feature) + 1
+            feature[level[node]] = int(best_feature[node])
+            threshold[level[node]] = float(best_bin[node])
+            children[level[node]] = [right_child, left_child]
+            feature += [0, 0]
+            threshold += [0.0, 0.0]
+            children += [[left_child, left_child], [right_child, right_child]]
+            value += [0.0, 0.0]
+            next_level += [left_child, right_child]
+
+        # Totals of the children, read off the chosen splits (left, right of every split node in turn)
+        nodes = np.flatnonzero(split)
+        picked = (best_feature[nodes], nodes, best_bin[nodes])
+        G, H, count = [np.column_stack([left_total[picked], total[nodes] - left_total[picked]]).ravel()
+                       for left_total, total in ((G_left, G), (H_left, H), (count_left, count))]
+
+        parent_histograms = histograms[:, :, split]
+        in_split = split[position]
+        if not in_split.all():
+            leaf[members[~in_split]] = level[position[~in_split]]
+            members, position = members[in_split], position[in_split]
+        go_right = flat_codes[best_feature[position] * n_rows + members] > best_bin[position]
+        position = 2 * (np.cumsum(split) - 1)[position] + go_right
+        level = np.array(next_level)
+        depth += 1
+
+    leaf[members] = level[position]
+    tree = (np.array(feature, dtype=np.intp), np.array(threshold), np.array(children, dtype=np.intp),
+            np.array(value), depth)
+    return tree, leaf
+
+
+def _apply_tree(feature, threshold, children, X):
+    """
+    Returns the leaf reached by every row of X in one tree (node arrays of _grow_tree).
+    """
+    nodes = np.zeros(len(X), dtype=np.intp)
+    active = np.arange(len(X))
+    while len(active):
+        current = nodes[active]
+        go_left = X[active, feature[current]] <= threshold[current]
+        following = children[current, go_left.astype(np.intp)]
+        nodes[active] = following
+        active = active[following != current]
+    return nodes
+
+
+def _n_rows(value, n_rows):
+    # Integer counts or fractions of the rows, as in GradientBoostingClassifier
+    return int(np.ceil(value * n_rows)) if isinstance(value, float) else int(value)
+
+
+class BinnedGradientBoostingClassifier(ClassifierMixin, BaseEstimator):
+    """
+    GradientBoostingClassifier-compatible binary classifier running on histogram bins.
+
+    Takes the parameters used at the gbc/Prmain_gb call sites and in
+    gb_param_grid. uint8 input is treated as already binned (the output of
+    FeatureBinner.transform or binned_matrix) and is boosted as it is, so a
+    grid search bins once and reuses the matrix for every candidate; predict
+    must then be given binned rows as well. Any other input is binned inside
+    fit.
+
+    Each stage fits a regression tree to the log-loss gradient, like the exact
+    model, but splits are searched on per-node bin histograms and leaf values
+    are Newton steps. subsample draws a new set of rows (without replacement)
+    for every stage, as in GradientBoostingClassifier.
+
+    Parameters:
+    - n_estimators: Number of boosting stages.
+    - learning_rate: Shrinkage of every stage.
+    - max_depth: Maximum depth of every tree (None for no limit).
+    - min_samples_leaf: Minimum number of rows per leaf (count or fraction of the rows).
+    - min_samples_split: Minimum number of rows of a node to be split (count or fraction).
+    - subsample: Fraction of the rows every stage is fitted on.
+    - max_bins: Maximum number of bins per feature when binning inside fit.
+    - random_state: Seed of the row subsamples.
+    """
+
+    def __init__(self, n_estimators=100, learning_rate=0.1, max_depth=3, min_samples_leaf=1,
+                 min_samples_split=2, subsample=1.0, max_bins=255, random_state=None):
+        self.n_estimators = n_estimators
+        self.learning_rate = learning_rate
+        self.max_depth = max_depth
+        self.min_samples_leaf = min_samples_leaf
+        self.min_samples_split = min_samples_split
+        self.subsample = subsample
+        self.max_bins = max_bins
+        self.random_state = random_state
+
+    def _binned(self, X):
+        X = np.asarray(X)
+        if X.dtype == np.uint8:
+            return X
+        if self.binner_ is None:
+            raise ValueError('The model was fitted on a binned uint8 matrix; pass the output of binned_matrix '
+                             '(or FeatureBinner.transform) instead of raw features')
+        return self.binner_.transform(X)
+
+    @traced('fit', rows='X')
+    def fit(self, X, y):
+        if not 0.0 < self.subsample <= 1.0:
+            raise ValueError('subsample must be in (0, 1]')
+        X = np.asarray(X)
+        y = np.asarray(y)
+        self.classes_ = np.unique(y)
+        if len(self.classes_) != 2:
+            raise ValueError('BinnedGradientBoostingClassifier only supports binary targets')
+        if X.dtype == np.uint8:
+            self.binner_ = None
+        else:
+            self.binner_ = FeatureBinner(max_bins=self.max_bins).fit(X)
+            X = self.binner_.transform(X)
+        self.n_features_in_ = X.shape[1]
+        n_rows = len(X)
+        target = (y == self.classes_[1]).astype(np.float64)
+        min_samples_split = max(_n_rows(self.min_samples_split, n_rows), 2)
+        min_samples_leaf = max(_n_rows(self.min_samples_leaf, n_rows), 1)
+        n_inbag = max(1, int(self.subsample * n_rows))
+        rng = np.random.default_rng(self.random_state)
+
+        # Prior log-odds, as the default init of GradientBoostingClassifier
+        prior = np.clip(target.mean(), np.finfo(np.float64).eps, 1 - np.finfo(np.float64).eps)
+        init_raw = float(np.log(prior / (1 - prior)))
+        raw = np.full(n_rows, init_raw)
+        # Column-major codes make every feature a contiguous array
+        columns = np.asfortranarray(X)
+        trees = []
+        for _ in range(self.n_estimators):
+            probability = 1.0 / (1.0 + np.exp(-raw))
+            gradient = probability - target
+            hessian = probability * (1.0 - probability)
+            if n_inbag < n_rows:
+                inbag = np.zeros(n_rows, dtype=bool)
+                inbag[rng.choice(n_rows, n_inbag, replace=False)] = True
+                tree, leaf = _grow_tree(np.asfortranarray(columns[inbag]), gradient[inbag], hessian[inbag],
+                                        self.max_depth, min_samples_split, min_samples_leaf)
+                raw[inbag] += self.learning_rate * tree[3][leaf]
+                raw[~inbag] += self.learning_rate * tree[3][_apply_tree(*tree[:3], columns[~inbag])]
+            else:
+                tree, leaf = _grow_tree(columns, gradient, hessian, self.max_depth, min_samples_split,
+                                        min_samples_leaf)
+                raw += self.learning_rate * tree[3][leaf]
+            trees.append(tree)
+
+        offsets = np.concatenate(([0], np.cumsum([len(tree[0]) for tree in trees])[:-1])).astype(np.intp)
+        self.booster_ = CompiledBoosting(
+            feature=np.concatenate([tree[0] for tree in trees]),
+            threshold=np.concatenate([tree[1] for tree in trees]),
+            children=np.concatenate([tree[2] + offset for tree, offset in zip(trees, offsets)]),
+            value=np.concatenate([tree[3] for tree in trees])[:, None],
+            roots=offsets, max_depth=max([tree[4] for tree in trees], default=0), classes=self.classes_,
+            learning_rate=self.learning_rate, init_raw=init_raw)
+        return self
+
+    # Not traced here: booster_.predict_proba records the 'predict' span
+    def predict_proba(self, X):
+        return self.booster_.predict_proba(self._binned(X))
+
+    def predict(self, X):
+        return self.booster_.predict(self._binned(X))
+
+    def to_compiled(self):
+        """
+        Returns the model as a CompiledBoosting on raw features (bin codes mapped
+        back to the binner's thresholds), e.g. for save_bundle.
+        """
+        if self.binner_ is None:
+            raise ValueError('A model fitted on a binned matrix has no raw-feature thresholds')
+        booster = self.booster_
+        is_split = booster.children[:, 0] != np.arange(len(booster.children))
+        threshold = np.zeros(len(booster.threshold))
+        for j, thresholds in enumerate(self.binner_.thresholds_):
+            nodes = np.flatnonzero(is_split & (booster.feature == j))
+            threshold[nodes] = thresholds[booster.threshold[nodes].astype(np.intp)]
+        return CompiledBoosting(booster.feature, threshold, booster.children, booster.value, booster.roots,
+                                booster.max_depth, booster.classes_, booster.learning_rate, booster.init_raw)
+
+
+def benchmark_binned_gbc(X, y, synthetic_rows=10_000_000, exact_max_rows=1_000_000, random_state=42):
+    """
+    Compares fit time and accuracy of exact and binned gradient boosting.
+
+    Runs on the given data and on a synthetic classification set of
+    synthetic_rows rows with the same number of features. 'binned' bins the
+    raw rows inside fit; 'binned_cached' fits on a matrix binned beforehand,
+    as every grid-search candidate does, and reports that one-off binning as
+    bin_seconds. The exact model is skipped (NaN) on training sets larger than
+    exact_max_rows.
+
+    Returns:
+    - DataFrame with one row per (dataset, method).
+    """
+    from sklearn.datasets import make_classification
+
+    X = np.asarray(X, dtype=np.float32)
+    y = np.asarray(y)
+    datasets = [('ai4i2020', X, y)]
+    if synthetic_rows:
+        X_synthetic, y_synthetic = make_classification(n_samples=synthetic_rows, n_features=X.shape[1],
+                                                       n_informative=min(5, X.shape[1]), n_redundant=0,
+                                                       random_state=random_state)
+        datasets.append(('synthetic', X_synthetic.astype(np.float32), y_synthetic))
+
+    rows = []
+    for name, features, target in datasets:
+        X_train, X_test, y_train, y_test = train_test_split(features, target, test_size=0.2, random_state=random_state)
+        start = time.perf_counter()
+        binner = FeatureBinner().fit(X_train)
+        X_train_binned = binner.transform(X_train)
+        bin_seconds = time.perf_counter() - start
+        candidates = {
+            'exact': (GradientBoostingClassifier, X_train, X_test, np.nan),
+            'binned': (BinnedGradientBoostingClassifier, X_train, X_test, np.nan),
+            'binned_cached': (BinnedGradientBoostingClassifier, X_train_binned, binner.transform(X_test), bin_seconds),
+        }
+        for method, (make, X_fit, X_predict, method_bin_seconds) in candidates.items():
+            if method == 'exact' and len(X_train) > exact_max_rows:
+                rows.append({'dataset': name, 'method': method, 'rows': len(X_train), 'bin_seconds': np.nan,
+                             'fit_seconds': np.nan, 'accuracy': np.nan})
+                continue
+            start = time.perf_counter()
+            model = make(random_state=random_state).fit(X_fit, y_train)
+            fit_seconds = time.perf_counter() - start
+            rows.append({'dataset': name, 'method': method, 'rows': len(X_train), 'bin_seconds': method_bin_seconds,
+                         'fit_seconds': fit_seconds, 'accuracy': float(np.mean(model.predict(X_predict) == y_test))})
+    return pd.DataFrame(rows)
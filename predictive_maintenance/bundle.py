@@ -0,0 +1,325 @@
+"""
+Single-file bundles of the fitted pipeline for fast cold starts.
+
+save_bundle writes everything scoring needs into one file:
+
+- the feature schema,
+- the scaler/PCA state,
+- forests and binary gradient boosting models flattened to node arrays
+  (see compile_forest and compile_boosting),
+- Dense network heads as kernel and bias matrices (see DenseNetwork),
+  float32 or int8 with their scales (see QuantizedDenseNetwork),
+- a small JSON manifest describing all of them.
+
+Every array sits at a 64-byte aligned offset in the file. load_bundle reads
+the manifest and memory-maps the file once; the arrays are read-only views
+into that mapping. Opening a bundle therefore takes milliseconds and copies
+no weights. Scoring workers on one host share the same page-cache pages
+instead of each holding a private copy. Models without an array form (e.g.
+the SVM and KNN base models) are stored as pickled bytes inside the same file
+and unpickled on first use.
+
+Bundles are written to a temporary file and renamed into place, so a worker
+restarting during a redeploy sees either the old or the new bundle, never a
+partial one.
+
+Layout: 24-byte header (magic, manifest offset, manifest length), the aligned
+array data, then the UTF-8 JSON manifest.
+"""
+import io
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+from predictive_maintenance.data import FEATURE_COLUMNS, SCHEMA, iter_feature_rows
+from predictive_maintenance.dense import DenseNetwork, QuantizedDenseNetwork
+from predictive_maintenance.forest import CompiledBoosting, CompiledForest, compile_boosting, compile_forest
+from predictive_maintenance.preprocessing import StreamingScalerPCA
+from predictive_maintenance.serving import HybridPipeline
+
+MAGIC = b'PMBUNDL1'
+FORMAT_VERSION = 2
+ALIGNMENT = 64
+
+_HEADER = struct.Struct('<8sQQ')
+
+
+class _ArrayWriter:
+    def __init__(self, f):
+        self.f = f
+        self.entries = {}
+        f.write(b'\0' * _HEADER.size)
+
+    def _pad(self):
+        position = self.f.tell()
+        self.f.write(b'\0' * (-position % ALIGNMENT))
+
+    def add(self, key, array):
+        array = np.ascontiguousarray(array)
+        if array.dtype.hasobject:
+            raise ValueError(f'Array {key} has an object dtype')
+        self._pad()
+        self.entries[key] = {'offset': self.f.tell(), 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        self.f.write(array.tobytes())
+        return key
+
+
+def _is_forest(model):
+    estimators = getattr(model, 'estimators_', None)
+    return (isinstance(estimators, list) and len(estimators) > 0 and hasattr(estimators[0], 'tree_')
+            and hasattr(model, 'classes_') and getattr(model, 'n_outputs_', 1) == 1)
+
+
+def _is_boosting(model):
+    # Binary GradientBoostingClassifier: an (n_stages, 1) array of regression trees
+    estimators = getattr(model, 'estimators_', None)
+    return (isinstance(estimators, np.ndarray) and estimators.ndim == 2 and estimators.shape[1] == 1
+            and hasattr(model, 'learning_rate') and getattr(model, 'loss', None) == 'log_loss'
+            and getattr(model, 'init', None) in (None, 'zero'))
+
+
+def _is_keras_model(model):
+    return hasattr(model, 'layers') and hasattr(model, 'get_weights')
+
+
+def _write_model(writer, name, model):
+    if _is_forest(model):
+        model = compile_forest(model)
+    elif hasattr(model, 'to_compiled') and getattr(model, 'binner_', None) is not None:
+        # BinnedGradientBoostingClassifier fitted on raw features
+        model = model.to_compiled()
+    elif _is_boosting(model):
+        model = compile_boosting(model)
+    elif _is_keras_model(model):
+        model = DenseNetwork.from_keras(model)
+
+    if isinstance(model, CompiledForest):
+        arrays = {array_name: writer.add(f'models/{name}/{array_name}', array)
+                  for array_name, array in model.arrays().items()}
+        kind = 'boosting' if isinstance(model, CompiledBoosting) else 'forest'
+        return {'kind': kind, 'arrays': arrays, **model.metadata()}
+    if isinstance(model, DenseNetwork):
+        layers = [{'kernel': writer.add(f'models/{name}/{index}/kernel', kernel),
+                   'bias': writer.add(f'models/{name}/{index}/bias', bias),
+                   'activation': activation}
+                  for index, (kernel, bias, activation) in enumerate(zip(model.kernels, model.biases,
+                                                                         model.activations))]
+        if isinstance(model, QuantizedDenseNetwork):
+            for layer, kernel_scale, input_scale in zip(layers, model.kernel_scales, model.input_scales):
+                layer.update(kernel_scale=kernel_scale, input_scale=input_scale)
+            return {'kind': 'dense_int8', 'layers': layers}
+        return {'kind': 'dense', 'layers': layers}
+
+    import joblib
+
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    payload = np.frombuffer(buffer.getbuffer(), dtype=np.uint8)
+    return {'kind': 'pickle', 'arrays': {'payload': writer.add(f'models/{name}/payload', payload)},
+            'type': f'{type(model).__module__}.{type(model).__qualname__}'}
+
+
+def save_bundle(path, preprocessor=None, models=None, pipelines=None, feature_columns=FEATURE_COLUMNS,
+                metadata=None):
+    """
+    Writes the fitted pipeline into a single memory-mappable bundle file.
+
+    Parameters:
+    - path: Bundle file to write (replaced atomically).
+    - preprocessor: Fitted StreamingScalerPCA.
+    - models: Dictionary {name: model}. Random forests, binary log-loss
+      GradientBoostingClassifiers with the default init and
+      BinnedGradientBoostingClassifiers fitted on raw features (or their
+      CompiledForest / CompiledBoosting) are stored as node arrays and Dense-only Keras models
+      (or DenseNetworks and QuantizedDenseNetworks) as weight matrices. Any
+      other model is pickled.
+    - pipelines: Dictionary {name: {'base': model name, 'head': model name}}
+      of hybrid pipelines to rebuild with ModelBundle.pipeline.
+    - feature_columns: Raw input columns expected by the pipelines, in order.
+    - metadata: Optional JSON-serializable dictionary stored with the bundle.
+
+    Returns:
+    - The manifest dictionary.
+    """
+    models = dict(models or {})
+    pipelines = dict(pipelines or {})
+    for name, parts in pipelines.items():
+        missing = [part for part in (parts['base'], parts['head']) if part not in models]
+        if missing:
+            raise ValueError(f'Pipeline {name} refers to unknown models: {missing}')
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temporary = f'{path}.tmp{os.getpid()}'
+    try:
+        with open(temporary, 'wb') as f:
+            writer = _ArrayWriter(f)
+            manifest = {
+                'format_version': FORMAT_VERSION,
+                'created_unix': time.time(),
+                'feature_columns': list(feature_columns),
+                'schema': {column: np.dtype(SCHEMA[column]).str for column in feature_columns if column in SCHEMA},
+                'preprocessor': None,
+                'models': {},
+                'pipelines': pipelines,
+                'metadata': metadata or {},
+            }
+            if preprocessor is not None:
+                state = preprocessor.state()
+                manifest['preprocessor'] = {
+                    'feature_range': state.pop('feature_range').tolist(),
+                    'n_samples_seen': int(state.pop('n_samples_seen')),
+                    'dtype': str(state.pop('dtype')),
+                    'arrays': {name: writer.add(f'preprocessor/{name}', array) for name, array in state.items()},
+                }
+            for name, model in models.items():
+                manifest['models'][name] = _write_model(writer, name, model)
+            manifest['arrays'] = writer.entries
+
+            encoded = json.dumps(manifest).encode('utf-8')
+            manifest_offset = f.tell()
+            f.write(encoded)
+            f.seek(0)
+            f.write(_HEADER.pack(MAGIC, manifest_offset, len(encoded)))
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    return manifest
+
+
+class ModelBundle:
+    """
+    Read-only view of a bundle file; open it with load_bundle.
+
+    The preprocessor and models are built from memory-mapped arrays on first
+    access and cached.
+    """
+
+    def __init__(self, path, manifest, buffer):
+        self.path = path
+        self.manifest = manifest
+        self._buffer = buffer
+        self._models = {}
+        self._preprocessor = None
+        self.feature_columns = manifest['feature_columns']
+        self.metadata = manifest['metadata']
+
+    def array(self, key):
+        """
+        Returns the read-only memory-mapped array stored under key.
+        """
+        entry = self.manifest['arrays'][key]
+        return np.ndarray(tuple(entry['shape']), dtype=np.dtype(entry['dtype']), buffer=self._buffer,
+                          offset=entry['offset'])
+
+    @property
+    def model_names(self):
+        return list(self.manifest['models'])
+
+    @property
+    def pipeline_names(self):
+        return list(self.manifest['pipelines'])
+
+    @property
+    def preprocessor(self):
+        if self._preprocessor is None:
+            entry = self.manifest['preprocessor']
+            if entry is None:
+                raise KeyError('The bundle has no preprocessor')
+            state = {name: self.array(key) for name, key in entry['arrays'].items()}
+            state.update(feature_range=entry['feature_range'], n_samples_seen=entry['n_samples_seen'],
+                         dtype=entry['dtype'])
+            self._preprocessor = StreamingScalerPCA.from_state(state)
+        return self._preprocessor
+
+    def model(self, name):
+        """
+        Returns the model stored under name (CompiledForest, CompiledBoosting, DenseNetwork or the unpickled object).
+        """
+        if name not in self._models:
+            entry = self.manifest['models'][name]
+            if entry['kind'] in ('forest', 'boosting'):
+                arrays = {array_name: self.array(key) for array_name, key in entry['arrays'].items()}
+                metadata = {key: value for key, value in entry.items() if key not in ('kind', 'arrays')}
+                model = (CompiledBoosting if entry['kind'] == 'boosting' else CompiledForest)(**arrays, **metadata)
+            elif entry['kind'] == 'dense':
+                layers = entry['layers']
+                model = DenseNetwork([self.array(layer['kernel']) for layer in layers],
+                                     [self.array(layer['bias']) for layer in layers],
+                                     [layer['activation'] for layer in layers])
+            elif entry['kind'] == 'dense_int8':
+                layers = entry['layers']
+                model = QuantizedDenseNetwork([self.array(layer['kernel']) for layer in layers],
+                                              [layer['kernel_scale'] for layer in layers],
+                                              [layer['input_scale'] for layer in layers],
+                                              [self.array(layer['bias']) for layer in layers],
+                                              [layer['activation'] for layer in layers])
+            else:
+                import joblib
+
+                payload = self.array(entry['arrays']['payload'])
+                model = joblib.load(io.BytesIO(payload.tobytes()))
+            self._models[name] = model
+        return self._models[name]
+
+    def pipeline(self, name):
+        """
+        Returns the HybridPipeline (preprocessor -> base model -> head) registered under name.
+        """
+        parts = self.manifest['pipelines'][name]
+        return HybridPipeline(self.preprocessor, self.model(parts['base']), self.model(parts['head']),
+                              self.feature_columns)
+
+    def predict_proba(self, X, pipeline):
+        """
+        Failure probabilities of raw feature rows from the named pipeline.
+        """
+        return self.pipeline(pipeline).predict_proba(X)
+
+    def __repr__(self):
+        kinds = {name: entry['kind'] for name, entry in self.manifest['models'].items()}
+        return (f'ModelBundle({self.path!r}, models={kinds}, pipelines={self.pipeline_names}, '
+                f'size={self._buffer.size / 2 ** 20:.1f} MB)')
+
+
+def load_bundle(path):
+    """
+    Opens a bundle written by save_bundle; all arrays are memory-mapped read-only.
+    """
+    with open(path, 'rb') as f:
+        magic, manifest_offset, manifest_length = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a model bundle')
+        f.seek(manifest_offset)
+        manifest = json.loads(f.read(manifest_length).decode('utf-8'))
+    if manifest['format_version'] > FORMAT_VERSION:
+        raise ValueError(f'Bundle format {manifest["format_version"]} is newer than this reader ({FORMAT_VERSION})')
+    return ModelBundle(path, manifest, np.memmap(path, dtype=np.uint8, mode='r'))
+
+
+def score_csv(bundle, input_path, output, pipeline='rf', chunksize=65_536):
+    """
+    Writes the failure probability of every row of a CSV, one per line under a header.
+
+    Parameters:
+    - bundle: ModelBundle (see load_bundle).
+    - input_path: CSV holding the bundle's feature columns (see iter_feature_rows).
+    - output: Writable text file.
+    - pipeline: Name of the bundled pipeline.
+    - chunksize: Rows scored per block.
+
+    Returns:
+    - Number of rows scored.
+    """
+    hybrid = bundle.pipeline(pipeline)
+    output.write('failure_probability\n')
+    n_rows = 0
+    for X in iter_feature_rows(input_path, bundle.feature_columns, chunksize=chunksize):
+        probabilities = hybrid.predict_proba(X)
+        output.write('\n'.join(f'{probability:.6f}' for probability in probabilities) + '\n')
+        n_rows += len(X)
+    return n_rows
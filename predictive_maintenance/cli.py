@@ -0,0 +1,142 @@
+"""
+Command line interface of the package:
+
+    python -m predictive_maintenance train archive/ai4i2020.csv --bundle serving/pipeline.bundle
+    python -m predictive_maintenance tune archive/ai4i2020.csv --models rf knn --output tuning.json
+    python -m predictive_maintenance score serving/pipeline.bundle machines.csv --pipeline rf
+    python -m predictive_maintenance explain serving/pipeline.bundle machines.csv --rows 20
+    python -m predictive_maintenance bench --rows 1m --output bench.json
+
+This module only imports the standard library. Every command imports what
+it needs when it runs. 'score' loads a bundle and runs NumPy-only pipelines
+(compiled forests or boosting models with Dense heads), so it starts without pandas,
+scikit-learn, TensorFlow or matplotlib. 'bench' passes its arguments on to
+predictive_maintenance.benchmark.
+"""
+import argparse
+import json
+import sys
+
+
+def _train(args):
+    from predictive_maintenance.workflow import train_pipeline
+
+    evaluation = train_pipeline(args.data, args.bundle, cache_dir=args.cache_dir, seed=args.seed, n_jobs=args.n_jobs,
+                                epochs=args.epochs, batch_size=args.batch_size, stacking_cache=args.stacking_cache,
+                                verbose=args.verbose)
+    print(evaluation.to_string())
+    print(f'Saved {args.bundle}')
+
+
+def _tune(args):
+    from predictive_maintenance.workflow import tune_models
+
+    results = tune_models(args.data, models=args.models, cache_dir=args.cache_dir, seed=args.seed, n_jobs=args.n_jobs,
+                          trials_path=args.trials, ann_directory=args.ann_directory, verbose=args.verbose)
+    text = json.dumps(results, indent=2, default=str)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+
+def _score(args):
+    from predictive_maintenance.bundle import load_bundle, score_csv
+
+    bundle = load_bundle(args.bundle)
+    if args.output == '-':
+        score_csv(bundle, args.input, sys.stdout, pipeline=args.pipeline, chunksize=args.chunksize)
+    else:
+        with open(args.output, 'w') as f:
+            score_csv(bundle, args.input, f, pipeline=args.pipeline, chunksize=args.chunksize)
+
+
+def _explain(args):
+    from predictive_maintenance.workflow import explain_rows
+
+    coefficients = explain_rows(args.bundle, args.input, pipeline=args.pipeline, rows=args.rows,
+                                num_samples=args.num_samples, n_jobs=args.n_jobs, seed=args.seed)
+    coefficients.to_csv(sys.stdout if args.output == '-' else args.output)
+
+
+def _bench(args, extra):
+    from predictive_maintenance.benchmark import main as bench_main
+
+    bench_main(extra)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m predictive_maintenance',
+                                     description='Train, tune, score and explain the predictive maintenance models.')
+    parser.add_argument('--trace', default=None, help='Append stage traces to this file (see tracing)')
+    parser.add_argument('--trace-format', default='jsonl', choices=('jsonl', 'otlp'))
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    train = commands.add_parser('train', help='Train the hybrid pipelines and save them as a bundle')
+    train.add_argument('data', help='ai4i2020 CSV file')
+    train.add_argument('--bundle', default='serving/pipeline.bundle')
+    train.add_argument('--cache-dir', default=None)
+    train.add_argument('--stacking-cache', default=None)
+    train.add_argument('--epochs', type=int, default=50)
+    train.add_argument('--batch-size', type=int, default=256)
+    train.add_argument('--seed', type=int, default=42)
+    train.add_argument('--n-jobs', type=int, default=-1)
+    train.add_argument('--verbose', type=int, default=0)
+    train.set_defaults(handler=_train)
+
+    tune = commands.add_parser('tune', help='Run the hyperparameter searches')
+    tune.add_argument('data', help='ai4i2020 CSV file')
+    tune.add_argument('--models', nargs='+', default=['rf', 'gbc', 'svm', 'knn', 'ann'],
+                      choices=('rf', 'gbc', 'svm', 'knn', 'ann'))
+    tune.add_argument('--trials', default='tuning_trials.sqlite', help='TrialStore file')
+    tune.add_argument('--ann-directory', default='project_dir')
+    tune.add_argument('--output', default=None, help='JSON file receiving the best parameters')
+    tune.add_argument('--cache-dir', default=None)
+    tune.add_argument('--seed', type=int, default=42)
+    tune.add_argument('--n-jobs', type=int, default=-1)
+    tune.add_argument('--verbose', type=int, default=0)
+    tune.set_defaults(handler=_tune)
+
+    score = commands.add_parser('score', help='Write failure probabilities of the rows of a CSV')
+    score.add_argument('bundle', help='Bundle file written by train or save_bundle')
+    score.add_argument('input', help='CSV with the feature columns (a raw ai4i2020 export works)')
+    score.add_argument('--pipeline', default='rf')
+    score.add_argument('--output', default='-', help="Output CSV ('-' for stdout)")
+    score.add_argument('--chunksize', type=int, default=65_536)
+    score.set_defaults(handler=_score)
+
+    explain = commands.add_parser('explain', help='Explain the first rows of a CSV with LIME')
+    explain.add_argument('bundle', help='Bundle file written by train or save_bundle')
+    explain.add_argument('input', help='CSV with the feature columns')
+    explain.add_argument('--pipeline', default='rf')
+    explain.add_argument('--rows', type=int, default=100)
+    explain.add_argument('--num-samples', type=int, default=5000)
+    explain.add_argument('--output', default='-', help="Output CSV ('-' for stdout)")
+    explain.add_argument('--seed', type=int, default=42)
+    explain.add_argument('--n-jobs', type=int, default=None)
+    explain.set_defaults(handler=_explain)
+
+    bench = commands.add_parser('bench', add_help=False,
+                                help='Per-stage benchmark (arguments of python -m predictive_maintenance.benchmark)')
+    bench.set_defaults(handler=_bench)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if args.command != 'bench' and extra:
+        parser.error(f'unrecognized arguments: {" ".join(extra)}')
+    if args.trace is not None:
+        from predictive_maintenance.tracing import enable_tracing
+
+        enable_tracing(args.trace, format=args.trace_format)
+    if args.command == 'bench':
+        args.handler(args, extra)
+    else:
+        args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
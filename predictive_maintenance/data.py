@@ -0,0 +1,254 @@
+"""
+Chunked, typed ingestion of the ai4i2020 predictive maintenance dataset.
+
+The CSV is parsed in fixed-size chunks with an explicit schema, so peak memory
+depends on the chunk size rather than on the size of the export. Every parsed
+column is appended to a raw binary file in a cache directory, and later runs
+reopen those files as memory maps instead of parsing the CSV again.
+
+pandas is imported only by the functions that build DataFrames, so scoring
+code that needs just the schema (or iter_feature_rows) starts without it.
+"""
+import json
+import os
+
+import numpy as np
+
+from predictive_maintenance.tracing import traced
+
+# Columns dropped right after loading (identifiers with no predictive value)
+DROPPED_COLUMNS = ['UDI', 'Product ID']
+
+# Encoding of the 'Type' column (low, medium, high quality)
+TYPE_ENCODING = {'L': 0, 'M': 1, 'H': 2}
+
+# Dtypes of the columns kept after loading, in file order
+SCHEMA = {
+    'Type': np.int8,
+    'Air temperature [K]': np.float32,
+    'Process temperature [K]': np.float32,
+    'Rotational speed [rpm]': np.float32,
+    'Torque [Nm]': np.float32,
+    'Tool wear [min]': np.float32,
+    'Machine failure': np.int8,
+    'TWF': np.int8,
+    'HDF': np.int8,
+    'PWF': np.int8,
+    'OSF': np.int8,
+    'RNF': np.int8,
+}
+
+TARGET_COLUMN = 'Machine failure'
+FEATURE_COLUMNS = [column for column in SCHEMA if column != TARGET_COLUMN]
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def _csv_dtypes():
+    # 'Type' is parsed as a category and encoded per chunk, everything else
+    # is parsed straight into its final dtype
+    import pandas as pd
+
+    dtypes = dict(SCHEMA)
+    dtypes['Type'] = pd.CategoricalDtype(list(TYPE_ENCODING))
+    return dtypes
+
+
+def iter_ai4i2020_chunks(path, chunksize=1_000_000):
+    """
+    Yields the ai4i2020 CSV as typed DataFrame chunks.
+
+    'UDI' and 'Product ID' are never materialized and 'Type' is encoded as
+    int8 (L=0, M=1, H=2) in every chunk.
+
+    Parameters:
+    - path: Path to the ai4i2020 CSV file.
+    - chunksize: Number of rows parsed per chunk.
+
+    Yields:
+    - DataFrame with the columns of SCHEMA in their final dtypes.
+    """
+    import pandas as pd
+
+    reader = pd.read_csv(path, usecols=list(SCHEMA), dtype=_csv_dtypes(), chunksize=chunksize)
+    with reader:
+        for chunk in reader:
+            chunk['Type'] = chunk['Type'].cat.codes.astype(np.int8)
+            yield chunk[list(SCHEMA)]
+
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _column_file(cache_dir, index):
+    return os.path.join(cache_dir, f'column_{index:02d}.bin')
+
+
+def build_ai4i2020_cache(path, cache_dir, chunksize=1_000_000):
+    """
+    Parses the CSV chunk by chunk into a columnar on-disk cache.
+
+    Each column is appended to its own raw binary file, so memory use is
+    bounded by a single chunk. The manifest is written last, which means an
+    interrupted build never leaves a cache that looks complete.
+
+    Parameters:
+    - path: Path to the ai4i2020 CSV file.
+    - cache_dir: Directory that receives the column files and the manifest.
+    - chunksize: Number of rows parsed per chunk.
+
+    Returns:
+    - The manifest dictionary describing the cache.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    columns = list(SCHEMA)
+    handles = [open(_column_file(cache_dir, i), 'wb') for i in range(len(columns))]
+    n_rows = 0
+    try:
+        for chunk in iter_ai4i2020_chunks(path, chunksize=chunksize):
+            for handle, column in zip(handles, columns):
+                handle.write(np.ascontiguousarray(chunk[column].to_numpy()).tobytes())
+            n_rows += len(chunk)
+    finally:
+        for handle in handles:
+            handle.close()
+
+    manifest = {
+        'source': _source_signature(path),
+        'n_rows': n_rows,
+        'columns': [
+            {'name': column, 'dtype': np.dtype(SCHEMA[column]).str, 'file': os.path.basename(_column_file(cache_dir, i))}
+            for i, column in enumerate(columns)
+        ],
+    }
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def open_ai4i2020_cache(cache_dir, path=None):
+    """
+    Opens a columnar cache as read-only memory-mapped arrays.
+
+    Parameters:
+    - cache_dir: Directory written by build_ai4i2020_cache.
+    - path: Optional source CSV. When given, the cache is only returned if it
+      was built from this exact file (same path, size and modification time).
+
+    Returns:
+    - Dictionary mapping column name to np.memmap, or None if there is no
+      valid cache.
+    """
+    manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if path is not None and manifest['source'] != _source_signature(path):
+        return None
+
+    n_rows = manifest['n_rows']
+    columns = {}
+    for entry in manifest['columns']:
+        file_path = os.path.join(cache_dir, entry['file'])
+        dtype = np.dtype(entry['dtype'])
+        if n_rows == 0:
+            columns[entry['name']] = np.empty(0, dtype=dtype)
+        else:
+            columns[entry['name']] = np.memmap(file_path, dtype=dtype, mode='r', shape=(n_rows,))
+    return columns
+
+
+@traced('ingest', result_rows=len)
+def load_ai4i2020(path, cache_dir=None, chunksize=1_000_000):
+    """
+    Loads the ai4i2020 dataset with a fixed schema, reusing a columnar cache.
+
+    The first call parses the CSV in chunks and writes the cache; later calls
+    reopen the memory-mapped columns without any parsing.
+
+    Parameters:
+    - path: Path to the ai4i2020 CSV file.
+    - cache_dir: Cache directory (defaults to '<path>.cache').
+    - chunksize: Number of rows parsed per chunk when building the cache.
+
+    Returns:
+    - DataFrame with the columns of SCHEMA, backed by the cached arrays.
+    """
+    import pandas as pd
+
+    if cache_dir is None:
+        cache_dir = f'{path}.cache'
+    columns = open_ai4i2020_cache(cache_dir, path=path)
+    if columns is None:
+        build_ai4i2020_cache(path, cache_dir, chunksize=chunksize)
+        columns = open_ai4i2020_cache(cache_dir, path=path)
+    return pd.DataFrame(columns, copy=False)
+
+
+def iter_cached_chunks(columns, chunksize=1_000_000, names=None):
+    """
+    Yields row chunks of a cache opened with open_ai4i2020_cache.
+
+    Parameters:
+    - columns: Dictionary of column arrays.
+    - chunksize: Number of rows per chunk.
+    - names: Optional subset of columns to include.
+
+    Yields:
+    - DataFrame views over consecutive row ranges.
+    """
+    import pandas as pd
+
+    names = list(columns) if names is None else list(names)
+    n_rows = len(columns[names[0]]) if names else 0
+    for start in range(0, n_rows, chunksize):
+        stop = min(start + chunksize, n_rows)
+        yield pd.DataFrame({name: columns[name][start:stop] for name in names}, copy=False)
+
+
+def iter_feature_rows(path, feature_columns=FEATURE_COLUMNS, chunksize=65_536):
+    """
+    Yields the feature columns of a CSV as float32 row blocks, without pandas.
+
+    Columns are matched by header name, so raw ai4i2020 exports (with 'UDI',
+    'Product ID' and the target) and files holding only the features both
+    work. 'Type' may be given as L/M/H or already encoded.
+
+    Parameters:
+    - path: CSV file with a header row.
+    - feature_columns: Columns to return, in order.
+    - chunksize: Number of rows per block.
+
+    Yields:
+    - (rows, len(feature_columns)) float32 arrays.
+    """
+    import csv
+
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = [name.strip() for name in next(reader)]
+        missing = [column for column in feature_columns if column not in header]
+        if missing:
+            raise ValueError(f'{path} is missing the columns {missing}')
+        positions = [header.index(column) for column in feature_columns]
+        type_index = list(feature_columns).index('Type') if 'Type' in feature_columns else None
+        rows = []
+        for record in reader:
+            if not record:
+                continue
+            row = [record[position] for position in positions]
+            if type_index is not None:
+                row[type_index] = TYPE_ENCODING.get(row[type_index], row[type_index])
+            rows.append(row)
+            if len(rows) == chunksize:
+                yield np.array(rows, dtype=np.float32)
+                rows = []
+        if rows:
+            yield np.array(rows, dtype=np.float32)
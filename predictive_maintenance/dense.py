@@ -0,0 +1,332 @@
+"""
+NumPy inference for stacks of Dense layers.
+
+The hybrid heads and the ANNs are plain Dense stacks (64-32-1 with ReLU and a
+sigmoid output). Scoring them needs only a few matrix products, so a
+DenseNetwork holds the kernels, biases and activation names and runs the
+forward pass in NumPy. Serving processes then neither import TensorFlow nor
+build a Keras model, and the weights can be memory-mapped from a bundle.
+
+For a handful of rows the cost is the number of NumPy calls, not the
+arithmetic. The forward pass therefore works on transposed activations,
+(units, rows), in buffers reused per thread. Every buffer ends with a row of
+ones, so the bias is one more column of the kernel and each layer is one
+matrix product written in place plus one in-place activation.
+
+DenseNetwork.quantize builds a QuantizedDenseNetwork: per-layer int8 weights
+and activations with scales calibrated on sample rows, for checking what an
+int8 deployment of a head would cost in accuracy (see quantization_report).
+"""
+import threading
+import time
+
+import numpy as np
+
+# Batches up to this many rows reuse their per-thread buffers
+_CACHED_ROWS = 1024
+
+_INT8_MAX = 127
+
+
+def _sigmoid(x):
+    # 0.5 * tanh(z / 2) + 0.5 cannot overflow; x already holds z / 2 (see _INPUT_SCALES)
+    np.tanh(x, out=x)
+    x *= 0.5
+    x += 0.5
+
+
+def _softmax(x):
+    # Units are rows in the transposed layout
+    x -= x.max(axis=0)
+    np.exp(x, out=x)
+    x /= x.sum(axis=0)
+
+
+# In-place activations of a (units, rows) block of pre-activations times _INPUT_SCALES
+ACTIVATIONS = {
+    'linear': lambda x: None,
+    'relu': lambda x: np.maximum(x, 0, out=x),
+    'sigmoid': _sigmoid,
+    'tanh': lambda x: np.tanh(x, out=x),
+    'softmax': _softmax,
+}
+
+# Factors folded into the kernel and bias of a layer to save one NumPy call per layer
+_INPUT_SCALES = {'sigmoid': 0.5}
+
+
+def _predict(model, X):
+    # Keras models: predict_on_batch skips the per-call setup and progress bar of predict()
+    if hasattr(model, 'predict_on_batch'):
+        return np.asarray(model.predict_on_batch(X))
+    return np.asarray(model.predict(X))
+
+
+class DenseNetwork:
+    """
+    Forward pass of a Dense stack in float32 NumPy.
+
+    Parameters:
+    - kernels: List of (n_in, n_out) weight matrices.
+    - biases: List of (n_out,) bias vectors.
+    - activations: List of activation names (keys of ACTIVATIONS).
+    """
+
+    dtype = np.float32
+
+    def __init__(self, kernels, biases, activations):
+        unknown = set(activations) - set(ACTIVATIONS)
+        if unknown:
+            raise ValueError(f'Unsupported activations: {sorted(unknown)}')
+        self.kernels = list(kernels)
+        self.biases = list(biases)
+        self.activations = list(activations)
+        self._build()
+
+    def _build(self):
+        # [kernel^T | bias], so that output^T = fused @ [input^T; 1]
+        self._fused = [np.ascontiguousarray(np.hstack([np.asarray(kernel).T, np.asarray(bias).reshape(-1, 1)])
+                                            * _INPUT_SCALES.get(activation, 1.0), dtype=self.dtype)
+                       for kernel, bias, activation in zip(self.kernels, self.biases, self.activations)]
+        self._local = threading.local()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    @classmethod
+    def from_keras(cls, model):
+        """
+        Copies the weights of a Keras model made only of Dense layers.
+        """
+        kernels, biases, activations = [], [], []
+        for layer in model.layers:
+            kind = type(layer).__name__
+            if kind == 'InputLayer':
+                continue
+            if kind != 'Dense':
+                raise ValueError(f'Only Dense layers are supported, got {kind}')
+            weights = layer.get_weights()
+            kernels.append(np.asarray(weights[0], dtype=np.float32))
+            biases.append(np.asarray(weights[1], dtype=np.float32) if len(weights) > 1
+                          else np.zeros(weights[0].shape[1], dtype=np.float32))
+            activation = layer.get_config()['activation']
+            activations.append(activation if isinstance(activation, str) else activation['config']['name'])
+        return cls(kernels, biases, activations)
+
+    @property
+    def input_dim(self):
+        return self.kernels[0].shape[0]
+
+    def _workspace(self, n_rows):
+        buffers = self._local.__dict__.get(n_rows)
+        if buffers is None:
+            widths = [self.input_dim] + [fused.shape[0] for fused in self._fused]
+            buffers = [np.empty((width + 1, n_rows), dtype=self.dtype) for width in widths]
+            for buffer in buffers:
+                buffer[-1] = 1.0
+            if n_rows <= _CACHED_ROWS:
+                self._local.__dict__[n_rows] = buffers
+        return buffers
+
+    def _layer(self, index, source, out):
+        np.matmul(self._fused[index], source, out=out)
+
+    def _forward(self, X):
+        buffers = self._workspace(len(X))
+        buffers[0][:-1] = X.T
+        for index, activation in enumerate(self.activations):
+            hidden = buffers[index + 1][:-1]
+            self._layer(index, buffers[index], hidden)
+            ACTIVATIONS[activation](hidden)
+        return np.array(buffers[-1][:-1].T, dtype=np.float32)
+
+    def predict(self, X, batch_size=None):
+        """
+        Returns the network outputs, shaped (rows, units of the last layer) like Keras' predict.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.input_dim:
+            raise ValueError(f'Expected rows of {self.input_dim} features, got shape {X.shape}')
+        if batch_size is None or len(X) <= batch_size:
+            return self._forward(X)
+        return np.concatenate([self._forward(X[start:start + batch_size])
+                               for start in range(0, len(X), batch_size)])
+
+    def _layer_inputs(self, X):
+        # Float forward pass keeping the input of every layer (the calibration data of quantize)
+        inputs = []
+        hidden = np.asarray(X, dtype=np.float32).T
+        for fused, activation in zip(self._fused, self.activations):
+            inputs.append(hidden.T)
+            hidden = fused @ np.vstack([hidden, np.ones((1, hidden.shape[1]), dtype=np.float32)])
+            ACTIVATIONS[activation](hidden)
+        return inputs
+
+    def quantize(self, X_calibration, percentile=99.99):
+        """
+        Builds the per-layer int8 version of the network.
+
+        Every kernel gets one scale (its largest absolute weight maps to 127).
+        Every layer input gets one scale from the given percentile of its
+        absolute values on the calibration rows; larger values are clipped.
+
+        Parameters:
+        - X_calibration: Representative input rows (e.g. a sample of the training matrix).
+        - percentile: Percentile of the absolute layer inputs mapped to 127.
+
+        Returns:
+        - QuantizedDenseNetwork.
+        """
+        kernels, kernel_scales, input_scales = [], [], []
+        for kernel, inputs in zip(self.kernels, self._layer_inputs(X_calibration)):
+            kernel = np.asarray(kernel, dtype=np.float32)
+            kernel_scale = float(np.abs(kernel).max()) / _INT8_MAX or 1.0
+            input_scale = float(np.percentile(np.abs(inputs), percentile)) / _INT8_MAX or 1.0
+            kernels.append(np.clip(np.rint(kernel / kernel_scale), -_INT8_MAX, _INT8_MAX).astype(np.int8))
+            kernel_scales.append(kernel_scale)
+            input_scales.append(input_scale)
+        return QuantizedDenseNetwork(kernels, kernel_scales, input_scales,
+                                     [np.asarray(bias, dtype=np.float32) for bias in self.biases], self.activations)
+
+
+class QuantizedDenseNetwork(DenseNetwork):
+    """
+    Dense stack with per-layer int8 weights and activations; build it with DenseNetwork.quantize.
+
+    Every layer rounds its input to int8 with the layer's input scale, takes
+    the product with the int8 kernel, adds the bias rounded to the same
+    accumulator scale and rescales the result to float before the
+    activation. The integer products are summed in float32 (or float64 for
+    very wide layers), where they are exact, so the result equals int32
+    accumulation while still running through BLAS.
+
+    Parameters:
+    - kernels: List of (n_in, n_out) int8 weight matrices.
+    - kernel_scales: Float scale of every kernel.
+    - input_scales: Float scale of every layer input.
+    - biases: List of (n_out,) float bias vectors.
+    - activations: List of activation names (keys of ACTIVATIONS).
+    """
+
+    def __init__(self, kernels, kernel_scales, input_scales, biases, activations):
+        self.kernel_scales = [float(scale) for scale in kernel_scales]
+        self.input_scales = [float(scale) for scale in input_scales]
+        # Largest possible accumulator value; float32 holds integers exactly up to 2 ** 24
+        largest = max(kernel.shape[0] * _INT8_MAX * _INT8_MAX
+                      + np.abs(np.asarray(bias)).max() / (kernel_scale * input_scale) + 1
+                      for kernel, bias, kernel_scale, input_scale in zip(kernels, biases, kernel_scales, input_scales))
+        self.dtype = np.float32 if largest < 2 ** 24 else np.float64
+        super().__init__(kernels, biases, activations)
+
+    def _build(self):
+        self._fused = []
+        for kernel, bias, kernel_scale, input_scale in zip(self.kernels, self.biases, self.kernel_scales,
+                                                           self.input_scales):
+            bias = np.rint(np.asarray(bias, dtype=np.float64) / (kernel_scale * input_scale))
+            self._fused.append(np.ascontiguousarray(np.hstack([np.asarray(kernel).T, bias.reshape(-1, 1)]),
+                                                    dtype=self.dtype))
+        self._inverse_input_scales = [1.0 / scale for scale in self.input_scales]
+        self._output_scales = [kernel_scale * input_scale * _INPUT_SCALES.get(activation, 1.0)
+                               for kernel_scale, input_scale, activation in zip(self.kernel_scales, self.input_scales,
+                                                                                self.activations)]
+        self._local = threading.local()
+
+    def _layer(self, index, source, out):
+        # The buffers are private to this call, so the input is quantized in place
+        values = source[:-1]
+        values *= self._inverse_input_scales[index]
+        np.rint(values, out=values)
+        np.clip(values, -_INT8_MAX, _INT8_MAX, out=values)
+        np.matmul(self._fused[index], source, out=out)
+        out *= self._output_scales[index]
+
+    def quantize(self, X_calibration, percentile=99.99):
+        raise TypeError('The network is already quantized')
+
+
+def quantization_report(reference, quantized, X, y=None, threshold=0.5):
+    """
+    Compares the outputs of a network and its quantized version on the rows X.
+
+    Parameters:
+    - reference: Keras model or DenseNetwork.
+    - quantized: QuantizedDenseNetwork (or any model with predict).
+    - X: Rows to compare on (e.g. the test matrix of the head).
+    - y: Optional true labels; adds both accuracies and their difference.
+    - threshold: Decision threshold of the failure class.
+
+    Returns:
+    - Dictionary with the largest and mean absolute output difference, the
+      share of rows whose decision is unchanged and, with y, 'accuracy',
+      'quantized_accuracy' and 'accuracy_delta' (quantized minus reference).
+    """
+    X = np.asarray(X, dtype=np.float32)
+    expected = _predict(reference, X).reshape(len(X), -1)
+    actual = _predict(quantized, X).reshape(len(X), -1)
+    difference = np.abs(actual - expected)
+    report = {'rows': len(X), 'max_abs_diff': float(difference.max()), 'mean_abs_diff': float(difference.mean())}
+    expected_labels = expected[:, 0] > threshold if expected.shape[1] == 1 else expected.argmax(axis=1)
+    actual_labels = actual[:, 0] > threshold if actual.shape[1] == 1 else actual.argmax(axis=1)
+    report['decision_agreement'] = float(np.mean(expected_labels == actual_labels))
+    if y is not None:
+        y = np.asarray(y).reshape(-1)
+        report['accuracy'] = float(np.mean(expected_labels == y))
+        report['quantized_accuracy'] = float(np.mean(actual_labels == y))
+        report['accuracy_delta'] = report['quantized_accuracy'] - report['accuracy']
+    return report
+
+
+def _median_seconds(fn, repeats):
+    fn()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def benchmark_dense(keras_model, X, batch_sizes=(1, 16, 256, 4096), repeats=200, quantized=None):
+    """
+    Compares the latency and outputs of a Keras Dense model and its NumPy versions.
+
+    Parameters:
+    - keras_model: Keras model made only of Dense layers (e.g. model_rf or Prmain_ann).
+    - X: Input rows; the first rows of X form every batch.
+    - batch_sizes: Rows per call.
+    - repeats: Timed calls per engine and batch size (the median is reported).
+    - quantized: Optional QuantizedDenseNetwork of the same model.
+
+    Returns:
+    - DataFrame with one row per (engine, batch_size) holding the median
+      latency in microseconds, rows per second and the largest absolute
+      difference from Keras' output.
+    """
+    import pandas as pd
+
+    engines = {'keras_predict': lambda batch: keras_model.predict(batch, verbose=0),
+               'keras_predict_on_batch': lambda batch: np.asarray(keras_model.predict_on_batch(batch)),
+               'numpy_float32': DenseNetwork.from_keras(keras_model).predict}
+    if quantized is not None:
+        engines['numpy_int8'] = quantized.predict
+    X = np.asarray(X, dtype=np.float32)
+
+    rows = []
+    for batch_size in batch_sizes:
+        batch = X[:batch_size]
+        expected = np.asarray(keras_model.predict_on_batch(batch))
+        for engine, predict in engines.items():
+            # Keras' predict() costs milliseconds per call; fewer repeats keep the benchmark short
+            engine_repeats = max(5, repeats // 20) if engine == 'keras_predict' else repeats
+            seconds = _median_seconds(lambda: predict(batch), engine_repeats)
+            rows.append({'engine': engine, 'batch_size': len(batch), 'latency_us': seconds * 1e6,
+                         'rows_per_second': len(batch) / seconds,
+                         'max_abs_diff': float(np.abs(np.asarray(predict(batch)).reshape(expected.shape)
+                                                      - expected).max())})
+    return pd.DataFrame(rows).set_index(['engine', 'batch_size'])
@@ -0,0 +1,155 @@
+"""
+Batched LIME explanations for whole test sets.
+
+LimeTabularExplainer.explain_instance draws about 5000 perturbations per row,
+calls the model on them and fits one weighted ridge model, one row at a time.
+explain_instances reproduces that procedure (quartile discretization, binary
+"same bin as the instance" features, the explainer's kernel, Ridge(alpha=1))
+for many rows at once:
+
+- With shared_samples=True one perturbation set is drawn from the training
+  bin frequencies and scored with a single predict_proba call. Only its
+  binary encoding depends on the explained row, so the model is never called
+  again except for the explained rows themselves.
+- With shared_samples=False every row gets its own draws, as in LIME, and the
+  perturbations of a whole chunk of rows are stacked into one predict_proba call.
+
+The weighted ridge fits of a chunk are solved together with batched linear
+algebra, and chunks are spread over a process pool. The result is a
+feature x instance matrix of local coefficients, matching explain_instance
+with num_features set to the number of features.
+"""
+import numpy as np
+import pandas as pd
+import scipy.stats
+from joblib import Parallel, delayed
+
+from predictive_maintenance.tracing import traced
+
+
+def _explainer_state(explainer):
+    # The explainer itself holds an unpicklable kernel closure, so workers get the
+    # fitted discretizer statistics and a kernel weight per number of mismatches
+    discretizer = explainer.discretizer
+    if discretizer is None:
+        raise ValueError('explain_instances needs an explainer built with discretize_continuous=True')
+    n_features = len(explainer.feature_values)
+    mismatches = np.arange(n_features + 1)
+    return {
+        'values': [np.asarray(explainer.feature_values[f]) for f in range(n_features)],
+        'frequencies': [np.asarray(explainer.feature_frequencies[f]) for f in range(n_features)],
+        'stats': {f: tuple(np.asarray(getattr(discretizer, name)[f], dtype=np.float64)
+                           for name in ('means', 'stds', 'mins', 'maxs'))
+                  for f in discretizer.means},
+        'kernel_weights': np.asarray(explainer.base.kernel_fn(np.sqrt(mismatches)), dtype=np.float64),
+    }
+
+
+def _sample_perturbations(state, n_samples, rng):
+    """
+    Draws n_samples rows of bin codes from the training bin frequencies and maps them back to values.
+    """
+    n_features = len(state['values'])
+    codes = np.empty((n_samples, n_features), dtype=np.int64)
+    values = np.empty((n_samples, n_features), dtype=np.float64)
+    for f in range(n_features):
+        codes[:, f] = rng.choice(state['values'][f], size=n_samples, replace=True, p=state['frequencies'][f])
+        if f not in state['stats']:
+            values[:, f] = codes[:, f]
+            continue
+        means, stds, mins, maxs = (stat[codes[:, f]] for stat in state['stats'][f])
+        # Truncated normal within the bin, as in the LIME discretizer; single-value bins keep that value
+        varying = mins != maxs
+        values[:, f] = mins
+        values[varying, f] = scipy.stats.truncnorm.rvs((mins[varying] - means[varying]) / stds[varying],
+                                                       (maxs[varying] - means[varying]) / stds[varying],
+                                                       loc=means[varying], scale=stds[varying], random_state=rng)
+    return codes, values
+
+
+def _weighted_ridge(design, weights, targets, alpha=1.0):
+    """
+    Solves Ridge(alpha, fit_intercept=True) with sample weights for a batch of problems.
+
+    design is (m, n_samples, n_features), weights and targets are (m, n_samples).
+    Returns coefficients (m, n_features) and intercepts (m,).
+    """
+    total = weights.sum(axis=1)
+    design_mean = np.einsum('ms,msf->mf', weights, design) / total[:, None]
+    target_mean = (weights * targets).sum(axis=1) / total
+    centered = design - design_mean[:, None, :]
+    weighted = centered * weights[:, :, None]
+    gram = np.einsum('msf,msg->mfg', weighted, centered) + alpha * np.eye(design.shape[2])
+    moment = np.einsum('msf,ms->mf', weighted, targets - target_mean[:, None])
+    coefficients = np.linalg.solve(gram, moment[:, :, None])[:, :, 0]
+    return coefficients, target_mean - np.einsum('mf,mf->m', design_mean, coefficients)
+
+
+def _explain_chunk(state, predict_fn, instance_codes, instance_labels, rows, num_samples, label, seed, shared):
+    if shared is not None:
+        codes, labels = shared
+        sample_codes = np.broadcast_to(codes[1:], (len(rows),) + codes[1:].shape)
+        sample_labels = np.broadcast_to(labels[1:], (len(rows), len(labels) - 1))
+    else:
+        draws = [_sample_perturbations(state, num_samples - 1, np.random.default_rng([seed, row])) for row in rows]
+        sample_codes = np.stack([codes for codes, _ in draws])
+        # One model call for the perturbations of every row in the chunk
+        stacked = np.concatenate([values for _, values in draws])
+        sample_labels = np.asarray(predict_fn(stacked))[:, label].reshape(len(rows), num_samples - 1)
+
+    # Row 0 of every neighbourhood is the explained instance itself (all features "in bin")
+    design = np.ones((len(rows), num_samples, instance_codes.shape[1]), dtype=np.float64)
+    design[:, 1:] = sample_codes == instance_codes[:, None, :]
+    targets = np.empty((len(rows), num_samples), dtype=np.float64)
+    targets[:, 0] = instance_labels
+    targets[:, 1:] = sample_labels
+    mismatches = instance_codes.shape[1] - design.sum(axis=2).astype(np.int64)
+    weights = state['kernel_weights'][mismatches]
+    return _weighted_ridge(design, weights, targets)
+
+
+@traced('explanation', rows='X')
+def explain_instances(explainer, predict_fn, X, num_samples=5000, label=1, shared_samples=True, n_jobs=None,
+                      chunk_size=128, random_state=42):
+    """
+    Explains many rows with LIME and returns a feature x instance coefficient matrix.
+
+    Parameters:
+    - explainer: LimeTabularExplainer built on the training data (discretize_continuous=True).
+    - predict_fn: Picklable probability function, e.g. Best_rf_model.predict_proba.
+    - X: Rows to explain (DataFrame or array).
+    - num_samples: Neighbourhood size per row, including the row itself.
+    - label: Class whose probability is explained.
+    - shared_samples: Reuse one perturbation set for all rows (one model call in total).
+    - n_jobs: Number of worker processes over chunks of rows.
+    - chunk_size: Rows solved together in one batched ridge fit.
+    - random_state: Seed of the perturbations.
+
+    Returns:
+    - DataFrame with one row per feature and one column per explained row
+      (labelled with X's index), plus a final 'intercept' row.
+    """
+    feature_names = list(explainer.feature_names)
+    index = X.index if hasattr(X, 'index') else pd.RangeIndex(len(X))
+    X = np.asarray(X, dtype=np.float64)
+    state = _explainer_state(explainer)
+    instance_codes = explainer.discretizer.discretize(X).astype(np.int64)
+    instance_labels = np.asarray(predict_fn(X))[:, label]
+
+    shared = None
+    if shared_samples:
+        codes, values = _sample_perturbations(state, num_samples, np.random.default_rng(random_state))
+        shared = (codes, np.asarray(predict_fn(values))[:, label])
+
+    # With shared samples the workers never call the model, so it is not pickled into every task
+    chunk_predict_fn = None if shared is not None else predict_fn
+    chunks = [np.arange(start, min(start + chunk_size, len(X))) for start in range(0, len(X), chunk_size)]
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_explain_chunk)(state, chunk_predict_fn, instance_codes[rows], instance_labels[rows], rows,
+                                num_samples, label, random_state, shared)
+        for rows in chunks
+    )
+    coefficients = np.concatenate([coefficient for coefficient, _ in results])
+    intercepts = np.concatenate([intercept for _, intercept in results])
+    matrix = np.vstack([coefficients.T, intercepts])
+    return pd.DataFrame(matrix, index=feature_names + ['intercept'], columns=index)
@@ -0,0 +1,250 @@
+"""
+Neural network heads of the hybrid models.
+
+This module imports TensorFlow; import it only where Keras models are built.
+"""
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.callbacks import Callback
+from tensorflow.keras.layers import Dense, Input
+from tensorflow.keras.models import Model, Sequential
+
+from predictive_maintenance.tracing import enable_tracing, record_span, traced, tracing_config, tracing_enabled
+
+
+def build_hybrid_head(input_dim):
+    """
+    Builds and compiles the 64-32-1 network used on top of every base model.
+
+    Parameters:
+    - input_dim: Number of input columns (features plus base model prediction).
+
+    Returns:
+    - Compiled Sequential model with a sigmoid output for binary classification.
+    """
+    model = Sequential()
+    model.add(Dense(64, input_dim=input_dim, activation='relu'))
+    model.add(Dense(32, activation='relu'))
+    model.add(Dense(1, activation='sigmoid'))
+    model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
+    return model
+
+
+class HeadHistory:
+    """
+    History of one head trained by fit_heads_jointly, shaped like a Keras History.
+    """
+
+    def __init__(self, history, stopped_epoch, best_epoch):
+        self.history = history
+        self.epoch = list(range(len(next(iter(history.values()), []))))
+        self.stopped_epoch = stopped_epoch
+        self.best_epoch = best_epoch
+
+
+class _PerHeadEarlyStopping(Callback):
+    """
+    Early stopping with restore_best_weights applied to every head on its own.
+
+    A head whose validation loss has not improved for patience epochs is
+    marked as stopped: its history ends there and its best weights are kept.
+    Training ends once every head has stopped.
+    """
+
+    def __init__(self, branches, patience):
+        super().__init__()
+        self.branches = branches
+        self.patience = patience
+
+    def on_train_begin(self, logs=None):
+        self.best = {name: float('inf') for name in self.branches}
+        self.best_epoch = {name: 0 for name in self.branches}
+        self.best_weights = {name: None for name in self.branches}
+        self.stopped_epoch = {name: None for name in self.branches}
+
+    def on_epoch_end(self, epoch, logs=None):
+        for name, layers in self.branches.items():
+            if self.stopped_epoch[name] is not None:
+                continue
+            loss = logs[f'val_{name}_loss']
+            if loss < self.best[name]:
+                self.best[name], self.best_epoch[name] = loss, epoch
+                self.best_weights[name] = [layer.get_weights() for layer in layers]
+            elif epoch - self.best_epoch[name] >= self.patience:
+                self.stopped_epoch[name] = epoch
+        if all(stopped is not None for stopped in self.stopped_epoch.values()):
+            self.model.stop_training = True
+
+    def on_train_end(self, logs=None):
+        for name, layers in self.branches.items():
+            if self.best_weights[name] is not None:
+                for layer, weights in zip(layers, self.best_weights[name]):
+                    layer.set_weights(weights)
+
+
+class ThroughputLogger(Callback):
+    """
+    Records the training throughput of every epoch in the active trace.
+
+    Each epoch becomes one 'epoch' record (nested under the running stage)
+    with its samples/sec, mean and slowest step time; the same values are
+    kept in .epochs. Created while tracing is on, the logger carries the trace
+    configuration, so copies running in tuner worker processes append to the
+    same trace.
+
+    Parameters:
+    - name: Model label of the records (e.g. 'model_rf', 'Prmain_ann', 'tuner_trial').
+    - batch_size: Rows per training step.
+    - samples_per_epoch: Training rows per epoch, to count a partial last batch exactly.
+    """
+
+    def __init__(self, name, batch_size=32, samples_per_epoch=None):
+        super().__init__()
+        self.name = name
+        self.batch_size = batch_size
+        self.samples_per_epoch = samples_per_epoch
+        self.trace = tracing_config()
+        self.epochs = []
+
+    def on_train_begin(self, logs=None):
+        if self.trace is not None and not tracing_enabled():
+            enable_tracing(**self.trace)
+        self.epochs = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch_start_ns = time.time_ns()
+        self._step_seconds = []
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self._step_start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        self._step_seconds.append(time.perf_counter() - self._step_start)
+
+    def on_epoch_end(self, epoch, logs=None):
+        steps = len(self._step_seconds)
+        samples = steps * self.batch_size
+        if self.samples_per_epoch is not None:
+            samples = min(samples, self.samples_per_epoch)
+        train_seconds = sum(self._step_seconds)
+        record = {
+            'epoch': epoch,
+            'steps': steps,
+            'samples_per_second': samples / train_seconds if train_seconds > 0 else float('nan'),
+            'mean_step_ms': 1000 * train_seconds / steps if steps else float('nan'),
+            'max_step_ms': 1000 * max(self._step_seconds, default=float('nan')),
+        }
+        self.epochs.append(record)
+        record_span('epoch', self._epoch_start_ns, time.time_ns(), rows=samples, model=self.name, **record)
+
+
+def throughput_callbacks(name, batch_size=32, samples_per_epoch=None):
+    """
+    Returns [ThroughputLogger(...)] while tracing is on and [] otherwise, so fits pay nothing when it is off.
+    """
+    if not tracing_enabled():
+        return []
+    return [ThroughputLogger(name, batch_size=batch_size, samples_per_epoch=samples_per_epoch)]
+
+
+@traced('fit', rows='y')
+def fit_heads_jointly(train_inputs, y, epochs=50, batch_size=256, validation_split=0.2, patience=3,
+                      shuffle_buffer=100_000, seed=42, verbose='auto', callbacks=None):
+    """
+    Trains several hybrid heads as parallel branches of one Keras model.
+
+    Every head is its own 64-32-1 branch with its own input and loss; the
+    branches share no weights, so the summed loss trains each one exactly as
+    if it were alone, but one fused step per batch replaces a separate
+    Python/TF step per head. Batches come from a shuffled, prefetched tf.data
+    pipeline. Validation uses the last validation_split of the rows, as
+    Keras' validation_split does, and early stopping with best-weight restore
+    is tracked per head.
+
+    Parameters:
+    - train_inputs: Dictionary {name: stacked training matrix}, all with the same rows.
+    - y: Training targets.
+    - epochs: Maximum number of epochs.
+    - batch_size: Rows per training step.
+    - validation_split: Fraction of trailing rows held out for validation.
+    - patience: Epochs without validation loss improvement before a head stops.
+    - shuffle_buffer: Size of the tf.data shuffle buffer.
+    - seed: Seed of the shuffle and weight initialization.
+    - verbose: Keras fit verbosity.
+    - callbacks: Extra Keras callbacks of the joint fit (e.g. throughput_callbacks).
+
+    Returns:
+    - ({name: standalone compiled Sequential head}, {name: HeadHistory}).
+    """
+    tf.keras.utils.set_random_seed(seed)
+    names = list(train_inputs)
+    y = np.asarray(y, dtype=np.float32).reshape(-1)
+    n_train = int(len(y) * (1 - validation_split))
+
+    inputs, outputs, branches = {}, {}, {}
+    for name in names:
+        inputs[name] = Input(shape=(train_inputs[name].shape[1],), name=name)
+        layers = [Dense(64, activation='relu', name=f'{name}_dense_64'),
+                  Dense(32, activation='relu', name=f'{name}_dense_32'),
+                  Dense(1, activation='sigmoid', name=f'{name}_output')]
+        hidden = inputs[name]
+        for layer in layers:
+            hidden = layer(hidden)
+        outputs[name] = hidden
+        branches[name] = layers
+    model = Model(inputs=inputs, outputs=outputs)
+    model.compile(optimizer='adam', loss={name: 'binary_crossentropy' for name in names},
+                  metrics={name: ['accuracy'] for name in names})
+
+    def dataset(rows, training):
+        features = {name: np.asarray(train_inputs[name][rows], dtype=np.float32) for name in names}
+        targets = {name: y[rows] for name in names}
+        data = tf.data.Dataset.from_tensor_slices((features, targets))
+        if training:
+            data = data.shuffle(min(shuffle_buffer, len(y[rows])), seed=seed, reshuffle_each_iteration=True)
+        return data.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+    stopping = _PerHeadEarlyStopping(branches, patience)
+    history = model.fit(dataset(slice(0, n_train), True), validation_data=dataset(slice(n_train, None), False),
+                        epochs=epochs, callbacks=[stopping, *(callbacks or [])], shuffle=False, verbose=verbose)
+
+    heads, histories = {}, {}
+    for name in names:
+        heads[name] = build_hybrid_head(train_inputs[name].shape[1])
+        heads[name].set_weights([weights for layer in branches[name] for weights in layer.get_weights()])
+        stopped = stopping.stopped_epoch[name]
+        n_epochs = len(history.epoch) if stopped is None else stopped + 1
+        head_history = {f'{prefix}{metric}': history.history[f'{prefix}{name}_{metric}'][:n_epochs]
+                        for prefix in ('', 'val_') for metric in ('loss', 'accuracy')}
+        histories[name] = HeadHistory(head_history, stopped, stopping.best_epoch[name])
+    return heads, histories
+
+
+def build_ann_model(hp, input_dim):
+    """
+    Builds the tunable two-layer ANN searched by the Hyperband tuner.
+
+    Bind input_dim with functools.partial to get a picklable hypermodel that
+    parallel tuner processes can rebuild.
+
+    Parameters:
+    - hp: keras_tuner HyperParameters.
+    - input_dim: Number of input features.
+
+    Returns:
+    - Compiled Sequential model.
+    """
+    model = Sequential()
+    model.add(Dense(units=hp.Int('units1', min_value=32, max_value=128, step=32), activation='relu',
+                    input_shape=(input_dim,)))
+    model.add(Dense(units=hp.Int('units2', min_value=16, max_value=64, step=16), activation='relu'))
+    model.add(Dense(1, activation='sigmoid'))
+
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(hp.Float('learning_rate', min_value=1e-4, max_value=1e-2, sampling='LOG')),
+        loss='binary_crossentropy',
+        metrics=['accuracy']
+    )
+    return model
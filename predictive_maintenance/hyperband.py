@@ -0,0 +1,127 @@
+"""
+Parallel local Hyperband search for the ANN.
+
+keras_tuner's distributed mode runs one chief process that owns the Hyperband
+oracle (bracket state, trial bookkeeping) and serves it over gRPC, and any
+number of worker processes that ask it for trials, train them and report
+back. parallel_hyperband_search runs that setup on the local machine: a chief
+and n_workers tuner processes on 127.0.0.1, each worker limited to a few
+TensorFlow threads so that several small networks train side by side instead
+of one network leaving most cores idle. Results land in the usual
+directory/project_name layout, and the tuner returned to the caller is
+reloaded from it.
+
+The module does not import TensorFlow; worker processes are spawned fresh
+and only they import it.
+"""
+import contextlib
+import multiprocessing
+import os
+import shutil
+import socket
+import tempfile
+
+import numpy as np
+
+from predictive_maintenance.tracing import traced
+from predictive_maintenance.tuning import _default_temp_folder
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def _environ(**variables):
+    # Spawned processes copy os.environ when started, so the tuner settings are
+    # put in place only around Process.start()
+    previous = {name: os.environ.get(name) for name in variables}
+    os.environ.update({name: str(value) for name, value in variables.items()})
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def _run_tuner(hypermodel, tuner_kwargs, data_folder, intra_op_threads, search_kwargs):
+    import tensorflow as tf
+    from keras_tuner import Hyperband
+
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    X = np.load(os.path.join(data_folder, 'X.npy'), mmap_mode='r')
+    y = np.load(os.path.join(data_folder, 'y.npy'), mmap_mode='r')
+    tuner = Hyperband(hypermodel, overwrite=False, **tuner_kwargs)
+    tuner.search(np.asarray(X), np.asarray(y), **search_kwargs)
+
+
+@traced('tuning', rows='X')
+def parallel_hyperband_search(hypermodel, X, y, objective, max_epochs, hyperband_iterations=1,
+                              directory='project_dir', project_name='untitled_project', n_workers=None,
+                              intra_op_threads=1, seed=None, overwrite=False, **search_kwargs):
+    """
+    Runs a Hyperband search with several trials training concurrently.
+
+    Parameters:
+    - hypermodel: Picklable function of hp returning a compiled model, e.g.
+      functools.partial(build_ann_model, input_dim=...).
+    - X, y: Training data (shared with the workers through a memory-mapped file).
+    - objective, max_epochs, hyperband_iterations, directory, project_name,
+      seed: Hyperband arguments.
+    - n_workers: Number of concurrent tuner processes (defaults to cores / intra_op_threads).
+    - intra_op_threads: TensorFlow intra-op threads per worker.
+    - overwrite: Start over instead of resuming an existing project.
+    - search_kwargs: Arguments of tuner.search (epochs, validation_split, callbacks, ...).
+
+    Returns:
+    - Hyperband tuner reloaded from the project directory (get_best_hyperparameters,
+      get_best_models and results_summary work as after a serial search).
+    """
+    from keras_tuner import Hyperband
+
+    if n_workers is None:
+        n_workers = max(1, (os.cpu_count() or 1) // intra_op_threads)
+    if overwrite:
+        shutil.rmtree(os.path.join(directory, project_name), ignore_errors=True)
+    tuner_kwargs = dict(objective=objective, max_epochs=max_epochs, hyperband_iterations=hyperband_iterations,
+                        directory=directory, project_name=project_name, seed=seed)
+
+    data_folder = tempfile.mkdtemp(prefix='hyperband_', dir=_default_temp_folder())
+    try:
+        np.save(os.path.join(data_folder, 'X.npy'), np.asarray(X, dtype=np.float32))
+        np.save(os.path.join(data_folder, 'y.npy'), np.asarray(y))
+        context = multiprocessing.get_context('spawn')
+        port = _free_port()
+        threads = dict(OMP_NUM_THREADS=intra_op_threads, TF_NUM_INTRAOP_THREADS=intra_op_threads,
+                       TF_NUM_INTEROP_THREADS=1, TF_CPP_MIN_LOG_LEVEL=2)
+        processes = []
+        for tuner_id in ['chief'] + [f'tuner{index}' for index in range(n_workers)]:
+            with _environ(KERASTUNER_TUNER_ID=tuner_id, KERASTUNER_ORACLE_IP='127.0.0.1',
+                          KERASTUNER_ORACLE_PORT=port, **threads):
+                process = context.Process(target=_run_tuner, name=f'hyperband-{tuner_id}',
+                                          args=(hypermodel, tuner_kwargs, data_folder, intra_op_threads,
+                                                search_kwargs))
+                process.start()
+            processes.append(process)
+        chief, workers = processes[0], processes[1:]
+        for process in workers:
+            process.join()
+        # The chief saves the oracle after every finished trial, but only notices that
+        # the workers are gone on its 20 second poll, so it is stopped once they are done
+        chief.join(timeout=5)
+        if chief.is_alive():
+            chief.terminate()
+            chief.join()
+        failed = [process.name for process in workers if process.exitcode != 0]
+        if failed:
+            raise RuntimeError(f'Hyperband processes failed: {failed}')
+    finally:
+        shutil.rmtree(data_folder, ignore_errors=True)
+
+    return Hyperband(hypermodel, overwrite=False, **tuner_kwargs)
@@ -0,0 +1,193 @@
+"""
+Kernel-approximation SVM for the SVC path.
+
+SVC solves a dual problem whose cost grows between quadratically and
+cubically with the number of rows, and probability=True adds an internal
+5-fold Platt calibration on top. ApproxKernelSVC maps the features through a
+Nystroem or random Fourier feature approximation of the kernel and trains a
+linear hinge-loss model on the mapped rows with mini-batch SGD, so fit time
+grows linearly with the number of rows. Probabilities come from a single
+Platt scaling fitted on the decision values of training rows held out from
+the linear fit, and only when probability=True, as with SVC.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.kernel_approximation import Nystroem, RBFSampler
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.model_selection import train_test_split
+from sklearn.svm import SVC
+
+from predictive_maintenance.tracing import traced
+
+# Below this many held-out rows the Platt scaling is fitted on the training rows instead
+_MIN_CALIBRATION_ROWS = 50
+
+
+class ApproxKernelSVC(ClassifierMixin, BaseEstimator):
+    """
+    SVC-compatible binary classifier on an approximate kernel feature map.
+
+    Takes the parameters of svm_param_grid (C, gamma, kernel), so it can be
+    used as the estimator of the SVM search. gamma='scale' and gamma='auto'
+    are resolved exactly as SVC does.
+
+    Parameters:
+    - C: Inverse regularization strength (same meaning as in SVC).
+    - kernel: 'rbf', 'sigmoid' or 'linear' (no feature map).
+    - gamma: Kernel coefficient, 'scale', 'auto' or a float.
+    - coef0: Independent term of the sigmoid kernel.
+    - approximation: 'nystroem' or 'rff' (random Fourier features, rbf only).
+    - n_components: Dimension of the approximate feature map.
+    - n_epochs: Passes of mini-batch SGD over the training rows.
+    - batch_size: Rows per SGD update.
+    - probability: Whether to fit the Platt scaling used by predict_proba.
+    - calibration_rows: Maximum number of training rows held out from the SGD fit
+      for the Platt scaling (at most a fifth of the rows). Small or nearly
+      single-class training sets are calibrated on the training rows.
+    - random_state: Seed of the feature map, the batch order and the subsamples.
+    """
+
+    def __init__(self, C=1.0, kernel='rbf', gamma='scale', coef0=0.0, approximation='nystroem', n_components=300,
+                 n_epochs=5, batch_size=4096, probability=False, calibration_rows=100_000, random_state=None):
+        self.C = C
+        self.kernel = kernel
+        self.gamma = gamma
+        self.coef0 = coef0
+        self.approximation = approximation
+        self.n_components = n_components
+        self.n_epochs = n_epochs
+        self.batch_size = batch_size
+        self.probability = probability
+        self.calibration_rows = calibration_rows
+        self.random_state = random_state
+
+    def _resolve_gamma(self, X):
+        if self.gamma == 'scale':
+            variance = X.var()
+            return 1.0 / (X.shape[1] * variance) if variance != 0 else 1.0
+        if self.gamma == 'auto':
+            return 1.0 / X.shape[1]
+        return float(self.gamma)
+
+    def _make_feature_map(self, X):
+        if self.kernel == 'linear':
+            return None
+        if self.kernel not in ('rbf', 'sigmoid'):
+            raise ValueError(f'Unsupported kernel: {self.kernel}')
+        gamma = self._resolve_gamma(X)
+        n_components = min(self.n_components, len(X))
+        if self.approximation == 'rff' and self.kernel == 'rbf':
+            return RBFSampler(gamma=gamma, n_components=n_components, random_state=self.random_state).fit(X)
+        if self.approximation not in ('nystroem', 'rff'):
+            raise ValueError(f'Unknown approximation: {self.approximation}')
+        # Random Fourier features only exist for shift-invariant kernels, so sigmoid always uses Nystroem
+        return Nystroem(kernel=self.kernel, gamma=gamma, coef0=self.coef0, n_components=n_components,
+                        random_state=self.random_state).fit(X)
+
+    def _map(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        return X if self.feature_map_ is None else self.feature_map_.transform(X)
+
+    @traced('fit', rows='X')
+    def fit(self, X, y):
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y)
+        self.classes_ = np.unique(y)
+        if len(self.classes_) != 2:
+            raise ValueError('ApproxKernelSVC only supports binary targets')
+        self.n_features_in_ = X.shape[1]
+        rng = np.random.default_rng(self.random_state)
+        self.feature_map_ = self._make_feature_map(X)
+
+        # Platt scaling on the SVM's own training rows would see overconfident margins,
+        # so its rows are held out from the linear fit when there are enough of them
+        X_calibration, y_calibration = X, y
+        n_calibration = min(self.calibration_rows, len(X) // 5)
+        if (self.probability and n_calibration >= _MIN_CALIBRATION_ROWS
+                and np.unique(y, return_counts=True)[1].min() >= 2):
+            X, X_calibration, y, y_calibration = train_test_split(
+                X, y, test_size=n_calibration, stratify=y, random_state=int(rng.integers(2 ** 31)))
+
+        # SVC minimizes ||w||^2 / 2 + C * sum(hinge); SGD minimizes alpha * ||w||^2 / 2 + mean(hinge)
+        self.linear_ = SGDClassifier(loss='hinge', alpha=1.0 / (self.C * len(X)), average=True,
+                                     random_state=self.random_state)
+        for _ in range(self.n_epochs):
+            order = rng.permutation(len(X))
+            for start in range(0, len(X), self.batch_size):
+                rows = order[start:start + self.batch_size]
+                self.linear_.partial_fit(self._map(X[rows]), y[rows], classes=self.classes_)
+
+        if self.probability:
+            decision = self.decision_function(X_calibration).reshape(-1, 1)
+            self.calibrator_ = LogisticRegression().fit(decision, y_calibration == self.classes_[1])
+        return self
+
+    def decision_function(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if len(X) == 0:
+            return np.empty(0)
+        return np.concatenate([self.linear_.decision_function(self._map(X[start:start + self.batch_size]))
+                               for start in range(0, len(X), self.batch_size)])
+
+    @traced('predict', rows='X')
+    def predict(self, X):
+        return self.classes_[(self.decision_function(X) > 0).astype(int)]
+
+    @traced('predict', rows='X')
+    def predict_proba(self, X):
+        if not self.probability:
+            raise AttributeError('predict_proba is only available when probability=True')
+        positive = self.calibrator_.predict_proba(self.decision_function(X).reshape(-1, 1))[:, 1]
+        return np.column_stack([1.0 - positive, positive])
+
+
+def benchmark_approx_svc(X, y, sizes=(10_000, 100_000, 1_000_000), exact_max_rows=100_000, params=None,
+                         random_state=42):
+    """
+    Compares fit time and accuracy of SVC and ApproxKernelSVC as the data grows.
+
+    The given data is evaluated first; the larger sizes are drawn from a
+    synthetic classification set with the same number of features. The exact
+    SVC is skipped (NaN) on training sets larger than exact_max_rows.
+
+    Parameters:
+    - X, y: Feature matrix and targets (e.g. the PCA features of the SVM path).
+    - sizes: Synthetic dataset sizes.
+    - exact_max_rows: Largest training set the exact SVC is fitted on.
+    - params: Shared C/gamma/kernel parameters (e.g. best_params_svc).
+    - random_state: Seed.
+
+    Returns:
+    - DataFrame with one row per (dataset, rows) holding both fit times, both
+      accuracies and the accuracy gap (exact minus approximate).
+    """
+    from sklearn.datasets import make_classification
+
+    params = dict(params or {})
+    datasets = [('ai4i2020', np.asarray(X, dtype=np.float64), np.asarray(y))]
+    for size in sizes:
+        X_synthetic, y_synthetic = make_classification(n_samples=size, n_features=np.shape(X)[1],
+                                                       n_informative=np.shape(X)[1], n_redundant=0,
+                                                       random_state=random_state)
+        datasets.append(('synthetic', X_synthetic, y_synthetic))
+
+    rows = []
+    for name, features, target in datasets:
+        X_train, X_test, y_train, y_test = train_test_split(features, target, test_size=0.2, random_state=random_state)
+        row = {'dataset': name, 'rows': len(X_train)}
+        candidates = {'exact': SVC(random_state=random_state, **params),
+                      'approx': ApproxKernelSVC(random_state=random_state, **params)}
+        for method, model in candidates.items():
+            if method == 'exact' and len(X_train) > exact_max_rows:
+                row[f'{method}_fit_seconds'] = row[f'{method}_accuracy'] = np.nan
+                continue
+            start = time.perf_counter()
+            model.fit(X_train, y_train)
+            row[f'{method}_fit_seconds'] = time.perf_counter() - start
+            row[f'{method}_accuracy'] = float(np.mean(model.predict(X_test) == y_test))
+        row['accuracy_gap'] = row['exact_accuracy'] - row['approx_accuracy']
+        rows.append(row)
+    return pd.DataFrame(rows)
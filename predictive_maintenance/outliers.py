@@ -0,0 +1,183 @@
+"""
+IQR based outlier removal over several columns at once.
+
+The exact mode computes every quartile in one quantile call and filters the
+frame with one combined boolean mask. The streaming mode estimates the
+quartiles with a mergeable KLL quantile sketch per column, so the bounds can be
+computed over data that is only ever seen one chunk at a time.
+"""
+import numpy as np
+
+from predictive_maintenance.tracing import traced
+
+
+class KLLSketch:
+    """
+    Mergeable streaming quantile sketch (KLL).
+
+    Items live in a stack of compactors; an item at level h stands for 2**h
+    original values. When a level grows past its capacity it is sorted and
+    every second item (random offset) is promoted to the level above, so the
+    memory stays O(k log(n / k)) while rank errors stay around 1 / k.
+
+    Parameters:
+    - k: Capacity of the top compactor; larger values give tighter estimates.
+    - seed: Seed for the compaction offsets.
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.count = 0
+        self._rng = np.random.default_rng(seed)
+        self._levels = [np.empty(0, dtype=np.float64)]
+
+    def _capacity(self, level):
+        depth = len(self._levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self._levels):
+            items = self._levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self._levels):
+                    self._levels.append(np.empty(0, dtype=np.float64))
+                items = np.sort(items)
+                # An odd item out stays at this level, the rest is halved
+                leftover = len(items) % 2
+                promoted = items[leftover:][self._rng.integers(2)::2]
+                self._levels[level + 1] = np.concatenate((self._levels[level + 1], promoted))
+                self._levels[level] = items[:leftover]
+            level += 1
+
+    def update(self, values):
+        """
+        Adds a batch of values to the sketch (NaNs are ignored).
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        self.count += len(values)
+        self._levels[0] = np.concatenate((self._levels[0], values))
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """
+        Folds another sketch into this one, e.g. one built on another chunk or worker.
+        """
+        while len(self._levels) < len(other._levels):
+            self._levels.append(np.empty(0, dtype=np.float64))
+        for level, items in enumerate(other._levels):
+            self._levels[level] = np.concatenate((self._levels[level], items))
+        self.count += other.count
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        """
+        Estimates one or more quantiles (q in [0, 1]).
+        """
+        items = np.concatenate(self._levels)
+        if len(items) == 0:
+            return np.full(np.shape(q), np.nan)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self._levels)])
+        order = np.argsort(items, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        ranks = np.asarray(q, dtype=np.float64) * cumulative[-1]
+        positions = np.minimum(np.searchsorted(cumulative, ranks, side='left'), len(items) - 1)
+        return items[order][positions]
+
+
+def _bounds_from_quartiles(q1, q3, whisker):
+    iqr = q3 - q1
+    return q1 - whisker * iqr, q3 + whisker * iqr
+
+
+def iqr_bounds(df, columns, whisker=1.5):
+    """
+    Computes exact IQR bounds for several columns in one pass.
+
+    Parameters:
+    - df: DataFrame holding the columns.
+    - columns: List of column names.
+    - whisker: IQR multiplier (1.5 gives the usual box plot whiskers).
+
+    Returns:
+    - Dictionary mapping each column to its (lower_bound, upper_bound).
+    """
+    quartiles = df[list(columns)].quantile([0.25, 0.75])
+    return {
+        column: _bounds_from_quartiles(quartiles.at[0.25, column], quartiles.at[0.75, column], whisker)
+        for column in columns
+    }
+
+
+def streaming_iqr_bounds(chunks, columns, whisker=1.5, k=200, seed=None):
+    """
+    Estimates IQR bounds from an iterable of chunks with one KLL sketch per column.
+
+    Only one chunk is held in memory at a time. For chunks processed on
+    different workers, build the sketches there and combine them with
+    KLLSketch.merge before reading the quartiles.
+
+    Parameters:
+    - chunks: Iterable of DataFrames containing the columns.
+    - columns: List of column names.
+    - whisker: IQR multiplier.
+    - k: Sketch accuracy parameter.
+    - seed: Seed for the sketches' compaction offsets.
+
+    Returns:
+    - Dictionary mapping each column to its (lower_bound, upper_bound).
+    """
+    sketches = {column: KLLSketch(k=k, seed=seed) for column in columns}
+    for chunk in chunks:
+        for column in columns:
+            sketches[column].update(chunk[column].to_numpy())
+    bounds = {}
+    for column, sketch in sketches.items():
+        q1, q3 = sketch.quantile([0.25, 0.75])
+        bounds[column] = _bounds_from_quartiles(q1, q3, whisker)
+    return bounds
+
+
+def outlier_mask(df, bounds):
+    """
+    Returns a boolean mask of the rows that fall inside every column's bounds.
+    """
+    mask = np.ones(len(df), dtype=bool)
+    for column, (lower_bound, upper_bound) in bounds.items():
+        values = df[column].to_numpy()
+        np.logical_and(mask, values >= lower_bound, out=mask)
+        np.logical_and(mask, values <= upper_bound, out=mask)
+    return mask
+
+
+@traced('outlier_removal', rows='df')
+def remove_outliers(df, columns, bounds=None, whisker=1.5):
+    """
+    Removes the rows outside the IQR bounds of any of the given columns.
+
+    Parameters:
+    - df: DataFrame to filter.
+    - columns: Column name or list of column names.
+    - bounds: Optional precomputed bounds (e.g. from streaming_iqr_bounds);
+      computed exactly from df when omitted.
+    - whisker: IQR multiplier.
+
+    Returns:
+    - Filtered DataFrame (a single copy of the surviving rows).
+    """
+    if isinstance(columns, str):
+        columns = [columns]
+    if bounds is None:
+        bounds = iqr_bounds(df, columns, whisker=whisker)
+    return df[outlier_mask(df, {column: bounds[column] for column in columns})]
+
+
+def remove_outliers_chunked(chunks, columns, bounds):
+    """
+    Lazily filters an iterable of chunks with precomputed bounds.
+    """
+    for chunk in chunks:
+        yield remove_outliers(chunk, columns, bounds=bounds)
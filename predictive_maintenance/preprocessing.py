@@ -0,0 +1,187 @@
+"""
+Out-of-core MinMax scaling and PCA.
+
+MinMax scaling is an affine map per feature, so the mean and covariance of the
+scaled data follow directly from the mean and covariance of the raw data. One
+pass over the chunks therefore gathers everything both stages need: per-feature
+min/max and a numerically stable (Chan et al.) running mean and co-moment
+matrix. A second pass transforms chunk by chunk into a preallocated
+memory-mapped array.
+"""
+import numpy as np
+
+from predictive_maintenance.tracing import traced
+
+
+def iter_array_chunks(X, chunksize=1_000_000):
+    """
+    Yields consecutive row blocks of an array or DataFrame.
+    """
+    for start in range(0, len(X), chunksize):
+        yield X[start:start + chunksize]
+
+
+class StreamingScalerPCA:
+    """
+    MinMax scaler followed by PCA, fitted over an iterable of chunks.
+
+    The fitted state is a handful of small arrays, saved with save() and
+    restored with load(), so serving applies exactly the training transform.
+
+    Parameters:
+    - n_components: Number of principal components to keep.
+    - feature_range: Target range of the MinMax scaling.
+    - dtype: Dtype of the transformed output.
+    """
+
+    def __init__(self, n_components=2, feature_range=(0, 1), dtype=np.float32):
+        self.n_components = n_components
+        self.feature_range = feature_range
+        self.dtype = np.dtype(dtype)
+        self.n_samples_seen_ = 0
+
+    def partial_fit(self, X):
+        """
+        Updates the running statistics with one chunk of rows.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if len(X) == 0:
+            return self
+        n_b = len(X)
+        mean_b = X.mean(axis=0)
+        centered = X - mean_b
+        m2_b = centered.T @ centered
+
+        if self.n_samples_seen_ == 0:
+            self.data_min_ = X.min(axis=0)
+            self.data_max_ = X.max(axis=0)
+            self._mean = mean_b
+            self._m2 = m2_b
+        else:
+            n_a = self.n_samples_seen_
+            n = n_a + n_b
+            delta = mean_b - self._mean
+            np.minimum(self.data_min_, X.min(axis=0), out=self.data_min_)
+            np.maximum(self.data_max_, X.max(axis=0), out=self.data_max_)
+            self._m2 = self._m2 + m2_b + np.outer(delta, delta) * (n_a * n_b / n)
+            self._mean = self._mean + delta * (n_b / n)
+        self.n_samples_seen_ += n_b
+        return self
+
+    @traced('scaling_pca', result_rows=lambda fitted: fitted.n_samples_seen_)
+    def fit(self, chunks):
+        """
+        Fits scaler and PCA in a single pass over an iterable of chunks.
+        """
+        for chunk in chunks:
+            self.partial_fit(chunk)
+        return self._finalize()
+
+    def _finalize(self):
+        low, high = self.feature_range
+        data_range = self.data_max_ - self.data_min_
+        # Constant features keep a unit scale, as in MinMaxScaler
+        data_range[data_range == 0.0] = 1.0
+        self.scale_ = (high - low) / data_range
+        self.min_ = low - self.data_min_ * self.scale_
+
+        # Mean and covariance of the scaled data
+        self.mean_ = self._mean * self.scale_ + self.min_
+        covariance = self._m2 / max(self.n_samples_seen_ - 1, 1) * np.outer(self.scale_, self.scale_)
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        order = np.argsort(eigenvalues)[::-1][:self.n_components]
+        components = eigenvectors[:, order].T
+        # Same sign convention as sklearn's PCA: largest loading of each component is positive
+        signs = np.sign(components[np.arange(len(components)), np.argmax(np.abs(components), axis=1)])
+        signs[signs == 0] = 1.0
+        self.components_ = components * signs[:, np.newaxis]
+        self.explained_variance_ = np.clip(eigenvalues[order], 0.0, None)
+        total_variance = np.clip(eigenvalues, 0.0, None).sum()
+        self.explained_variance_ratio_ = self.explained_variance_ / total_variance if total_variance > 0 else self.explained_variance_
+        return self
+
+    @traced('scaling_pca', rows='X')
+    def scale(self, X):
+        """
+        Applies the MinMax scaling only.
+        """
+        return (np.asarray(X, dtype=np.float64) * self.scale_ + self.min_).astype(self.dtype, copy=False)
+
+    @traced('scaling_pca', rows='X_scaled')
+    def project(self, X_scaled):
+        """
+        Projects already scaled rows onto the principal components.
+        """
+        return ((np.asarray(X_scaled, dtype=np.float64) - self.mean_) @ self.components_.T).astype(self.dtype, copy=False)
+
+    @traced('scaling_pca', rows='X')
+    def transform(self, X):
+        """
+        Applies the MinMax scaling followed by the PCA projection.
+        """
+        X = np.asarray(X, dtype=np.float64) * self.scale_ + self.min_
+        X -= self.mean_
+        return (X @ self.components_.T).astype(self.dtype, copy=False)
+
+    def transform_to_memmap(self, chunks, path, n_rows=None):
+        """
+        Transforms chunk by chunk into a preallocated .npy memory map.
+
+        Parameters:
+        - chunks: Iterable of raw feature chunks, in row order.
+        - path: Output .npy file.
+        - n_rows: Total number of rows (defaults to the number seen during fit).
+
+        Returns:
+        - The output np.memmap of shape (n_rows, n_components).
+        """
+        if n_rows is None:
+            n_rows = self.n_samples_seen_
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=self.dtype, shape=(n_rows, len(self.components_)))
+        start = 0
+        for chunk in chunks:
+            stop = start + len(chunk)
+            out[start:stop] = self.transform(chunk)
+            start = stop
+        if start != n_rows:
+            raise ValueError(f'Expected {n_rows} rows, got {start}')
+        out.flush()
+        return out
+
+    _STATE = ('data_min_', 'data_max_', 'scale_', 'min_', 'mean_', 'components_',
+              'explained_variance_', 'explained_variance_ratio_')
+
+    def state(self):
+        """
+        Returns the fitted state as a dictionary of arrays.
+        """
+        return {'feature_range': np.asarray(self.feature_range, dtype=np.float64),
+                'n_samples_seen': np.asarray(self.n_samples_seen_), 'dtype': np.asarray(self.dtype.str),
+                **{name: getattr(self, name) for name in self._STATE}}
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        Rebuilds a fitted preprocessor from state(); the arrays are used as given (e.g. memory-mapped).
+        """
+        preprocessor = cls(n_components=len(state['components_']),
+                           feature_range=tuple(np.asarray(state['feature_range']).tolist()),
+                           dtype=str(state['dtype']))
+        preprocessor.n_samples_seen_ = int(state['n_samples_seen'])
+        for name in cls._STATE:
+            setattr(preprocessor, name, state[name])
+        return preprocessor
+
+    def save(self, path):
+        """
+        Saves the fitted state to an .npz file.
+        """
+        np.savez(path, **self.state())
+
+    @classmethod
+    def load(cls, path):
+        """
+        Restores a preprocessor saved with save().
+        """
+        with np.load(path) as state:
+            return cls.from_state({name: state[name] for name in state.files})
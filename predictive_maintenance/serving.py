@@ -0,0 +1,344 @@
+"""
+Micro-batching inference service for the scaler -> PCA -> base model -> NN hybrid.
+
+Concurrent requests are queued and combined into micro-batches (bounded by a
+maximum batch size and a maximum wait), and every batch goes through the whole
+pipeline in one vectorized pass. The service speaks minimal HTTP/1.1 with
+keep-alive over TCP or a Unix socket and only needs the standard library:
+
+    POST /score    {"rows": [[...], ...]} or {"features": {...}} -> {"failure_probability": [...]}
+    GET  /metrics  latency percentiles, throughput and batch counters
+
+Start it from a saved pipeline directory or from a model bundle (see
+predictive_maintenance.bundle) with:
+
+    python -m predictive_maintenance.serving serving/hybrid_rf --port 8080
+    python -m predictive_maintenance.serving serving/pipeline.bundle --pipeline rf --port 8080
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from predictive_maintenance.data import FEATURE_COLUMNS
+from predictive_maintenance.preprocessing import StreamingScalerPCA
+from predictive_maintenance.tracing import traced
+
+
+class HybridPipeline:
+    """
+    Fitted scaler/PCA, base model and network head applied as one function.
+
+    Parameters:
+    - preprocessor: Fitted StreamingScalerPCA.
+    - base_model: Fitted classifier with predict_proba (e.g. Prmain_rf).
+    - head: Network trained on [PCA features, base model probability] (e.g. model_rf).
+    - feature_columns: Names of the raw input columns, in order.
+    """
+
+    def __init__(self, preprocessor, base_model, head, feature_columns=FEATURE_COLUMNS):
+        self.preprocessor = preprocessor
+        self.base_model = base_model
+        self.head = head
+        self.feature_columns = list(feature_columns)
+
+    @traced('predict', rows='X')
+    def predict_proba(self, X):
+        """
+        Returns the failure probability of every raw feature row.
+        """
+        features = self.preprocessor.transform(X)
+        stacked = np.empty((len(features), features.shape[1] + 1), dtype=np.float32)
+        stacked[:, :-1] = features
+        stacked[:, -1] = self.base_model.predict_proba(features)[:, 1]
+        if hasattr(self.head, 'predict_on_batch'):
+            # Skips the per-call setup of Keras' predict() for small batches
+            return np.asarray(self.head.predict_on_batch(stacked)).reshape(-1)
+        return np.asarray(self.head.predict(stacked)).reshape(-1)
+
+    def save(self, directory):
+        """
+        Saves the three fitted stages into a directory.
+        """
+        import joblib
+
+        os.makedirs(directory, exist_ok=True)
+        self.preprocessor.save(os.path.join(directory, 'preprocessor.npz'))
+        joblib.dump(self.base_model, os.path.join(directory, 'base_model.joblib'))
+        self.head.save(os.path.join(directory, 'head.keras'))
+        with open(os.path.join(directory, 'features.json'), 'w') as f:
+            json.dump(self.feature_columns, f)
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Loads a pipeline saved with save().
+        """
+        import joblib
+        from tensorflow.keras.models import load_model
+
+        with open(os.path.join(directory, 'features.json')) as f:
+            feature_columns = json.load(f)
+        return cls(StreamingScalerPCA.load(os.path.join(directory, 'preprocessor.npz')),
+                   joblib.load(os.path.join(directory, 'base_model.joblib')),
+                   load_model(os.path.join(directory, 'head.keras')),
+                   feature_columns)
+
+
+class LatencyStats:
+    """
+    Rolling request latency percentiles plus throughput counters.
+
+    Parameters:
+    - window: Number of most recent requests the percentiles are computed over.
+    """
+
+    def __init__(self, window=10_000):
+        self.latencies = deque(maxlen=window)
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+        self.batch_rows = 0
+
+    def record_request(self, seconds, n_rows):
+        self.latencies.append(seconds)
+        self.requests += 1
+        self.rows += n_rows
+
+    def record_batch(self, n_rows):
+        self.batches += 1
+        self.batch_rows += n_rows
+
+    def snapshot(self):
+        """
+        Returns the current counters as a JSON-serializable dictionary.
+        """
+        elapsed = time.perf_counter() - self.started
+        latencies_ms = np.asarray(self.latencies) * 1000.0
+        p50, p99 = np.percentile(latencies_ms, [50, 99]) if len(latencies_ms) else (0.0, 0.0)
+        return {
+            'requests': self.requests,
+            'rows': self.rows,
+            'batches': self.batches,
+            'mean_batch_rows': self.batch_rows / self.batches if self.batches else 0.0,
+            'p50_ms': float(p50),
+            'p99_ms': float(p99),
+            'requests_per_second': self.requests / elapsed if elapsed > 0 else 0.0,
+            'rows_per_second': self.rows / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+class MicroBatcher:
+    """
+    Collects concurrent scoring requests into micro-batches.
+
+    A batch is dispatched as soon as it holds max_batch_size rows or the
+    oldest queued request has waited max_wait_ms. The pipeline runs on a
+    single background thread so the event loop keeps accepting requests.
+
+    Parameters:
+    - pipeline: Object with a vectorized predict_proba(X) method.
+    - max_batch_size: Maximum number of rows per batch.
+    - max_wait_ms: Maximum time a request waits for more rows to arrive.
+    """
+
+    def __init__(self, pipeline, max_batch_size=256, max_wait_ms=2.0):
+        self.pipeline = pipeline
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.stats = LatencyStats()
+        self._queue = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._worker = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+        self._executor.shutdown(wait=False)
+
+    async def score(self, rows):
+        """
+        Scores a (n_rows, n_features) block and returns its failure probabilities.
+        """
+        start = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((rows, future))
+        result = await future
+        self.stats.record_request(time.perf_counter() - start, len(rows))
+        return result
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self._queue.get()]
+            n_rows = len(pending[0][0])
+            deadline = loop.time() + self.max_wait
+            while n_rows < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(item)
+                n_rows += len(item[0])
+
+            batch = np.concatenate([rows for rows, _ in pending]) if len(pending) > 1 else pending[0][0]
+            try:
+                probabilities = await loop.run_in_executor(self._executor, self.pipeline.predict_proba, batch)
+            except Exception as error:
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            self.stats.record_batch(len(batch))
+            offset = 0
+            for rows, future in pending:
+                if not future.done():
+                    future.set_result(probabilities[offset:offset + len(rows)])
+                offset += len(rows)
+
+
+def _parse_rows(payload, feature_columns):
+    if 'features' in payload:
+        rows = [payload['features']]
+    else:
+        rows = payload['rows']
+    rows = [[row[column] for column in feature_columns] if isinstance(row, dict) else row for row in rows]
+    X = np.asarray(rows, dtype=np.float32)
+    if X.ndim != 2 or X.shape[1] != len(feature_columns):
+        raise ValueError(f'Expected rows of {len(feature_columns)} features: {feature_columns}')
+    return X
+
+
+async def _respond(writer, status, body, close=False):
+    data = json.dumps(body).encode()
+    connection = 'Connection: close\r\n' if close else ''
+    writer.write(f'HTTP/1.1 {status}\r\nContent-Type: application/json\r\n{connection}'
+                 f'Content-Length: {len(data)}\r\n\r\n'.encode() + data)
+    await writer.drain()
+
+
+async def _read_request(reader, request_line):
+    # Reads the headers and body following request_line; a malformed request line or
+    # Content-Length raises ValueError once the headers have been consumed
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    parts = request_line.decode('latin-1').split(' ', 2)
+    if len(parts) != 3:
+        raise ValueError(f'Malformed request line: {request_line.strip()!r}')
+    method, path, _ = parts
+    try:
+        content_length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise ValueError(f'Invalid Content-Length: {headers["content-length"]!r}') from None
+    if content_length < 0:
+        raise ValueError(f'Invalid Content-Length: {content_length}')
+    return method, path, headers, await reader.readexactly(content_length)
+
+
+def _make_handler(batcher, feature_columns):
+    async def handle(reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, headers, body = await _read_request(reader, request_line)
+                except ValueError as error:
+                    # Without valid framing the rest of the stream cannot be trusted
+                    await _respond(writer, '400 Bad Request', {'error': str(error)}, close=True)
+                    break
+
+                if method == 'GET' and path == '/metrics':
+                    await _respond(writer, '200 OK', batcher.stats.snapshot())
+                elif method == 'POST' and path == '/score':
+                    try:
+                        X = _parse_rows(json.loads(body), feature_columns)
+                    except (ValueError, KeyError, TypeError) as error:
+                        await _respond(writer, '400 Bad Request', {'error': str(error)})
+                    else:
+                        try:
+                            probabilities = await batcher.score(X)
+                        except Exception as error:
+                            await _respond(writer, '500 Internal Server Error',
+                                           {'error': f'{type(error).__name__}: {error}'})
+                        else:
+                            await _respond(writer, '200 OK', {'failure_probability': probabilities.tolist()})
+                else:
+                    await _respond(writer, '404 Not Found', {'error': f'{method} {path}'})
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def serve_async(pipeline, host='127.0.0.1', port=8080, unix_socket=None, max_batch_size=256, max_wait_ms=2.0):
+    """
+    Runs the scoring service until cancelled.
+
+    Parameters:
+    - pipeline: HybridPipeline (or any object with predict_proba and feature_columns).
+    - host, port: TCP address to listen on (ignored when unix_socket is given).
+    - unix_socket: Optional path of a Unix domain socket to listen on instead.
+    - max_batch_size: Maximum number of rows per micro-batch.
+    - max_wait_ms: Maximum time a request waits for a batch to fill.
+    """
+    batcher = MicroBatcher(pipeline, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    batcher.start()
+    handler = _make_handler(batcher, pipeline.feature_columns)
+    if unix_socket is not None:
+        server = await asyncio.start_unix_server(handler, path=unix_socket)
+    else:
+        server = await asyncio.start_server(handler, host=host, port=port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await batcher.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve failure probabilities from a saved hybrid pipeline.')
+    parser.add_argument('pipeline_dir', help='Directory written by HybridPipeline.save, or a bundle file')
+    parser.add_argument('--pipeline', default='rf', help='Pipeline to serve from a bundle file')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix-socket', default=None)
+    parser.add_argument('--max-batch-size', type=int, default=256)
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    args = parser.parse_args(argv)
+
+    if os.path.isfile(args.pipeline_dir):
+        from predictive_maintenance.bundle import load_bundle
+
+        pipeline = load_bundle(args.pipeline_dir).pipeline(args.pipeline)
+    else:
+        pipeline = HybridPipeline.load(args.pipeline_dir)
+    asyncio.run(serve_async(pipeline, host=args.host, port=args.port, unix_socket=args.unix_socket,
+                            max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms))
+
+
+if __name__ == '__main__':
+    main()
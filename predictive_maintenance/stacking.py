@@ -0,0 +1,243 @@
+"""
+Parallel stacking engine for the hybrid base model + neural network models.
+
+Every hybrid model follows the same recipe: fit a base estimator on the PCA
+features, append its failure probability as an extra column and train a small
+neural network on the result. The column appended to the training rows comes
+from k-fold out-of-fold predictions, so the network never sees probabilities a
+base model produced for rows it was trained on; the test rows get the
+probabilities of a base model refitted on the whole training set.
+
+The (base model, fold) fits are independent, so they run concurrently in a
+process pool. The training and test matrices are placed in shared memory once
+and every worker attaches to them instead of receiving its own pickled copy.
+Finished base models are stored in an on-disk cache keyed by a hash of the
+data, the estimator parameters and the fold setup, so changing only the
+network head never refits them. The stacked network inputs for all base
+models are then written into one preallocated array.
+"""
+import hashlib
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.model_selection import StratifiedKFold
+
+from predictive_maintenance.resampling import _resolve_n_jobs
+from predictive_maintenance.tracing import traced
+
+
+def data_fingerprint(*arrays):
+    """
+    Returns a SHA-256 hex digest of the shape, dtype and content of arrays.
+    """
+    digest = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f'{array.dtype.str}{array.shape}'.encode())
+        digest.update(memoryview(array).cast('B'))
+    return digest.hexdigest()
+
+
+def estimator_fingerprint(estimator):
+    """
+    Returns a SHA-256 hex digest of an estimator's class and parameters.
+    """
+    params = sorted((name, repr(value)) for name, value in estimator.get_params(deep=True).items())
+    description = f'{type(estimator).__module__}.{type(estimator).__qualname__}{params}'
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+def _share(array):
+    array = np.ascontiguousarray(array)
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+
+def _attach(spec):
+    name, shape, dtype = spec
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+
+def _positive_proba(estimator, X):
+    return estimator.predict_proba(X)[:, 1]
+
+
+def _fit_task(estimator, train_index, X_train, y_train, X_test):
+    start = time.perf_counter()
+    if train_index is None:
+        estimator.fit(X_train, y_train)
+        result = {'estimator': estimator, 'test_pred': _positive_proba(estimator, X_test)}
+    else:
+        held_out = np.ones(len(y_train), dtype=bool)
+        held_out[train_index] = False
+        estimator.fit(X_train[train_index], y_train[train_index])
+        result = {'oof_pred': _positive_proba(estimator, X_train[held_out])}
+    result['fit_seconds'] = time.perf_counter() - start
+    # Serialize while the shared buffers are still mapped: estimators such as
+    # KNN keep a reference to their training data
+    return pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _run_task(estimator, train_index, specs):
+    blocks, arrays = [], []
+    try:
+        for spec in specs:
+            block, array = _attach(spec)
+            blocks.append(block)
+            arrays.append(array)
+            del array
+        return _fit_task(estimator, train_index, *arrays)
+    finally:
+        # A block cannot be closed while views of its buffer are alive
+        del estimator
+        arrays.clear()
+        for block in blocks:
+            block.close()
+
+
+def _cache_path(cache_dir, key):
+    return os.path.join(cache_dir, f'{key}.joblib')
+
+
+@traced('fit', rows='X_train')
+def fit_base_models(estimators, X_train, y_train, X_test, n_jobs=None, n_splits=5, fold_seed=42,
+                    cache_dir=None):
+    """
+    Fits several base estimators concurrently and returns their stacking features.
+
+    Parameters:
+    - estimators: Dictionary mapping a name to an unfitted estimator with predict_proba.
+    - X_train, y_train: Training data.
+    - X_test: Test features to predict on.
+    - n_jobs: Number of worker processes (-1 for all cores, None for one per task).
+    - n_splits: Number of stratified folds for the out-of-fold predictions.
+    - fold_seed: Seed of the fold assignment.
+    - cache_dir: Optional directory of cached results; base models whose data,
+      parameters and fold setup are unchanged are loaded instead of refitted.
+
+    Returns:
+    - Dictionary mapping each name to a dictionary with the 'estimator' fitted
+      on all training rows, the out-of-fold failure probabilities 'train_pred',
+      the test failure probabilities 'test_pred', the total 'fit_seconds' and
+      whether the result was 'cached'.
+    """
+    X_train = np.asarray(X_train)
+    y_train = np.asarray(y_train)
+    X_test = np.asarray(X_test)
+    data_key = data_fingerprint(X_train, y_train, X_test)
+    keys = {
+        name: hashlib.sha256(f'{data_key}{estimator_fingerprint(estimator)}{n_splits}{fold_seed}'.encode()).hexdigest()
+        for name, estimator in estimators.items()
+    }
+
+    results = {}
+    if cache_dir is not None:
+        for name, key in keys.items():
+            if os.path.exists(_cache_path(cache_dir, key)):
+                results[name] = joblib.load(_cache_path(cache_dir, key))
+                results[name]['cached'] = True
+    pending = [name for name in estimators if name not in results]
+    if not pending:
+        return {name: results[name] for name in estimators}
+
+    folds = list(StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=fold_seed).split(X_train, y_train))
+    # One task per (model, fold) plus one full refit per model
+    tasks = [(name, fold) for name in pending for fold in [None] + list(range(n_splits))]
+    n_workers = len(tasks) if n_jobs is None else min(_resolve_n_jobs(n_jobs), len(tasks))
+
+    blocks = []
+    try:
+        specs = []
+        for array in (X_train, y_train, X_test):
+            block, spec = _share(array)
+            blocks.append(block)
+            specs.append(spec)
+        with ProcessPoolExecutor(max_workers=max(n_workers, 1)) as pool:
+            futures = [
+                pool.submit(_run_task, clone(estimators[name]), None if fold is None else folds[fold][0], specs)
+                for name, fold in tasks
+            ]
+            payloads = [pickle.loads(future.result()) for future in futures]
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    for name in pending:
+        results[name] = {'train_pred': np.empty(len(y_train), dtype=np.float64), 'fit_seconds': 0.0, 'cached': False}
+    for (name, fold), payload in zip(tasks, payloads):
+        result = results[name]
+        result['fit_seconds'] += payload['fit_seconds']
+        if fold is None:
+            result['estimator'] = payload['estimator']
+            result['test_pred'] = payload['test_pred']
+        else:
+            result['train_pred'][folds[fold][1]] = payload['oof_pred']
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        for name in pending:
+            entry = {key: value for key, value in results[name].items() if key != 'cached'}
+            # Write then rename, so an interrupted run never leaves a partial entry
+            temporary_path = _cache_path(cache_dir, keys[name]) + '.tmp'
+            joblib.dump(entry, temporary_path)
+            os.replace(temporary_path, _cache_path(cache_dir, keys[name]))
+    return {name: results[name] for name in estimators}
+
+
+def build_stacked_inputs(X, predictions, dtype=np.float32):
+    """
+    Builds the network inputs of every hybrid model in one preallocated array.
+
+    Parameters:
+    - X: Base features of shape (n_rows, n_features).
+    - predictions: Dictionary mapping a base model name to its predictions
+      (e.g. the 'train_pred' or 'test_pred' probabilities of fit_base_models).
+    - dtype: Dtype of the stacked array.
+
+    Returns:
+    - Dictionary mapping each name to a (n_rows, n_features + 1) view of a
+      single (n_models, n_rows, n_features + 1) array.
+    """
+    X = np.asarray(X)
+    stacked = np.empty((len(predictions), X.shape[0], X.shape[1] + 1), dtype=dtype)
+    stacked[:, :, :-1] = X
+    for i, values in enumerate(predictions.values()):
+        stacked[i, :, -1] = np.asarray(values).reshape(-1)
+    return dict(zip(predictions, stacked))
+
+
+def hybrid_summary(base_results, head_probabilities, y_true, threshold=0.5):
+    """
+    Tabulates base model and hybrid network results side by side.
+
+    Parameters:
+    - base_results: Output of fit_base_models.
+    - head_probabilities: Dictionary mapping the same names to the hybrid
+      network's predicted failure probabilities on the test set.
+    - y_true: Test labels.
+    - threshold: Probability cutoff for the base model and hybrid predictions.
+
+    Returns:
+    - DataFrame with one row per base model.
+    """
+    y_true = np.asarray(y_true).reshape(-1)
+    rows = []
+    for name, result in base_results.items():
+        head_pred = (np.asarray(head_probabilities[name]).reshape(-1) > threshold).astype(int)
+        rows.append({
+            'model': name,
+            'base_fit_seconds': result['fit_seconds'],
+            'base_accuracy': float(np.mean((np.asarray(result['test_pred']).reshape(-1) > threshold) == y_true)),
+            'hybrid_accuracy': float(np.mean(head_pred == y_true)),
+        })
+    return pd.DataFrame(rows).set_index('model')
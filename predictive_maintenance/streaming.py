@@ -0,0 +1,104 @@
+"""
+Balanced SMOTE minibatches generated on the fly for Keras training.
+
+Instead of materializing the oversampled dataset, every batch draws half of its
+rows from the majority class and half from the minority class, where minority
+rows are either original rows or fresh SMOTE interpolations built from a
+precomputed neighbour table. The mix of original and synthetic minority rows
+follows the composition of the dataset SMOTE would have produced, and every
+epoch sees new synthetic samples.
+
+This module imports TensorFlow; import it only where Keras training happens.
+"""
+import math
+
+import numpy as np
+import tensorflow as tf
+
+from predictive_maintenance.resampling import smote_neighbours
+
+
+class SMOTEBatchGenerator(tf.keras.utils.Sequence):
+    """
+    Keras dataset yielding balanced, SMOTE-augmented minibatches.
+
+    SMOTE only interpolates between rows, and MinMax scaling and PCA are affine
+    maps, so a neighbour table computed on the raw features can be reused with
+    X already scaled/projected: the synthetic rows then match what
+    SMOTE-then-transform would have produced.
+
+    Parameters:
+    - X: Feature matrix the model trains on (array or DataFrame).
+    - y: Binary target vector.
+    - neighbours: Optional (n_minority, k) neighbour table over the minority
+      rows of X, in their original order; computed from X when omitted.
+    - k_neighbors: Number of neighbours when the table is computed here.
+    - batch_size: Rows per batch (half majority, half minority).
+    - steps_per_epoch: Batches per epoch; defaults to the size of the
+      equivalent oversampled dataset divided by batch_size.
+    - transform: Optional callable applied to every feature batch, e.g. to
+      append base-model predictions for the hybrid networks.
+    - seed: Seed; batch contents depend only on (seed, epoch, batch index).
+    - **kwargs: Passed to the Keras base class (workers, use_multiprocessing, ...).
+    """
+
+    def __init__(self, X, y, neighbours=None, k_neighbors=5, batch_size=256, steps_per_epoch=None,
+                 transform=None, seed=42, **kwargs):
+        super().__init__(**kwargs)
+        X = np.asarray(X, dtype=np.float32)
+        y = np.asarray(y)
+        classes, counts = np.unique(y, return_counts=True)
+        if len(classes) != 2:
+            raise ValueError('SMOTEBatchGenerator expects a binary target')
+        self.minority_label, self.majority_label = classes[np.argsort(counts)]
+        self.X_min = X[y == self.minority_label]
+        self.X_maj = X[y == self.majority_label]
+        if neighbours is None:
+            neighbours = smote_neighbours(self.X_min, k_neighbors=k_neighbors)
+        if len(neighbours) != len(self.X_min):
+            raise ValueError('neighbours must have one row per minority sample')
+        self.neighbours = np.asarray(neighbours)
+        self.batch_size = batch_size
+        self.transform = transform
+        self.seed = seed
+        self.epoch = 0
+        # Share of original rows among the minority half of an oversampled dataset
+        self.original_fraction = len(self.X_min) / len(self.X_maj)
+        if steps_per_epoch is None:
+            steps_per_epoch = math.ceil(2 * len(self.X_maj) / batch_size)
+        self.steps_per_epoch = steps_per_epoch
+
+    def __len__(self):
+        return self.steps_per_epoch
+
+    def __getitem__(self, index):
+        rng = np.random.default_rng([self.seed, self.epoch, index])
+        n_majority = self.batch_size // 2
+        n_minority = self.batch_size - n_majority
+
+        X_batch = np.empty((self.batch_size, self.X_min.shape[1]), dtype=np.float32)
+        X_batch[:n_majority] = self.X_maj[rng.integers(len(self.X_maj), size=n_majority)]
+
+        minority = X_batch[n_majority:]
+        base = rng.integers(len(self.X_min), size=n_minority)
+        minority[:] = self.X_min[base]
+        synthetic = rng.random(n_minority) >= self.original_fraction
+        n_synthetic = int(synthetic.sum())
+        if n_synthetic:
+            rows = base[synthetic]
+            partners = self.neighbours[rows, rng.integers(self.neighbours.shape[1], size=n_synthetic)]
+            gaps = rng.random((n_synthetic, 1), dtype=np.float32)
+            minority[synthetic] += gaps * (self.X_min[partners] - self.X_min[rows])
+
+        y_batch = np.empty(self.batch_size, dtype=np.float32)
+        y_batch[:n_majority] = self.majority_label
+        y_batch[n_majority:] = self.minority_label
+
+        order = rng.permutation(self.batch_size)
+        X_batch, y_batch = X_batch[order], y_batch[order]
+        if self.transform is not None:
+            X_batch = np.asarray(self.transform(X_batch), dtype=np.float32)
+        return X_batch, y_batch
+
+    def on_epoch_end(self):
+        self.epoch += 1
@@ -0,0 +1,389 @@
+"""
+Stage-level tracing of the pipeline.
+
+Pipeline entry points (ingest, outlier removal, resampling, scaling/PCA,
+model fits and predictions, tuning, explanation, evaluation) are wrapped with
+@traced or stage(). While tracing is off, a wrapped call costs one global
+lookup and nothing is measured. Once enable_tracing() is called, every stage
+writes one record with its wall time, CPU time, peak resident memory, rows
+and rows/sec. Nested stages point to their parent.
+
+Records are appended as JSON lines, either in a flat format ('jsonl') or as
+OTLP/JSON trace export requests ('otlp', one request per line, the layout of
+the OpenTelemetry collector's file exporter), so they can be read with
+load_trace or fed to OpenTelemetry tooling without extra dependencies.
+"""
+import functools
+import inspect
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+FORMATS = ('jsonl', 'otlp')
+
+_tracer = None
+
+
+def _current_rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def _max_rss():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class PeakMemory:
+    """
+    Context manager tracking the peak resident memory of this process.
+
+    A background thread samples the current RSS; when the process-wide
+    maximum (ru_maxrss) grows inside the block, that exact maximum is used.
+    Memory of worker processes is not included. The result is in .peak (bytes).
+
+    Parameters:
+    - interval: Seconds between RSS samples.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, _current_rss() or 0)
+
+    def __enter__(self):
+        self._max_before = _max_rss()
+        self.peak = _current_rss() or 0
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _current_rss() or 0)
+        max_after = _max_rss()
+        if max_after > self._max_before:
+            self.peak = max_after
+        return False
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+class _Tracer:
+    def __init__(self, path, format, memory, service_name, trace_id):
+        if format not in FORMATS:
+            raise ValueError(f'Unknown trace format: {format}')
+        self.path = path
+        self.format = format
+        self.memory = memory
+        self.service_name = service_name
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def config(self):
+        return {'path': self.path, 'format': self.format, 'memory': self.memory,
+                'service_name': self.service_name, 'trace_id': self.trace_id}
+
+    def parents(self):
+        if not hasattr(self._local, 'parents'):
+            self._local.parents = []
+        return self._local.parents
+
+    def _otlp_line(self, record):
+        attributes = {'pid': record['pid'], **record['attributes']}
+        for key in ('wall_seconds', 'cpu_seconds', 'peak_rss_mb', 'rows', 'rows_per_second'):
+            if record[key] is not None:
+                attributes[f'pipeline.{key}'] = record[key]
+        span = {
+            'traceId': self.trace_id,
+            'spanId': record['span_id'],
+            'name': record['name'],
+            'kind': 1,
+            'startTimeUnixNano': str(record['start_unix_ns']),
+            'endTimeUnixNano': str(record['end_unix_ns']),
+            'attributes': [{'key': key, 'value': _otlp_value(value)} for key, value in attributes.items()],
+            'status': {'code': 2 if record['error'] else 1, 'message': record['error'] or ''},
+        }
+        if record['parent_id']:
+            span['parentSpanId'] = record['parent_id']
+        return {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': self.service_name}}]},
+            'scopeSpans': [{'scope': {'name': __name__}, 'spans': [span]}],
+        }]}
+
+    def write(self, record):
+        line = json.dumps(record if self.format == 'jsonl' else self._otlp_line(record), default=str) + '\n'
+        # One append per record, so records of several processes sharing the file stay whole
+        with self._lock, open(self.path, 'a') as f:
+            f.write(line)
+
+
+def enable_tracing(path='trace.jsonl', format='jsonl', memory=True, service_name='predictive_maintenance',
+                   trace_id=None):
+    """
+    Turns tracing on for this process; records are appended to path.
+
+    Parameters:
+    - path: File receiving one JSON line per stage.
+    - format: 'jsonl' (flat records) or 'otlp' (OTLP/JSON export requests).
+    - memory: Track the peak resident memory of every stage (one sampling thread per stage).
+    - service_name: service.name resource attribute of the OTLP records.
+    - trace_id: Trace id shared by all records (random by default; worker
+      processes pass the parent's id through tracing_config()).
+
+    Returns:
+    - The configuration dictionary, as returned by tracing_config().
+    """
+    global _tracer
+    _tracer = _Tracer(path, format, memory, service_name, trace_id)
+    return _tracer.config()
+
+
+def disable_tracing():
+    """
+    Turns tracing off; wrapped stages go back to plain calls.
+    """
+    global _tracer
+    _tracer = None
+
+
+def tracing_enabled():
+    return _tracer is not None
+
+
+def tracing_config():
+    """
+    Returns the keyword arguments of enable_tracing for the active tracer (None when off).
+
+    Pass them to enable_tracing in worker processes to append to the same trace.
+    """
+    return None if _tracer is None else _tracer.config()
+
+
+def record_span(name, start_unix_ns, end_unix_ns, rows=None, cpu_seconds=None, peak_rss_mb=None, parent_id=None,
+                span_id=None, error=None, **attributes):
+    """
+    Writes one already measured span (e.g. a Keras epoch) to the active trace.
+
+    Does nothing while tracing is off.
+    """
+    tracer = _tracer
+    if tracer is None:
+        return
+    wall_seconds = (end_unix_ns - start_unix_ns) / 1e9
+    if parent_id is None:
+        parents = tracer.parents()
+        parent_id = parents[-1] if parents else None
+    tracer.write({
+        'name': name,
+        'trace_id': tracer.trace_id,
+        'span_id': span_id or os.urandom(8).hex(),
+        'parent_id': parent_id,
+        'pid': os.getpid(),
+        'start_unix_ns': start_unix_ns,
+        'end_unix_ns': end_unix_ns,
+        'wall_seconds': wall_seconds,
+        'cpu_seconds': cpu_seconds,
+        'peak_rss_mb': peak_rss_mb,
+        'rows': rows,
+        'rows_per_second': rows / wall_seconds if rows is not None and wall_seconds > 0 else None,
+        'error': error,
+        'attributes': attributes,
+    })
+
+
+class Span:
+    """
+    Handle of a running stage; rows and attributes may be set until it ends.
+    """
+
+    def __init__(self, name, rows, attributes):
+        self.name = name
+        self.rows = rows
+        self.attributes = attributes
+        self.span_id = os.urandom(8).hex()
+
+    def set_rows(self, rows):
+        self.rows = rows
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+
+class _NoopSpan:
+    def set_rows(self, rows):
+        pass
+
+    def set_attribute(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+@contextmanager
+def _measure(tracer, name, rows, attributes):
+    span = Span(name, rows, attributes)
+    parents = tracer.parents()
+    parent_id = parents[-1] if parents else None
+    parents.append(span.span_id)
+    memory = PeakMemory() if tracer.memory else None
+    error = None
+    if memory is not None:
+        memory.__enter__()
+    start_ns, start_cpu = time.time_ns(), time.process_time()
+    try:
+        yield span
+    except BaseException as exc:
+        error = f'{type(exc).__name__}: {exc}'
+        raise
+    finally:
+        end_ns, cpu_seconds = time.time_ns(), time.process_time() - start_cpu
+        if memory is not None:
+            memory.__exit__(None, None, None)
+        parents.pop()
+        record_span(name, start_ns, end_ns, rows=span.rows, cpu_seconds=cpu_seconds,
+                    peak_rss_mb=memory.peak / 2 ** 20 if memory is not None else None, parent_id=parent_id,
+                    span_id=span.span_id, error=error, **span.attributes)
+
+
+def stage(name, rows=None, **attributes):
+    """
+    Context manager recording one pipeline stage.
+
+    Usage: with stage('fit', rows=len(X_train), model='Prmain_ann') as span: ...
+
+    Parameters:
+    - name: Stage name.
+    - rows: Rows processed (for rows/sec); may also be set later with span.set_rows.
+    - attributes: Extra JSON-serializable attributes of the record.
+
+    Returns:
+    - Context manager yielding a Span (a shared no-op object while tracing is off).
+    """
+    tracer = _tracer
+    if tracer is None:
+        return _NOOP_SPAN
+    return _measure(tracer, name, rows, attributes)
+
+
+def _count_rows(value):
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+
+def traced(name, rows=None, result_rows=None, **attributes):
+    """
+    Decorator recording every call of a function as a stage.
+
+    Parameters:
+    - name: Stage name.
+    - rows: Name of the argument whose len() is the number of rows processed.
+    - result_rows: Function of the return value giving the number of rows
+      (used when the input is not sized, e.g. a path or an iterator of chunks).
+    - attributes: Extra attributes of every record.
+    """
+    def decorate(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            tracer = _tracer
+            if tracer is None:
+                return fn(*args, **kwargs)
+            n_rows = None
+            if rows is not None:
+                n_rows = _count_rows(signature.bind_partial(*args, **kwargs).arguments.get(rows))
+            details = dict(attributes, function=fn.__qualname__)
+            with _measure(tracer, name, n_rows, details) as span:
+                result = fn(*args, **kwargs)
+                if result_rows is not None:
+                    span.set_rows(result_rows(result))
+                return result
+        return wrapper
+    return decorate
+
+
+def load_trace(path):
+    """
+    Reads a trace file (either format) into a DataFrame with one row per record.
+    """
+    import pandas as pd
+
+    records = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'resourceSpans' not in record:
+                records.append({**{key: value for key, value in record.items() if key != 'attributes'},
+                                **record['attributes']})
+                continue
+            for resource_spans in record['resourceSpans']:
+                for scope_spans in resource_spans['scopeSpans']:
+                    for span in scope_spans['spans']:
+                        row = {'name': span['name'], 'trace_id': span['traceId'], 'span_id': span['spanId'],
+                               'parent_id': span.get('parentSpanId'),
+                               'start_unix_ns': int(span['startTimeUnixNano']),
+                               'end_unix_ns': int(span['endTimeUnixNano'])}
+                        for attribute in span['attributes']:
+                            value = next(iter(attribute['value'].values()))
+                            key = attribute['key']
+                            row[key.replace('pipeline.', '', 1)] = int(value) if 'intValue' in attribute['value'] else value
+                        records.append(row)
+    return pd.DataFrame(records)
+
+
+def _total(values):
+    # NaN rather than 0 when no span of the stage recorded the value
+    return values.sum(min_count=1)
+
+
+def summarize_trace(path):
+    """
+    Totals of a trace file per stage name: calls, wall and CPU seconds, peak memory and rows/sec.
+    """
+    trace = load_trace(path)
+    for column in ('cpu_seconds', 'peak_rss_mb', 'rows'):
+        if column not in trace:
+            trace[column] = None
+    trace[['wall_seconds', 'cpu_seconds', 'peak_rss_mb', 'rows']] = trace[
+        ['wall_seconds', 'cpu_seconds', 'peak_rss_mb', 'rows']].astype(float)
+    summary = trace.groupby('name').agg(calls=('name', 'size'), wall_seconds=('wall_seconds', 'sum'),
+                                        cpu_seconds=('cpu_seconds', _total), peak_rss_mb=('peak_rss_mb', 'max'),
+                                        rows=('rows', _total))
+    summary['rows_per_second'] = summary['rows'] / summary['wall_seconds']
+    return summary.sort_values('wall_seconds', ascending=False)
@@ -0,0 +1,248 @@
+"""
+Exact path-dependent TreeSHAP attributions for tree ensembles.
+
+For one leaf of one tree, the SHAP contribution of every feature on its path
+depends on the row only through which of those features the row "agrees"
+with (satisfies all of the path's splits on that feature). With at most u
+distinct features on a path there are 2^u such patterns, so every leaf's
+contributions are tabulated once per pattern (the leaf-table formulation of
+Fast TreeSHAP). Explaining a batch of rows then only needs:
+
+- one vectorized pass down each tree level to get every row's pattern at every leaf,
+- a table lookup per (leaf, row),
+- one matrix product that sums the looked-up contributions per feature.
+
+Contributions are exact Shapley values of the path-dependent expectation
+(the same values as the recursive TreeSHAP algorithm), use the trees' own
+training covers and are deterministic. For each row they sum to
+predict_proba(X)[:, label] minus the expected value. Trees are processed in
+parallel worker processes and rows in batches.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, effective_n_jobs
+
+from predictive_maintenance.tracing import traced
+
+_MAX_PATH_FEATURES = 20
+_MAX_INDEX_MAP_FEATURES = 12
+# Disagreement masks are int64 bit sets with one bit per feature (the sign bit stays unused)
+_MAX_MASK_FEATURES = 62
+
+
+def _leaf_paths(tree):
+    """
+    Returns, for every leaf, its node id and the (feature, cover fraction) of every split on its path.
+    """
+    left, right = tree.children_left, tree.children_right
+    cover = tree.weighted_n_node_samples
+    paths = []
+    stack = [(0, [])]
+    while stack:
+        node, path = stack.pop()
+        if left[node] == -1:
+            paths.append((node, path))
+            continue
+        feature = tree.feature[node]
+        stack.append((left[node], path + [(feature, cover[left[node]] / cover[node])]))
+        stack.append((right[node], path + [(feature, cover[right[node]] / cover[node])]))
+    return paths
+
+
+def _pattern_contributions(z, values):
+    """
+    Tabulates SHAP contributions of a group of leaves with u path features each.
+
+    z is (n_leaves, u) with the product of cover fractions per path feature and
+    values the leaf values. Returns (n_leaves, 2^u, u), where pattern p has bit
+    s set when the row agrees with the path on feature slot s.
+    """
+    n_leaves, u = z.shape
+    patterns = (np.arange(2 ** u)[:, None] >> np.arange(u)) & 1
+    one = np.broadcast_to(patterns, (n_leaves, 2 ** u, u)).astype(np.float64)
+    zero = np.broadcast_to(z[:, None, :], one.shape)
+
+    # Coefficients of prod_j (z_j + o_j t) for every leaf and pattern
+    poly = np.zeros((n_leaves, 2 ** u, u + 1))
+    poly[..., 0] = 1.0
+    for j in range(u):
+        shifted = np.zeros_like(poly)
+        shifted[..., 1:] = poly[..., :-1]
+        poly = poly * zero[..., j, None] + shifted * one[..., j, None]
+
+    # Shapley weights k! (u - 1 - k)! / u! of coalitions of size k among the other u - 1 features
+    weights = np.array([math.factorial(k) * math.factorial(u - 1 - k) / math.factorial(u) for k in range(u)])
+    # Divide every feature's factor back out and take the weighted sum of the quotient's
+    # coefficients (last axis = feature i): where the row agrees with the path on i the
+    # factor is (z_i + t), removed by synthetic division from the top coefficient down
+    quotient = np.broadcast_to(poly[..., u, None], one.shape)
+    agree_sum = weights[u - 1] * quotient
+    for k in range(u - 1, 0, -1):
+        quotient = poly[..., k, None] - zero * quotient
+        agree_sum = agree_sum + weights[k - 1] * quotient
+    # where it disagrees the factor is the constant z_i
+    disagree_sum = (poly[..., :u] @ weights)[..., None] / zero
+    contributions = (one - zero) * np.where(one == 1, agree_sum, disagree_sum)
+    return contributions * values[:, None, None]
+
+
+def _compile_tree(estimator, label, n_features):
+    if n_features > _MAX_MASK_FEATURES:
+        raise ValueError(f'TreeSHAP supports at most {_MAX_MASK_FEATURES} features, got {n_features}')
+    tree = estimator.tree_
+    value = tree.value[:, 0, :]
+    leaf_value = value[:, label] / np.maximum(value.sum(axis=1), np.finfo(np.float64).tiny)
+    paths = _leaf_paths(tree)
+
+    leaves = np.array([node for node, _ in paths])
+    slot_features = []
+    slot_zeros = []
+    for _, path in paths:
+        features = list(dict.fromkeys(feature for feature, _ in path))
+        if len(features) > _MAX_PATH_FEATURES:
+            raise ValueError(f'Paths with more than {_MAX_PATH_FEATURES} distinct features are not supported')
+        zeros = {feature: 1.0 for feature in features}
+        for feature, fraction in path:
+            zeros[feature] *= fraction
+        slot_features.append(features)
+        slot_zeros.append([zeros[feature] for feature in features])
+
+    widths = np.array([len(features) for features in slot_features])
+    max_width = max(int(widths.max()), 1)
+    offsets = np.concatenate(([0], np.cumsum(2 ** widths)[:-1]))
+    table = np.zeros((max_width, int((2 ** widths).sum())))
+    for width in np.unique(widths):
+        if width == 0:
+            continue
+        # Leaves are tabulated in chunks that keep the (leaves, patterns, u) arrays small
+        chunk = max(1, 2 ** 22 // (2 ** width * width))
+        same_width = np.flatnonzero(widths == width)
+        for start in range(0, len(same_width), chunk):
+            group = same_width[start:start + chunk]
+            z = np.array([slot_zeros[leaf] for leaf in group])
+            contributions = _pattern_contributions(z, leaf_value[leaves[group]])
+            rows = (offsets[group][:, None] + np.arange(2 ** width)).ravel()
+            table[:width, rows] = contributions.reshape(-1, width).T
+
+    # Maps (leaf, slot) to its feature column; unused slots point nowhere
+    slot_matrix = np.zeros((len(leaves), max_width, n_features))
+    slot_feature_index = np.zeros((len(leaves), max_width), dtype=np.int64)
+    for leaf, features in enumerate(slot_features):
+        slot_matrix[leaf, np.arange(len(features)), features] = 1.0
+        slot_feature_index[leaf, :len(features)] = features
+
+    compiled = {}
+    if n_features <= _MAX_INDEX_MAP_FEATURES:
+        # Table column of every (leaf, disagreement mask over all features), so a batch
+        # needs a single lookup per (leaf, row)
+        masks = np.broadcast_to(np.arange(2 ** n_features), (len(leaves), 2 ** n_features))
+        codes = _pattern_codes(slot_feature_index, widths, masks)
+        compiled['index_map'] = offsets[:, None] + codes
+
+    root_cover = tree.weighted_n_node_samples[0]
+    expected = float(np.sum(leaf_value[leaves] * tree.weighted_n_node_samples[leaves]) / root_cover)
+    compiled.update({
+        'tree': tree, 'leaves': leaves, 'widths': widths, 'offsets': offsets, 'table': table,
+        'slot_matrix': slot_matrix, 'slot_features': slot_feature_index,
+        'expected': expected,
+    })
+    return compiled
+
+
+def _disagreement_bits(tree, X):
+    """
+    Returns (n_nodes, n_rows) bit masks of the features on which each row left the path to each node.
+    """
+    left, right = tree.children_left, tree.children_right
+    bits = np.zeros((tree.node_count, len(X)), dtype=np.int64)
+    level = np.array([0])
+    while len(level):
+        level = level[left[level] != -1]
+        if not len(level):
+            break
+        features = tree.feature[level]
+        go_left = X[:, features].T <= tree.threshold[level][:, None]
+        feature_bits = (np.int64(1) << features.astype(np.int64))[:, None]
+        bits[left[level]] = bits[level] | np.where(go_left, 0, feature_bits)
+        bits[right[level]] = bits[level] | np.where(go_left, feature_bits, 0)
+        level = np.concatenate((left[level], right[level]))
+    return bits
+
+
+def _pattern_codes(slot_features, widths, disagreement):
+    """
+    Compresses disagreement masks over all features to pattern codes over each leaf's own slots.
+
+    disagreement has one row per leaf; bit s of the result is set when the
+    row agrees with the leaf's path on its slot-s feature.
+    """
+    codes = np.zeros(disagreement.shape, dtype=np.int64)
+    for slot in range(slot_features.shape[1]):
+        agrees = ((disagreement >> slot_features[:, slot, None]) & 1) ^ 1
+        codes |= np.where(slot < widths[:, None], agrees, 0) << slot
+    return codes
+
+
+def _tree_batch(compiled, X):
+    leaf_bits = _disagreement_bits(compiled['tree'], X)[compiled['leaves']]
+    if 'index_map' in compiled:
+        rows = np.take_along_axis(compiled['index_map'], leaf_bits, axis=1)
+    else:
+        rows = compiled['offsets'][:, None] + _pattern_codes(compiled['slot_features'], compiled['widths'], leaf_bits)
+    # One gather and one small matrix product per slot instead of a (leaves, rows, slots) intermediate
+    total = np.zeros((compiled['slot_matrix'].shape[2], len(X)))
+    for slot, table in enumerate(compiled['table']):
+        total += compiled['slot_matrix'][:, slot, :].T @ table[rows]
+    return total.T
+
+
+def _explain_trees(estimators, X, label, n_features, batch_size):
+    total = np.zeros((len(X), n_features))
+    expected = 0.0
+    for estimator in estimators:
+        compiled = _compile_tree(estimator, label, n_features)
+        expected += compiled['expected']
+        for start in range(0, len(X), batch_size):
+            total[start:start + batch_size] += _tree_batch(compiled, X[start:start + batch_size])
+    return total, expected
+
+
+@traced('explanation', rows='X')
+def tree_attributions(forest, X, label=1, n_jobs=None, batch_size=2048):
+    """
+    Computes exact TreeSHAP contributions of every feature for every row.
+
+    Parameters:
+    - forest: Fitted RandomForestClassifier / ExtraTreesClassifier (e.g. Best_rf_model).
+    - X: Rows to explain (DataFrame or array) with at most 62 features.
+    - label: Class index whose probability is explained.
+    - n_jobs: Number of worker processes over groups of trees.
+    - batch_size: Rows handled together per tree.
+
+    Returns:
+    - (contributions, expected_value): a DataFrame with one row per input row
+      and one column per feature, and the forest's mean prediction over its
+      training covers. contributions.sum(axis=1) + expected_value equals
+      forest.predict_proba(X)[:, label].
+    """
+    columns = list(X.columns) if hasattr(X, 'columns') else list(range(np.shape(X)[1]))
+    index = X.index if hasattr(X, 'index') else pd.RangeIndex(len(X))
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    estimators = forest.estimators_
+    n_groups = min(len(estimators), effective_n_jobs(n_jobs))
+    groups = [estimators[group::n_groups] for group in range(n_groups)]
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_explain_trees)(group, X, label, X.shape[1], batch_size) for group in groups
+    )
+    contributions = sum(total for total, _ in results) / len(estimators)
+    expected_value = sum(expected for _, expected in results) / len(estimators)
+    return pd.DataFrame(contributions, index=index, columns=columns), expected_value
+
+
+def global_importance(contributions):
+    """
+    Returns the mean absolute contribution of every feature, largest first.
+    """
+    return contributions.abs().mean(axis=0).sort_values(ascending=False)
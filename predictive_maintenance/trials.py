@@ -0,0 +1,77 @@
+"""
+Persistent, resumable store of hyperparameter search trials.
+
+Every (estimator, params, fold, data fingerprint, row budget) trial is written
+to a local SQLite database as soon as it finishes, so an interrupted search
+resumes where it stopped and adding a value to a grid only runs the new trials.
+"""
+import json
+import sqlite3
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    estimator TEXT NOT NULL,
+    params TEXT NOT NULL,
+    fold INTEGER NOT NULL,
+    fingerprint TEXT NOT NULL,
+    resources INTEGER NOT NULL,
+    score REAL NOT NULL,
+    fit_seconds REAL NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (estimator, params, fold, fingerprint, resources)
+)
+"""
+
+
+def params_key(params):
+    """
+    Returns the canonical JSON text used to identify a parameter combination.
+    """
+    return json.dumps(params, sort_keys=True, default=repr)
+
+
+class TrialStore:
+    """
+    SQLite-backed record of finished search trials.
+
+    Parameters:
+    - path: Database file; created on first use.
+    """
+
+    def __init__(self, path='trials.sqlite'):
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        # Write-ahead logging keeps committed trials safe if the process dies mid-search
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(_SCHEMA)
+        self._connection.commit()
+
+    def completed(self, estimator, fingerprint):
+        """
+        Returns {(params_key, fold, resources): (score, fit_seconds)} for one estimator and dataset.
+        """
+        rows = self._connection.execute(
+            'SELECT params, fold, resources, score, fit_seconds FROM trials WHERE estimator = ? AND fingerprint = ?',
+            (estimator, fingerprint))
+        return {(params, fold, resources): (score, fit_seconds) for params, fold, resources, score, fit_seconds in rows}
+
+    def record(self, estimator, fingerprint, trials):
+        """
+        Stores finished trials given as (params, fold, resources, score, fit_seconds) tuples.
+        """
+        now = time.time()
+        self._connection.executemany(
+            'INSERT OR REPLACE INTO trials VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [(estimator, params_key(params), fold, fingerprint, resources, float(score), float(fit_seconds), now)
+             for params, fold, resources, score, fit_seconds in trials])
+        self._connection.commit()
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,450 @@
+"""
+Hyperparameter search drivers used in place of the exhaustive GridSearchCV runs.
+
+The searches expose the GridSearchCV attributes the notebook relies on
+(best_params_, best_score_, best_estimator_, cv_results_), so the evaluation
+cells that follow them work unchanged. They can record every (estimator,
+params, fold, data) trial in a TrialStore and skip the trials it already holds.
+
+fit_search_shared runs any of these searches (or a plain GridSearchCV) with the
+training matrix, the targets and the fold indices placed once in read-only
+memory-mapped files, preferably in /dev/shm. joblib pickles memory-mapped
+arrays by reference, so every worker attaches to the same pages instead of
+receiving its own serialized copy.
+"""
+import contextlib
+import math
+import numbers
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from joblib import Parallel, delayed, parallel_config
+from sklearn.base import clone
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import ParameterGrid, check_cv
+
+from predictive_maintenance.stacking import data_fingerprint, estimator_fingerprint
+from predictive_maintenance.tracing import traced
+from predictive_maintenance.trials import params_key
+
+
+def _take(X, rows):
+    return X.iloc[rows] if hasattr(X, 'iloc') else X[rows]
+
+
+def _group_candidates(candidates, warm_start_param):
+    # Candidates that differ only in the warm-start parameter share one fit chain,
+    # ordered by increasing value of that parameter
+    groups = {}
+    for index in candidates:
+        params = candidates[index]
+        key = tuple(sorted((name, repr(value)) for name, value in params.items() if name != warm_start_param))
+        groups.setdefault(key, []).append(index)
+    if warm_start_param is None:
+        return [[index] for chain in groups.values() for index in chain]
+    return [sorted(chain, key=lambda index: candidates[index][warm_start_param]) for chain in groups.values()]
+
+
+def _fit_chain(estimator, chain, X, y, train_rows, test_rows, scorer, warm_start_param, fold):
+    """
+    Fits the candidates of one chain on one fold and returns (fold, [(index, score, fit_seconds)]).
+    """
+    X_train, y_train = _take(X, train_rows), _take(y, train_rows)
+    X_test, y_test = _take(X, test_rows), _take(y, test_rows)
+    results = []
+    model = None
+    for index, params in chain:
+        start = time.perf_counter()
+        if model is None:
+            model = clone(estimator).set_params(**params)
+        else:
+            # Keeps the already fitted trees and only adds the missing ones
+            model.set_params(warm_start=True, **{warm_start_param: params[warm_start_param]})
+        model.fit(X_train, y_train)
+        fit_seconds = time.perf_counter() - start
+        results.append((index, scorer(model, X_test, y_test), fit_seconds))
+    return fold, results
+
+
+class SuccessiveHalvingSearchCV:
+    """
+    Successive-halving search over a parameter grid with warm-started ensembles.
+
+    Every rung scores the surviving candidates with cross-validation on a
+    growing number of training rows and keeps the best 1 / factor of them;
+    the last rung uses all rows. Candidates that differ only in
+    warm_start_param (e.g. n_estimators 100 vs 200) are fitted as one chain:
+    the larger model keeps the trees of the smaller one and only fits the
+    missing ones, which yields the same forest as fitting it from scratch.
+
+    Parameters:
+    - estimator: Unfitted estimator.
+    - param_grid: Dictionary (or list of dictionaries) of parameter values.
+    - cv: Number of folds or a CV splitter / list of (train, test) index arrays.
+    - scoring: Scorer name or callable.
+    - factor: Fraction of candidates kept per rung is 1 / factor.
+    - min_resources: Smallest row budget per training fold (20 when omitted).
+      The budgets are min_resources * factor ** k below n_rows / factor plus
+      all rows, so they do not depend on the grid; a grid with fewer
+      candidates than rungs starts at one of the larger budgets.
+    - warm_start_param: Parameter grown by warm start, or None to disable.
+    - n_jobs: Number of parallel jobs over (chain, fold) fits.
+    - random_state: Seed of the row order used for the partial budgets. The
+      store is only used with an integer seed, since the seed selects the rows.
+    - refit: Whether to refit the best candidate on all rows.
+    - verbose: Print a summary of every rung when > 0.
+    - store: Optional TrialStore; trials already in it are not refitted and
+      new trials are recorded as they finish.
+    """
+
+    def __init__(self, estimator, param_grid, cv=3, scoring='accuracy', factor=3, min_resources=None,
+                 warm_start_param='n_estimators', n_jobs=None, random_state=42, refit=True, verbose=0,
+                 store=None):
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.cv = cv
+        self.scoring = scoring
+        self.factor = factor
+        self.min_resources = min_resources
+        self.warm_start_param = warm_start_param
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        self.refit = refit
+        self.verbose = verbose
+        self.store = store
+
+    def _rung_resources(self, n_candidates, n_rows):
+        # A fixed ladder, so a trial on one budget is the same trial whatever the grid size
+        ladder = []
+        resource = 20 if self.min_resources is None else self.min_resources
+        while resource <= n_rows / self.factor:
+            ladder.append(int(resource))
+            resource *= self.factor
+        ladder.append(n_rows)
+        n_rungs = max(1, math.ceil(math.log(n_candidates) / math.log(self.factor))) if n_candidates > 1 else 1
+        return ladder[-n_rungs:]
+
+    def _trial_keys(self, X, y, folds):
+        # The seed picks the rows of every budget below a whole fold, so it is part of the data identity
+        fingerprint = data_fingerprint(np.asarray(X), np.asarray(y), *(test_rows for _, test_rows in folds),
+                                       np.asarray([self.random_state], dtype=np.int64))
+        return estimator_fingerprint(self.estimator), fingerprint
+
+    @traced('tuning', rows='X')
+    def fit(self, X, y):
+        candidates = dict(enumerate(ParameterGrid(self.param_grid)))
+        scorer = get_scorer(self.scoring) if isinstance(self.scoring, str) else self.scoring
+        folds = list(check_cv(self.cv, y, classifier=True).split(X, y))
+        rng = np.random.default_rng(self.random_state)
+        shuffled = [rng.permutation(train_rows) for train_rows, _ in folds]
+
+        warm_start_param = self.warm_start_param
+        if warm_start_param is not None and ('warm_start' not in self.estimator.get_params()
+                                             or any(warm_start_param not in params for params in candidates.values())):
+            warm_start_param = None
+
+        store = self.store if isinstance(self.random_state, numbers.Integral) else None
+        stored = {}
+        if store is not None:
+            estimator_key, fingerprint = self._trial_keys(X, y, folds)
+            stored = store.completed(estimator_key, fingerprint)
+
+        n_train_rows = min(len(train_rows) for train_rows, _ in folds)
+        resources = self._rung_resources(len(candidates), n_train_rows)
+        results = {'params': [], 'iter': [], 'n_resources': [], 'mean_test_score': [], 'std_test_score': [],
+                   'mean_fit_time': [], 'split_scores': []}
+        surviving = list(candidates)
+        for rung, n_resources in enumerate(resources):
+            scores = {index: [None] * len(folds) for index in surviving}
+            fit_times = {index: [None] * len(folds) for index in surviving}
+            chains = _group_candidates({index: candidates[index] for index in surviving}, warm_start_param)
+            tasks = []
+            for chain in chains:
+                for fold in range(len(folds)):
+                    found = [stored.get((params_key(candidates[index]), fold, n_resources)) for index in chain]
+                    if all(found):
+                        for index, (score, fit_seconds) in zip(chain, found):
+                            scores[index][fold], fit_times[index][fold] = score, fit_seconds
+                    else:
+                        tasks.append((chain, fold))
+
+            # The full budget keeps the original row order, as an exhaustive search would
+            train_rows = [rows[:n_resources] if n_resources < len(rows) else folds[fold][0]
+                          for fold, rows in enumerate(shuffled)]
+            outputs = Parallel(n_jobs=self.n_jobs, return_as='generator_unordered')(
+                delayed(_fit_chain)(self.estimator, [(index, candidates[index]) for index in chain], X, y,
+                                    train_rows[fold], folds[fold][1], scorer, warm_start_param, fold)
+                for chain, fold in tasks
+            )
+            for fold, output in outputs:
+                for index, score, fit_seconds in output:
+                    scores[index][fold], fit_times[index][fold] = score, fit_seconds
+                if store is not None:
+                    # Recorded as soon as each chain finishes, so a crash only loses running fits
+                    store.record(estimator_key, fingerprint,
+                                      [(candidates[index], fold, n_resources, score, fit_seconds)
+                                       for index, score, fit_seconds in output])
+
+            mean_scores = {index: float(np.mean(scores[index])) for index in surviving}
+            for index in surviving:
+                results['params'].append(candidates[index])
+                results['iter'].append(rung)
+                results['n_resources'].append(n_resources)
+                results['mean_test_score'].append(mean_scores[index])
+                results['std_test_score'].append(float(np.std(scores[index])))
+                results['mean_fit_time'].append(float(np.mean(fit_times[index])))
+                results['split_scores'].append(scores[index])
+
+            ranked = sorted(surviving, key=lambda index: mean_scores[index], reverse=True)
+            if self.verbose:
+                print(f'Rung {rung}: {len(surviving)} candidates on {n_resources} rows per fold, '
+                      f'best score {mean_scores[ranked[0]]:.4f}')
+            if rung < len(resources) - 1:
+                surviving = ranked[:max(1, math.ceil(len(surviving) / self.factor))]
+
+        self.cv_results_ = results
+        self.n_resources_ = resources
+        self.best_index_ = len(results['params']) - len(surviving) + surviving.index(ranked[0])
+        self.best_params_ = candidates[ranked[0]]
+        self.best_score_ = mean_scores[ranked[0]]
+        if self.refit:
+            self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_).fit(X, y)
+        return self
+
+    @traced('predict', rows='X')
+    def predict(self, X):
+        return self.best_estimator_.predict(X)
+
+    @traced('predict', rows='X')
+    def predict_proba(self, X):
+        return self.best_estimator_.predict_proba(X)
+
+
+class ResumableGridSearchCV(SuccessiveHalvingSearchCV):
+    """
+    Exhaustive grid search (every candidate on every full fold) backed by a TrialStore.
+
+    Takes the same parameters as SuccessiveHalvingSearchCV except factor and
+    min_resources. With a store, an interrupted search resumes from the
+    finished trials and a grid extended with new values only fits the new
+    candidates.
+    """
+
+    def __init__(self, estimator, param_grid, cv=3, scoring='accuracy', warm_start_param='n_estimators',
+                 n_jobs=None, random_state=42, refit=True, verbose=0, store=None):
+        super().__init__(estimator, param_grid, cv=cv, scoring=scoring, warm_start_param=warm_start_param,
+                         n_jobs=n_jobs, random_state=random_state, refit=refit, verbose=verbose, store=store)
+
+    def _rung_resources(self, n_candidates, n_rows):
+        return [n_rows]
+
+
+def _knn_fold_scores(X, y, train_rows, test_rows, metric, combos, algorithm, fold):
+    """
+    Scores every (n_neighbors, weights) combination of one (fold, metric) from a single neighbour search.
+    """
+    from sklearn.neighbors import NearestNeighbors
+
+    start = time.perf_counter()
+    X_train, y_train = _take(X, train_rows), np.asarray(_take(y, train_rows))
+    X_test, y_test = _take(X, test_rows), np.asarray(_take(y, test_rows))
+    classes, y_encoded = np.unique(y_train, return_inverse=True)
+    max_k = max(k for k, _ in combos)
+    index = NearestNeighbors(n_neighbors=max_k, metric=metric, algorithm=algorithm).fit(X_train)
+    distances, neighbours = index.kneighbors(X_test)
+    search_seconds = time.perf_counter() - start
+
+    labels = y_encoded[neighbours]
+    results = []
+    for k, weights in combos:
+        start = time.perf_counter()
+        if weights == 'uniform':
+            weight = np.ones((len(labels), k))
+        else:
+            # Inverse distance; rows with exact matches only count those matches (as in sklearn)
+            with np.errstate(divide='ignore'):
+                weight = 1.0 / distances[:, :k]
+            exact = np.isinf(weight)
+            exact_rows = exact.any(axis=1)
+            weight[exact_rows] = exact[exact_rows]
+        votes = np.zeros((len(labels), len(classes)))
+        for c in range(len(classes)):
+            votes[:, c] = (weight * (labels[:, :k] == c)).sum(axis=1)
+        predictions = classes[np.argmax(votes, axis=1)]
+        score = float(np.mean(predictions == y_test))
+        # The shared neighbour search is attributed evenly to the combinations it serves
+        results.append(((k, weights), score, time.perf_counter() - start + search_seconds / len(combos)))
+    return fold, metric, results
+
+
+class KNeighborsGraphSearchCV:
+    """
+    Accuracy grid search for KNeighborsClassifier that reuses neighbour graphs.
+
+    For every (fold, metric) the max(n_neighbors) nearest neighbours of the
+    validation rows are computed once (tree index or blocked brute force via
+    NearestNeighbors). All smaller n_neighbors values and both weighting
+    schemes are then scored from that cached graph, so the whole grid costs
+    one neighbour search per (fold, metric).
+
+    Parameters:
+    - param_grid: Dictionary with 'n_neighbors', 'weights' and 'metric' lists.
+    - cv: Number of folds or a CV splitter / list of (train, test) index arrays.
+    - n_jobs: Number of parallel jobs over (fold, metric) searches.
+    - algorithm: NearestNeighbors algorithm.
+    - refit: Whether to refit the best KNeighborsClassifier on all rows.
+    - verbose: Print the best combination when > 0.
+    - store: Optional TrialStore; stored (fold, metric) groups are not recomputed.
+    """
+
+    def __init__(self, param_grid, cv=3, n_jobs=None, algorithm='auto', refit=True, verbose=0, store=None):
+        self.param_grid = param_grid
+        self.cv = cv
+        self.n_jobs = n_jobs
+        self.algorithm = algorithm
+        self.refit = refit
+        self.verbose = verbose
+        self.store = store
+
+    @traced('tuning', rows='X')
+    def fit(self, X, y):
+        from sklearn.neighbors import KNeighborsClassifier
+
+        unknown = set(self.param_grid) - {'n_neighbors', 'weights', 'metric'}
+        if unknown:
+            raise ValueError(f'Unsupported KNN grid parameters: {sorted(unknown)}')
+        candidates = list(ParameterGrid({'n_neighbors': [5], 'weights': ['uniform'], 'metric': ['minkowski'],
+                                         **self.param_grid}))
+        folds = list(check_cv(self.cv, y, classifier=True).split(X, y))
+        scores = {params_key(params): [None] * len(folds) for params in candidates}
+        fit_times = {params_key(params): [None] * len(folds) for params in candidates}
+
+        stored = {}
+        if self.store is not None:
+            estimator_key = estimator_fingerprint(KNeighborsClassifier(algorithm=self.algorithm))
+            fingerprint = data_fingerprint(np.asarray(X), np.asarray(y), *(test_rows for _, test_rows in folds))
+            stored = self.store.completed(estimator_key, fingerprint)
+
+        tasks = []
+        for metric in dict.fromkeys(params['metric'] for params in candidates):
+            group = [params for params in candidates if params['metric'] == metric]
+            combos = [(params['n_neighbors'], params['weights']) for params in group]
+            for fold, (train_rows, _) in enumerate(folds):
+                found = [stored.get((params_key(params), fold, len(train_rows))) for params in group]
+                if all(found):
+                    for params, (score, fit_seconds) in zip(group, found):
+                        scores[params_key(params)][fold], fit_times[params_key(params)][fold] = score, fit_seconds
+                else:
+                    tasks.append((metric, combos, fold))
+
+        outputs = Parallel(n_jobs=self.n_jobs, return_as='generator_unordered')(
+            delayed(_knn_fold_scores)(X, y, folds[fold][0], folds[fold][1], metric, combos, self.algorithm, fold)
+            for metric, combos, fold in tasks
+        )
+        for fold, metric, output in outputs:
+            trials = []
+            for (k, weights), score, fit_seconds in output:
+                params = {'metric': metric, 'n_neighbors': k, 'weights': weights}
+                scores[params_key(params)][fold], fit_times[params_key(params)][fold] = score, fit_seconds
+                trials.append((params, fold, len(folds[fold][0]), score, fit_seconds))
+            if self.store is not None:
+                self.store.record(estimator_key, fingerprint, trials)
+
+        mean_scores = [float(np.mean(scores[params_key(params)])) for params in candidates]
+        self.cv_results_ = {
+            'params': candidates,
+            'mean_test_score': mean_scores,
+            'std_test_score': [float(np.std(scores[params_key(params)])) for params in candidates],
+            'mean_fit_time': [float(np.mean(fit_times[params_key(params)])) for params in candidates],
+            'split_scores': [scores[params_key(params)] for params in candidates],
+        }
+        self.best_index_ = int(np.argmax(mean_scores))
+        self.best_params_ = candidates[self.best_index_]
+        self.best_score_ = mean_scores[self.best_index_]
+        if self.verbose:
+            print(f'Best of {len(candidates)} KNN candidates: {self.best_params_} ({self.best_score_:.4f})')
+        if self.refit:
+            self.best_estimator_ = KNeighborsClassifier(algorithm=self.algorithm, **self.best_params_).fit(X, y)
+        return self
+
+    @traced('predict', rows='X')
+    def predict(self, X):
+        return self.best_estimator_.predict(X)
+
+    @traced('predict', rows='X')
+    def predict_proba(self, X):
+        return self.best_estimator_.predict_proba(X)
+
+
+def _default_temp_folder():
+    # RAM-backed on Linux, so "writing" the shared copy never touches the disk
+    return '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+def _as_memmap(array, folder, name):
+    if isinstance(array, np.memmap):
+        return array
+    path = os.path.join(folder, f'{name}.npy')
+    np.save(path, np.ascontiguousarray(array))
+    return np.load(path, mmap_mode='r')
+
+
+@contextlib.contextmanager
+def shared_training_data(X, y, cv=3, temp_folder=None):
+    """
+    Places training data and fold indices in read-only memory-mapped files.
+
+    Arrays that are already memory-mapped (e.g. a cached binned matrix) are
+    used as they are. The files are removed when the context exits.
+
+    Parameters:
+    - X, y: Training data (arrays or pandas objects).
+    - cv: Number of folds or a CV splitter / list of (train, test) index arrays.
+    - temp_folder: Folder for the files (defaults to /dev/shm when available).
+
+    Yields:
+    - (X_shared, y_shared, folds), with folds a list of memory-mapped
+      (train, test) index arrays usable as the cv argument of a search.
+    """
+    folder = tempfile.mkdtemp(prefix='shared_training_data_', dir=temp_folder or _default_temp_folder())
+    try:
+        X_shared = _as_memmap(np.asanyarray(X), folder, 'X')
+        y_shared = _as_memmap(np.asanyarray(y), folder, 'y')
+        folds = [
+            (_as_memmap(train_rows, folder, f'train_{i}'), _as_memmap(test_rows, folder, f'test_{i}'))
+            for i, (train_rows, test_rows) in enumerate(check_cv(cv, y_shared, classifier=True).split(X_shared, y_shared))
+        ]
+        yield X_shared, y_shared, folds
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def fit_search_shared(search, X, y, temp_folder=None):
+    """
+    Fits a search with its training data shared by all workers.
+
+    The search's cv setting is replaced by precomputed fold indices for the
+    duration of the fit and restored afterwards. Any other large array that
+    joblib hands to the workers is memory-mapped into the same folder.
+
+    Parameters:
+    - search: GridSearchCV, SuccessiveHalvingSearchCV or a compatible search.
+    - X, y: Training data.
+    - temp_folder: Folder for the shared files (defaults to /dev/shm when available).
+
+    Returns:
+    - The fitted search.
+    """
+    cv = search.cv
+    temp_folder = temp_folder or _default_temp_folder()
+    with shared_training_data(X, y, cv=cv, temp_folder=temp_folder) as (X_shared, y_shared, folds):
+        search.cv = folds
+        try:
+            with parallel_config(temp_folder=temp_folder, max_nbytes='1M', mmap_mode='r'):
+                search.fit(X_shared, y_shared)
+        finally:
+            search.cv = cv
+    return search
@@ -0,0 +1,256 @@
+"""
+End-to-end steps of modelsOfML.py as plain functions.
+
+The notebook runs everything at the top level, with plots and every
+framework imported up front. These functions run the same steps without
+plotting, so they can be used as a library and from the command line
+(predictive_maintenance.cli):
+
+- train_pipeline: SMOTE, scaler/PCA, the four base models with out-of-fold
+  stacking and their network heads, saved as one bundle.
+- tune_models: the successive-halving searches of the base models and the
+  parallel Hyperband search of the ANN.
+- explain_rows: LIME explanations of a bundled hybrid pipeline.
+
+TensorFlow, keras_tuner and lime are imported only by the steps that use them.
+"""
+import json
+from functools import partial
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import train_test_split
+from sklearn.neighbors import KNeighborsClassifier
+
+from predictive_maintenance.boosting import BinnedGradientBoostingClassifier
+from predictive_maintenance.bundle import load_bundle, save_bundle
+from predictive_maintenance.data import TARGET_COLUMN, iter_feature_rows, load_ai4i2020
+from predictive_maintenance.evaluation import evaluate_models
+from predictive_maintenance.kernel_svm import ApproxKernelSVC
+from predictive_maintenance.preprocessing import StreamingScalerPCA, iter_array_chunks
+from predictive_maintenance.resampling import smote_resample
+from predictive_maintenance.stacking import build_stacked_inputs, fit_base_models
+from predictive_maintenance.trials import TrialStore
+from predictive_maintenance.tuning import KNeighborsGraphSearchCV, SuccessiveHalvingSearchCV, fit_search_shared
+
+BASE_MODELS = ('rf', 'gbc', 'svm', 'knn')
+TUNABLE_MODELS = BASE_MODELS + ('ann',)
+
+# Grids of the notebook's hyperparameter tuning section
+PARAM_GRIDS = {
+    'rf': {
+        'min_samples_split': [2, 5],
+        'min_samples_leaf': [1, 2],
+        'bootstrap': [True, False],
+        'n_estimators': [100, 200],
+        'max_depth': [None, 10, 20],
+    },
+    'gbc': {
+        'n_estimators': [100, 200],
+        'min_samples_split': [2, 5],
+        'min_samples_leaf': [1, 2],
+        'subsample': [0.8, 0.9],
+        'learning_rate': [0.01, 0.1],
+        'max_depth': [3, 4],
+    },
+    'svm': {
+        'C': [0.1, 1],
+        'gamma': ['scale', 'auto'],
+        'kernel': ['rbf', 'linear', 'sigmoid'],
+    },
+    'knn': {
+        'n_neighbors': [3, 5, 7],
+        'weights': ['uniform', 'distance'],
+        'metric': ['euclidean', 'manhattan'],
+    },
+}
+
+
+def base_estimators(seed=42):
+    """
+    Returns the unfitted base models of the four hybrids, keyed like BASE_MODELS.
+    """
+    return {
+        'rf': RandomForestClassifier(random_state=seed),
+        'gbc': BinnedGradientBoostingClassifier(random_state=seed),
+        'svm': ApproxKernelSVC(probability=True, random_state=seed),
+        'knn': KNeighborsClassifier(n_neighbors=5),
+    }
+
+
+def prepare_training_data(data_path, cache_dir=None, seed=42, n_jobs=-1, test_size=0.2):
+    """
+    Loads the ai4i2020 CSV, balances it with SMOTE and projects it with the scaler/PCA.
+
+    Parameters:
+    - data_path: Path to the ai4i2020 CSV file.
+    - cache_dir: Column cache directory of load_ai4i2020.
+    - seed: Seed of SMOTE and of the train/test split.
+    - n_jobs: Worker processes of the SMOTE neighbour queries.
+    - test_size: Fraction of the resampled rows held out for testing.
+
+    Returns:
+    - (preprocessor, X_train, X_test, y_train, y_test), the matrices in PCA space.
+    """
+    data = load_ai4i2020(data_path, cache_dir=cache_dir)
+    X_res, y_res = smote_resample(data.drop(columns=[TARGET_COLUMN]), data[TARGET_COLUMN], random_state=seed,
+                                  n_jobs=n_jobs)
+    preprocessor = StreamingScalerPCA(n_components=2).fit(iter_array_chunks(X_res))
+    X_train, X_test, y_train, y_test = train_test_split(preprocessor.transform(X_res), y_res, test_size=test_size,
+                                                        random_state=seed)
+    return preprocessor, X_train, X_test, y_train, y_test
+
+
+def train_pipeline(data_path, bundle_path, cache_dir=None, seed=42, n_jobs=-1, test_size=0.2, n_splits=5,
+                   epochs=50, batch_size=256, stacking_cache=None, verbose=0):
+    """
+    Trains the four hybrid pipelines and saves them as one bundle.
+
+    Parameters:
+    - data_path: Path to the ai4i2020 CSV file.
+    - bundle_path: Bundle file to write (see save_bundle).
+    - cache_dir: Column cache directory of load_ai4i2020.
+    - seed: Seed of the resampling, the split and the models.
+    - n_jobs: Worker processes of SMOTE and of the base model fits.
+    - test_size: Fraction of rows held out for the evaluation stored with the bundle.
+    - n_splits: Folds of the out-of-fold base model predictions.
+    - epochs, batch_size: Training of the network heads.
+    - stacking_cache: Optional cache directory of fit_base_models.
+    - verbose: Keras fit verbosity.
+
+    Returns:
+    - Evaluation DataFrame of the hybrids on the test rows (see evaluate_models).
+    """
+    from predictive_maintenance.heads import fit_heads_jointly
+
+    preprocessor, X_train, X_test, y_train, y_test = prepare_training_data(data_path, cache_dir=cache_dir, seed=seed,
+                                                                           n_jobs=n_jobs, test_size=test_size)
+    base_results = fit_base_models(base_estimators(seed), X_train, y_train, X_test, n_jobs=n_jobs,
+                                   n_splits=n_splits, fold_seed=seed, cache_dir=stacking_cache)
+    X_train_stack = build_stacked_inputs(X_train, {name: result['train_pred'] for name, result in base_results.items()})
+    X_test_stack = build_stacked_inputs(X_test, {name: result['test_pred'] for name, result in base_results.items()})
+    heads, _ = fit_heads_jointly(X_train_stack, y_train, epochs=epochs, batch_size=batch_size, seed=seed,
+                                 verbose=verbose)
+
+    scores = {f'hybrid_{name}': head.predict(X_test_stack[name], verbose=0).reshape(-1)
+              for name, head in heads.items()}
+    evaluation, _ = evaluate_models(y_test, scores)
+
+    models = {name: result['estimator'] for name, result in base_results.items()}
+    models.update({f'head_{name}': head for name, head in heads.items()})
+    save_bundle(bundle_path, preprocessor, models,
+                pipelines={name: {'base': name, 'head': f'head_{name}'} for name in heads},
+                metadata={'data': str(data_path), 'seed': seed, 'train_rows': len(X_train),
+                          'test_rows': len(X_test), 'evaluation': json.loads(evaluation.to_json(orient='index'))})
+    return evaluation
+
+
+def _search(name, seed, n_jobs, store, verbose):
+    if name == 'knn':
+        return KNeighborsGraphSearchCV(param_grid=PARAM_GRIDS['knn'], cv=3, n_jobs=n_jobs, verbose=verbose,
+                                       store=store)
+    estimator = {
+        'rf': RandomForestClassifier(random_state=seed),
+        'gbc': BinnedGradientBoostingClassifier(random_state=seed),
+        'svm': ApproxKernelSVC(random_state=seed),
+    }[name]
+    return SuccessiveHalvingSearchCV(estimator=estimator, param_grid=PARAM_GRIDS[name], cv=3, factor=3,
+                                     n_jobs=n_jobs, verbose=verbose, scoring='accuracy', store=store)
+
+
+def _tune_ann(X_train, y_train, seed, directory, max_epochs):
+    from tensorflow.keras.callbacks import EarlyStopping
+
+    from predictive_maintenance.heads import build_ann_model
+    from predictive_maintenance.hyperband import parallel_hyperband_search
+
+    tuner = parallel_hyperband_search(partial(build_ann_model, input_dim=X_train.shape[1]), X_train, y_train,
+                                      objective='val_accuracy', max_epochs=max_epochs, directory=directory,
+                                      project_name='ann_hyperparameter_tuning', seed=seed, epochs=50,
+                                      validation_split=0.2,
+                                      callbacks=[EarlyStopping(monitor='val_loss', patience=5,
+                                                               restore_best_weights=True)])
+    best_trial = tuner.oracle.get_best_trials(1)[0]
+    return {'best_params': best_trial.hyperparameters.values, 'best_score': best_trial.score}
+
+
+def tune_models(data_path, models=TUNABLE_MODELS, cache_dir=None, seed=42, n_jobs=-1,
+                trials_path='tuning_trials.sqlite', ann_directory='project_dir', ann_max_epochs=20, verbose=0):
+    """
+    Runs the notebook's hyperparameter searches.
+
+    The base model searches record every finished trial in a TrialStore, so an
+    interrupted run resumes where it stopped.
+
+    Parameters:
+    - data_path: Path to the ai4i2020 CSV file.
+    - models: Models to tune (subset of TUNABLE_MODELS).
+    - cache_dir: Column cache directory of load_ai4i2020.
+    - seed: Seed of the data preparation and the searches.
+    - n_jobs: Parallel jobs of the searches.
+    - trials_path: SQLite file of the TrialStore.
+    - ann_directory: keras_tuner project directory of the ANN search.
+    - ann_max_epochs: Hyperband max_epochs of the ANN search.
+    - verbose: Search verbosity.
+
+    Returns:
+    - Dictionary {model: {'best_params': ..., 'best_score': ...}}.
+    """
+    unknown = set(models) - set(TUNABLE_MODELS)
+    if unknown:
+        raise ValueError(f'Unknown models: {sorted(unknown)}')
+    _, X_train, _, y_train, _ = prepare_training_data(data_path, cache_dir=cache_dir, seed=seed, n_jobs=n_jobs)
+
+    results = {}
+    with TrialStore(trials_path) as store:
+        for name in models:
+            if name == 'ann':
+                results[name] = _tune_ann(X_train, y_train, seed, ann_directory, ann_max_epochs)
+                continue
+            search = _search(name, seed, n_jobs, store, verbose)
+            fit_search_shared(search, X_train, y_train)
+            results[name] = {'best_params': search.best_params_, 'best_score': float(search.best_score_)}
+    return results
+
+
+class _FailureProbabilities:
+    # Picklable predict_fn for LIME: two-column class probabilities of a pipeline
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+
+    def __call__(self, X):
+        failure = self.pipeline.predict_proba(X)
+        return np.column_stack([1.0 - failure, failure])
+
+
+def explain_rows(bundle_path, data_path, pipeline='rf', rows=100, background_rows=10_000, num_samples=5000,
+                 n_jobs=None, seed=42):
+    """
+    Explains the first rows of a CSV with LIME through a bundled hybrid pipeline.
+
+    The whole pipeline (scaler/PCA, base model, head) is explained in terms of
+    the raw input features.
+
+    Parameters:
+    - bundle_path: Bundle written by save_bundle or train_pipeline.
+    - data_path: CSV holding the bundle's feature columns.
+    - pipeline: Name of the bundled pipeline.
+    - rows: Number of leading rows to explain.
+    - background_rows: Leading rows the explainer takes its feature statistics from.
+    - num_samples, n_jobs, seed: Arguments of explain_instances.
+
+    Returns:
+    - Feature x row coefficient DataFrame (see explain_instances).
+    """
+    import lime.lime_tabular
+
+    from predictive_maintenance.explain import explain_instances
+
+    bundle = load_bundle(bundle_path)
+    X = next(iter_feature_rows(data_path, bundle.feature_columns, chunksize=max(rows, background_rows)))
+    explainer = lime.lime_tabular.LimeTabularExplainer(training_data=X[:background_rows],
+                                                       feature_names=bundle.feature_columns,
+                                                       class_names=['Not Failed', 'Failed'], mode='classification',
+                                                       random_state=seed)
+    return explain_instances(explainer, _FailureProbabilities(bundle.pipeline(pipeline)), X[:rows],
+                             num_samples=num_samples, n_jobs=n_jobs, random_state=seed)